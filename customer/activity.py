@@ -0,0 +1,57 @@
+"""
+Account activity feed.
+
+Orders (with their executed price) and cash transactions merged into one
+date-ordered list. recent_activity() fetches it with a single
+UNION ALL ... ORDER BY ... LIMIT, so the cost doesn't grow with the number
+of orders or transactions on the account.
+"""
+from decimal import Decimal
+from django.db import models
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from .models import Order, Trade, Transaction
+
+DEFAULT_LIMIT = 15
+CASH_TYPES = ['DEPOSIT', 'WITHDRAW']
+
+
+def _orders(account):
+    # Price of the order's first fill; 0.00 for orders that never filled
+    first_fill = Trade.objects.filter(order=OuterRef('pk')).order_by('TradeID').values('executed_price')[:1]
+    return Order.objects.filter(account=account).values(
+        activity_date=F('created_at'),
+        activity_type=F('action'),
+        ticker=F('stock__ticker'),
+        shares=F('quantity'),
+        price=Coalesce(
+            Subquery(first_fill),
+            Value(Decimal('0.00')),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2)
+        ),
+    )
+
+
+def _cash(account):
+    return Transaction.objects.filter(account=account, transaction_type__in=CASH_TYPES).values(
+        activity_date=F('created_at'),
+        activity_type=F('transaction_type'),
+        ticker=Value('-', output_field=models.CharField()),
+        shares=Value(None, output_field=models.BigIntegerField()),
+        price=F('amount'),
+    )
+
+
+def recent_activity(account, limit=DEFAULT_LIMIT):
+    """The account's latest `limit` orders and deposits/withdrawals, newest first"""
+    rows = _orders(account).union(_cash(account), all=True).order_by('-activity_date')[:limit]
+    return [
+        {
+            'date': row['activity_date'],
+            'type': row['activity_type'],
+            'stock': row['ticker'],
+            'quantity': '-' if row['shares'] is None else row['shares'],
+            'price': row['price'],
+        }
+        for row in rows
+    ]
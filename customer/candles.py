@@ -0,0 +1,238 @@
+"""
+OHLC candle rollups.
+
+Tick writers call fold() with each batch they write. Every tick lands in
+its 1m, 5m, 1h and 1d bucket. A bucket that already has a candle gets its
+high, low, close and count merged; otherwise a new candle is inserted.
+Writers don't fold in a common order: generate_prices folds in its own
+transaction while TickWriter folds behind a queue. So each candle keeps
+the times of its open and close ticks. A batch replaces the close only
+with a later tick, and the open only with an earlier one. Only the
+stocks being folded have their candles locked.
+
+rebuild() recomputes candles from PriceTick. It leaves alone any day that
+prune_ticks may already have thinned out.
+
+Buckets are aligned to the Unix epoch (UTC), so 1d candles run from
+midnight UTC.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+import numpy as np
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Min
+from .models import Candle, PriceTick
+from .valuations import IN_LIST_LIMIT
+
+RESOLUTIONS = [seconds for seconds, _ in Candle.RESOLUTIONS]
+REBUILD_CHUNK_ROWS = 50_000
+
+
+def _column(name):
+    return connection.ops.quote_name(Candle._meta.get_field(name).column)
+
+
+def _columns(*names):
+    return ', '.join(_column(name) for name in names)
+
+
+def _epoch(timestamp):
+    return int(timestamp.timestamp())
+
+
+def fold(stock_ids, cents, timestamps):
+    """
+    Fold ticks into every resolution. Takes parallel arrays of StockID,
+    price in cents and epoch seconds, in the order the ticks were taken.
+    """
+    stock_ids = np.asarray(stock_ids, dtype=np.int64)
+    if not len(stock_ids):
+        return
+    cents = np.asarray(cents, dtype=np.int64)
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+
+    for resolution in RESOLUTIONS:
+        try:
+            with transaction.atomic():
+                _fold_resolution(resolution, stock_ids, cents, timestamps)
+        except IntegrityError:
+            # Another writer opened one of our candles first; merge into it instead
+            with transaction.atomic():
+                _fold_resolution(resolution, stock_ids, cents, timestamps)
+
+
+def _fold_resolution(resolution, stock_ids, cents, timestamps):
+    buckets = timestamps // resolution * resolution
+    # Group by (stock, bucket), keeping tick order inside each group
+    order = np.lexsort((np.arange(len(stock_ids)), timestamps, buckets, stock_ids))
+    stock_ids, buckets, cents, timestamps = stock_ids[order], buckets[order], cents[order], timestamps[order]
+    starts = np.flatnonzero(
+        np.concatenate(([True], (stock_ids[1:] != stock_ids[:-1]) | (buckets[1:] != buckets[:-1])))
+    )
+    ends = np.append(starts[1:], len(stock_ids))
+
+    group_stock = stock_ids[starts].tolist()
+    group_bucket = buckets[starts].tolist()
+    opens = cents[starts].tolist()
+    closes = cents[ends - 1].tolist()
+    open_epochs = timestamps[starts].tolist()
+    close_epochs = timestamps[ends - 1].tolist()
+    highs = np.maximum.reduceat(cents, starts).tolist()
+    lows = np.minimum.reduceat(cents, starts).tolist()
+    counts = (ends - starts).tolist()
+
+    bucket_times = {
+        bucket: datetime.fromtimestamp(bucket, tz=dt_timezone.utc) for bucket in set(group_bucket)
+    }
+    # A range rather than IN: a long backfill chunk can span thousands of buckets
+    candles = Candle.objects.select_for_update().filter(
+        resolution=resolution,
+        start__gte=bucket_times[min(bucket_times)],
+        start__lte=bucket_times[max(bucket_times)]
+    )
+    # Lock only these stocks' candles, so writers of other stocks don't wait
+    folded_stocks = sorted(set(group_stock))
+    if len(folded_stocks) <= IN_LIST_LIMIT:
+        candles = candles.filter(stock_id__in=folded_stocks)
+    else:
+        candles = candles.filter(stock_id__gte=folded_stocks[0], stock_id__lte=folded_stocks[-1])
+    existing = {
+        (stock_id, _epoch(start)): (candle_id, int(high * 100), int(low * 100), count)
+        for candle_id, stock_id, start, high, low, count in candles.order_by('stock_id', 'start').values_list(
+            'CandleID', 'stock_id', 'start', 'high', 'low', 'tick_count'
+        )
+    }
+
+    adapt = connection.ops.adapt_datetimefield_value
+    starts_db = {bucket: adapt(start) for bucket, start in bucket_times.items()}
+    created, updated = [], []
+    for stock_id, bucket, open_, high, low, close, count, open_epoch, close_epoch in zip(
+        group_stock, group_bucket, opens, highs, lows, closes, counts, open_epochs, close_epochs
+    ):
+        candle = existing.get((stock_id, bucket))
+        if candle is None:
+            created.append((
+                stock_id, resolution, starts_db[bucket], open_ / 100, high / 100, low / 100, close / 100, count,
+                open_epoch, close_epoch
+            ))
+        else:
+            candle_id, old_high, old_low, old_count = candle
+            updated.append((
+                max(old_high, high) / 100, min(old_low, low) / 100, old_count + count,
+                open_epoch, open_ / 100, open_epoch, open_epoch,
+                close_epoch, close / 100, close_epoch, close_epoch,
+                candle_id
+            ))
+
+    # Plain tuples through executemany: bulk_create spends most of its time
+    # preparing Decimal values. New candles go in with a plain INSERT so a
+    # concurrent writer's candle raises instead of being overwritten.
+    table = connection.ops.quote_name(Candle._meta.db_table)
+    with connection.cursor() as cursor:
+        if created:
+            cursor.executemany(
+                f"INSERT INTO {table} ("
+                f"{_columns('stock', 'resolution', 'start', 'open', 'high', 'low', 'close', 'tick_count', 'open_epoch', 'close_epoch')}"
+                f") VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                created
+            )
+        if updated:
+            high, low, count, open_, open_epoch, close, close_epoch, candle_id = (
+                _column(name)
+                for name in ('high', 'low', 'tick_count', 'open', 'open_epoch', 'close', 'close_epoch', 'CandleID')
+            )
+            # Only an earlier tick replaces the open and only a later one the
+            # close. A NULL epoch predates tick times: keep that open, replace
+            # that close. Each price is assigned before its epoch, since MySQL
+            # evaluates SET left to right.
+            earlier = f"{open_epoch} IS NOT NULL AND {open_epoch} > %s"
+            later = f"{close_epoch} IS NULL OR {close_epoch} <= %s"
+            cursor.executemany(
+                f"UPDATE {table} SET {high} = %s, {low} = %s, {count} = %s, "
+                f"{open_} = CASE WHEN {earlier} THEN %s ELSE {open_} END, "
+                f"{open_epoch} = CASE WHEN {earlier} THEN %s ELSE {open_epoch} END, "
+                f"{close} = CASE WHEN {later} THEN %s ELSE {close} END, "
+                f"{close_epoch} = CASE WHEN {later} THEN %s ELSE {close_epoch} END "
+                f"WHERE {candle_id} = %s",
+                updated
+            )
+
+
+def fold_price_ticks(ticks):
+    """fold() for a list of unsaved or saved PriceTick instances"""
+    fold(
+        [tick.stock_id for tick in ticks],
+        [int(tick.price * 100) for tick in ticks],
+        [_epoch(tick.timestamp) for tick in ticks]
+    )
+
+
+def _midnight(timestamp):
+    return timestamp.astimezone(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def rebuild(stock_ids=None, since=None, chunk_rows=REBUILD_CHUNK_ROWS, log=None):
+    """
+    Recompute candles from PriceTick, optionally for some stocks and/or from
+    `since` on. `since` is rounded down to a day so no candle is half rebuilt.
+    Returns the number of ticks folded.
+
+    Each stock is rebuilt from the day of its first remaining tick. If that
+    tick isn't at midnight and the day already has a candle, prune_ticks may
+    have moved the day's earlier ticks to the archive, so the rebuild starts
+    at the next midnight and keeps that candle. Older candles are always
+    kept. A stock with no ticks keeps all its candles.
+    """
+    ticks = PriceTick.objects.all()
+    if stock_ids is not None:
+        ticks = ticks.filter(stock_id__in=stock_ids)
+    if since is not None:
+        since = since.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    firsts = dict(ticks.values('stock_id').annotate(first=Min('timestamp')).values_list('stock_id', 'first'))
+    # Stocks whose first tick's day has a 1d candle, from history older than these ticks
+    candled = set(
+        Candle.objects.filter(resolution=RESOLUTIONS[-1], start__in={_midnight(first) for first in firsts.values()})
+        .values_list('stock_id', 'start')
+    )
+
+    # StockIDs grouped by the day their rebuild starts
+    starts = {}
+    for stock_id, first in firsts.items():
+        start = _midnight(first)
+        if start != first and (stock_id, start) in candled:
+            start += timedelta(days=1)
+        if since is not None:
+            start = max(start, since)
+        starts.setdefault(start, []).append(stock_id)
+
+    folded = 0
+    for start, ids in sorted(starts.items()):
+        ids.sort()
+        for offset in range(0, len(ids), IN_LIST_LIMIT):
+            chunk_ids = ids[offset:offset + IN_LIST_LIMIT]
+            Candle.objects.filter(stock_id__in=chunk_ids, start__gte=start).delete()
+            rows = (
+                PriceTick.objects.filter(stock_id__in=chunk_ids, timestamp__gte=start)
+                .order_by('timestamp', 'TickID')
+                .values_list('stock_id', 'price', 'timestamp')
+            )
+            chunk = []
+            for row in rows.iterator(chunk_size=chunk_rows):
+                chunk.append(row)
+                if len(chunk) >= chunk_rows:
+                    folded += _fold_rows(chunk)
+                    chunk = []
+                    if log:
+                        log(f"{folded:,} ticks folded")
+            if chunk:
+                folded += _fold_rows(chunk)
+    return folded
+
+
+def _fold_rows(rows):
+    fold(
+        [stock_id for stock_id, _, _ in rows],
+        [int(price * 100) for _, price, _ in rows],
+        [_epoch(timestamp) for _, _, timestamp in rows]
+    )
+    return len(rows)
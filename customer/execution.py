@@ -0,0 +1,75 @@
+"""
+Sharded order execution.
+
+Pending orders are partitioned by StockID (or AccountID) across N worker
+threads. Each shard drains only its own partition, one micro-batch at a
+time, so orders for a hot ticker never contend with each other while
+different shards run in parallel. Cash is shared between shards, which is
+safe because balances only change through conditional UPDATEs.
+"""
+import logging
+import threading
+from django.conf import settings
+from django.db import connection
+from .order_queue import execute_pending_orders
+
+logger = logging.getLogger(__name__)
+
+
+class ShardedExecutor:
+    def __init__(self, shards=None, batch_size=100, poll_interval=0.05, shard_key=None):
+        self.shards = shards or settings.ORDER_EXECUTION_SHARDS
+        self.shard_key = shard_key or settings.ORDER_SHARD_KEY
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.processed = [0] * self.shards
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self, until_empty=False):
+        """Start one thread per shard. With until_empty, each exits once its partition is drained."""
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(
+                target=self._run,
+                args=(index, until_empty),
+                name=f"order-shard-{index}",
+                daemon=True
+            )
+            for index in range(self.shards)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.join()
+
+    def join(self, timeout=None):
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def run_until_empty(self):
+        self.start(until_empty=True)
+        self.join()
+        return sum(self.processed)
+
+    def _run(self, index, until_empty):
+        shard = (index, self.shards) if self.shards > 1 else None
+        try:
+            while not self._stop.is_set():
+                try:
+                    processed = execute_pending_orders(self.batch_size, shard, self.shard_key)
+                except Exception:
+                    logger.exception("Order shard %s failed a batch", index)
+                    processed = 0
+                self.processed[index] += processed
+
+                # A full batch means more may be waiting
+                if processed == self.batch_size:
+                    continue
+                if until_empty and not processed:
+                    break
+                self._stop.wait(self.poll_interval)
+        finally:
+            connection.close()
@@ -0,0 +1,114 @@
+"""
+Price history for charts.
+
+price_history() returns at most `points` (epoch seconds, price) pairs for a
+window, whatever its size. Exported ticks are sliced straight out of the
+memory-mapped tick store (customer/tick_store.py); anything newer is read
+with a bounded range scan on the (StockID, Timestamp) index. If the window
+holds more ticks than either allows, the closes of the coarsest candle
+resolution that still gives `points` buckets are used instead. Either
+series is downsampled with LTTB (Largest-Triangle-Three-Buckets), which
+keeps the peaks and troughs that a plain stride would drop.
+"""
+import json
+import numpy as np
+from .models import Candle, PriceTick
+from .tick_store import from_us, open_series, to_us
+
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+# Read at most this many raw ticks per requested point before switching to candles
+RAW_TICKS_PER_POINT = 10
+# Exported ticks are cheap to slice, so allow far more of them
+MAX_STORE_TICKS = 5_000_000
+STREAM_CHUNK_POINTS = 1000
+
+
+def lttb(x, y, threshold):
+    """Indices of the `threshold` points that best keep the shape of (x, y)"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        # Average of the next bucket; the final bucket looks at the last point
+        next_start, next_end = end, min(int((i + 2) * every) + 1, n)
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        # Pick the point forming the largest triangle with the previous pick and that average
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def _tick_series(stock, start, end, limit):
+    x, y = np.empty(0), np.empty(0)
+    store = open_series(stock.ticker)
+    if store is not None and store.rows and store.last_us >= to_us(start):
+        timestamps, prices = store.range(start, end)
+        if len(timestamps) > MAX_STORE_TICKS:
+            return None
+        x, y = timestamps / 1_000_000, prices / 100
+        # Only ticks after the last export still need the database
+        start = max(start, from_us(store.last_us))
+        if start >= end:
+            return x, y
+
+    ticks = PriceTick.objects.filter(stock=stock, timestamp__gte=start, timestamp__lte=end)
+    if len(x):
+        ticks = ticks.filter(timestamp__gt=start)
+    rows = list(ticks.order_by('timestamp').values_list('timestamp', 'price')[:limit + 1])
+    if len(rows) > limit:
+        return None
+    return (
+        np.concatenate((x, [row[0].timestamp() for row in rows])),
+        np.concatenate((y, [float(row[1]) for row in rows]))
+    )
+
+
+def _candle_series(stock, start, end, points):
+    window = (end - start).total_seconds()
+    resolutions = [seconds for seconds, _ in Candle.RESOLUTIONS]
+    fits = [seconds for seconds in resolutions if window / seconds >= points]
+    resolution = max(fits) if fits else resolutions[0]
+    rows = list(
+        Candle.objects.filter(stock=stock, resolution=resolution, start__gte=start, start__lte=end)
+        .order_by('start')
+        .values_list('start', 'close')
+    )
+    return resolution, [row[0].timestamp() for row in rows], [float(row[1]) for row in rows]
+
+
+def price_history(stock, start, end, points=DEFAULT_POINTS):
+    """(source, [[epoch seconds, price], ...]) where source is 'ticks' or a candle resolution like '5m'"""
+    series = _tick_series(stock, start, end, points * RAW_TICKS_PER_POINT)
+    if series is not None:
+        source, (x, y) = 'ticks', series
+    else:
+        resolution, x, y = _candle_series(stock, start, end, points)
+        source = dict(Candle.RESOLUTIONS)[resolution]
+
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    keep = lttb(x, y, points)
+    return source, [[int(t), p] for t, p in zip(x[keep].tolist(), y[keep].tolist())]
+
+
+def stream_history(ticker, start, end, source, series):
+    """Compact JSON, yielded in chunks so large series start sending right away"""
+    yield (
+        '{"ticker":%s,"from":%d,"to":%d,"source":%s,"points":['
+        % (json.dumps(ticker), start.timestamp(), end.timestamp(), json.dumps(source))
+    )
+    for i in range(0, len(series), STREAM_CHUNK_POINTS):
+        chunk = json.dumps(series[i:i + STREAM_CHUNK_POINTS], separators=(',', ':'))[1:-1]
+        yield (',' if i else '') + chunk
+    yield ']}'
@@ -0,0 +1,164 @@
+"""
+Idempotency-Key support for the trade, deposit and withdraw APIs.
+
+The first request with a given key inserts its IdempotencyKey row, runs the
+view and stores the response in that row, all in one transaction, so the
+response is committed exactly when the view's writes are. Retries with the
+same key get the stored response back (from the cache in front of the
+table when possible) without running the view again, so a client retrying
+after a timeout can't double-fill or double-deposit.
+
+A retry that arrives while the first request is still running finds its
+row locked and waits for it to finish: it then replays the committed
+response, or runs for real if the first request rolled back. Nothing is
+ever committed for a request whose writes weren't.
+
+A key is bound to its first request's method, path and body (a SHA-256
+fingerprint). Reusing it for a different request gets a 422, never the
+other request's response.
+"""
+import hashlib
+import time
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.response import Response
+from .metrics import metrics
+from .models import BrokerageAccount, IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 64
+# Tries at claiming a key whose row is purged between our insert and lock
+CLAIM_ATTEMPTS = 3
+
+
+def _cache_key(user_id, key):
+    return f"idempotency:v2:{user_id}:{key}"
+
+
+def _fingerprint(request):
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.path.encode(), request.body):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _lookup(user_id, key):
+    # Returns (endpoint, request_hash, status_code, body) of a committed
+    # response, or None
+    start = time.perf_counter()
+    stored = cache.get(_cache_key(user_id, key))
+    if stored is None:
+        row = (
+            IdempotencyKey.objects.filter(
+                account__user_id=user_id, key=key, expires_at__gt=timezone.now()
+            )
+            .values_list('endpoint', 'request_hash', 'status_code', 'response_body', 'expires_at')
+            .first()
+        )
+        if row:
+            endpoint, request_hash, status_code, body, expires_at = row
+            stored = (endpoint, request_hash, status_code, body)
+            if status_code is not None:
+                ttl = (expires_at - timezone.now()).total_seconds()
+                cache.set(_cache_key(user_id, key), stored, max(int(ttl), 1))
+    metrics.observe('idempotency.lookup_ms', (time.perf_counter() - start) * 1000)
+    return stored
+
+
+def _replay(stored, endpoint, request_hash):
+    stored_endpoint, stored_hash, status_code, body = stored
+    if stored_endpoint != endpoint or stored_hash != request_hash:
+        return Response({"error": f"{HEADER} was already used for a different request"}, status=422)
+    if status_code is None:
+        return Response({"error": "A request with this Idempotency-Key is still in progress"}, status=409)
+    metrics.incr('idempotency.hits')
+    response = Response(body, status=status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _claim(account_id, key):
+    """
+    Insert the key's row, or lock the existing one, until the current
+    transaction ends. Returns (row, created); row is None if it was purged
+    between the two.
+    """
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(account_id=account_id, key=key, expires_at=timezone.now()), True
+    except IntegrityError:
+        # Waits here for a request still running with this key
+        return IdempotencyKey.objects.select_for_update().filter(account_id=account_id, key=key).first(), False
+
+
+def idempotent(view_method):
+    """Make a BrokerageAccountViewSet action replay its response for a repeated Idempotency-Key"""
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({"error": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters"}, status=400)
+
+        user_id = request.user.pk
+        endpoint = view_method.__name__
+        request_hash = _fingerprint(request)
+        stored = _lookup(user_id, key)
+        if stored is not None:
+            return _replay(stored, endpoint, request_hash)
+
+        metrics.incr('idempotency.misses')
+        account_id = BrokerageAccount.objects.filter(user_id=user_id).values_list('pk', flat=True).first()
+        if account_id is None:
+            return view_method(self, request, *args, **kwargs)
+
+        for _ in range(CLAIM_ATTEMPTS):
+            with transaction.atomic():
+                row, created = _claim(account_id, key)
+                if row is None:
+                    continue
+                if not created and row.expires_at > timezone.now():
+                    stored = (row.endpoint, row.request_hash, row.status_code, row.response_body)
+                    return _replay(stored, endpoint, request_hash)
+
+                # The view's writes and its stored response commit together
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code >= 500:
+                    # Server errors aren't final; let the client retry for real
+                    transaction.set_rollback(True)
+                    return response
+
+                row.endpoint = endpoint
+                row.request_hash = request_hash
+                row.status_code = response.status_code
+                row.response_body = response.data
+                row.expires_at = timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+                row.save()
+                stored = (endpoint, request_hash, response.status_code, response.data)
+                transaction.on_commit(
+                    lambda: cache.set(_cache_key(user_id, key), stored, settings.IDEMPOTENCY_KEY_TTL)
+                )
+                return response
+        return Response({"error": f"Could not reserve the {HEADER}, please retry"}, status=409)
+
+    return wrapper
+
+
+def purge_expired_keys(batch_size=1000):
+    """Delete expired keys in bounded batches. Returns how many were removed."""
+    removed = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return removed
+        removed += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
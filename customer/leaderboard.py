@@ -0,0 +1,157 @@
+"""
+Platform-wide leaderboard and assets under management.
+
+compute() ranks accounts by equity with one grouped aggregate:
+
+    Balance + SUM(Position.Quantity * Stock.CurrentPrice) ... GROUP BY AccountID
+
+The database sorts the groups and returns only the top LEADERBOARD_SIZE
+rows. Equity also counts what resting limit orders hold: cash reserved by
+buys and shares reserved by sells, at current prices. One more grouped
+aggregate over the open limit orders (few, found on the status index)
+gives those per account. Those accounts are merged into the ranking; an
+account without reservations that belongs in the top is in the database's
+top already. AUM is the same sums platform-wide. None of it loops over
+every account in Python, so the cost is a few scans even with millions of
+accounts.
+
+The result is stored in the Leaderboard row, so every process serves the
+same board. get_leaderboard() recomputes it once it's older than
+LEADERBOARD_CACHE_TTL seconds. The refresh_leaderboard command recomputes
+it ahead of time, so no request pays for the aggregate.
+"""
+from decimal import Decimal
+from datetime import timedelta
+from django.conf import settings
+from django.db import models
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import BrokerageAccount, CustomUser, Leaderboard, Order, Position
+from .valuations import IN_LIST_LIMIT
+
+LEADERBOARD_ID = 1
+CENT = Decimal('0.01')
+_MONEY = models.DecimalField(max_digits=18, decimal_places=2)
+
+
+def _money(value):
+    # Quantized: SQLite sums DECIMAL columns as floats
+    return Decimal(value or 0).quantize(CENT)
+
+
+def _reservations():
+    """{AccountID: (reserved cash, reserved shares at current prices)} over every resting limit order"""
+    unfilled = F('quantity') - F('filled_qty')
+    rows = (
+        Order.objects.filter(status='Open', order_type='LIMIT')
+        .values('account_id', 'action')
+        .annotate(
+            cash=Sum(F('limit_price') * unfilled, output_field=_MONEY),
+            value=Sum(unfilled * F('stock__current_price'), output_field=_MONEY),
+        )
+        .values_list('account_id', 'action', 'cash', 'value')
+    )
+    reserved = {}
+    for account_id, action, cash, value in rows:
+        held_cash, held_value = reserved.get(account_id, (Decimal('0.00'), Decimal('0.00')))
+        if action == 'BUY':
+            held_cash += _money(cash)
+        else:
+            held_value += _money(value)
+        reserved[account_id] = (held_cash, held_value)
+    return reserved
+
+
+def compute(size=None):
+    """Top `size` accounts by equity plus the platform totals, as a JSON-ready dict"""
+    size = size or settings.LEADERBOARD_SIZE
+    accounts = BrokerageAccount.objects.annotate(
+        market_value=Coalesce(
+            Sum(F('positions__quantity') * F('positions__stock__current_price'), output_field=_MONEY),
+            Value(Decimal('0.00')),
+            output_field=_MONEY,
+        )
+    ).annotate(equity=F('cash_balance') + F('market_value'))
+    columns = ('pk', 'user_id', 'cash_balance', 'market_value')
+    candidates = {row[0]: row for row in accounts.order_by('-equity', 'pk').values_list(*columns)[:size]}
+
+    reserved = _reservations()
+    missing = sorted(reserved.keys() - candidates.keys())
+    for start in range(0, len(missing), IN_LIST_LIMIT):
+        for row in accounts.filter(pk__in=missing[start:start + IN_LIST_LIMIT]).values_list(*columns):
+            candidates[row[0]] = row
+
+    rows = []
+    for account_id, user_id, cash, value in candidates.values():
+        held_cash, held_value = reserved.get(account_id, (Decimal('0.00'), Decimal('0.00')))
+        cash, value = _money(cash) + held_cash, _money(value) + held_value
+        rows.append((account_id, user_id, cash, value, cash + value))
+    ranked = sorted(rows, key=lambda row: (-row[4], row[0]))[:size]
+    names = dict(
+        CustomUser.objects.filter(pk__in=[row[1] for row in ranked]).values_list('pk', 'UserName')
+    )
+
+    totals = BrokerageAccount.objects.aggregate(count=models.Count('pk'), cash=Sum('cash_balance'))
+    market_value = Position.objects.aggregate(
+        value=Sum(F('quantity') * F('stock__current_price'), output_field=_MONEY)
+    )['value']
+    cash = _money(totals['cash']) + sum((held[0] for held in reserved.values()), Decimal('0.00'))
+    market_value = _money(market_value) + sum((held[1] for held in reserved.values()), Decimal('0.00'))
+
+    return {
+        'as_of': timezone.now().isoformat(),
+        'accounts': totals['count'],
+        'aum': str(cash + market_value),
+        'cash': str(cash),
+        'market_value': str(market_value),
+        'top': [
+            {
+                'rank': rank,
+                'account_id': account_id,
+                'user': names.get(user_id),
+                'cash': str(cash),
+                'market_value': str(value),
+                'equity': str(equity),
+            }
+            for rank, (account_id, user_id, cash, value, equity) in enumerate(ranked, 1)
+        ],
+    }
+
+
+def refresh():
+    """Recompute the leaderboard and store it for every process"""
+    board = compute()
+    Leaderboard.objects.update_or_create(
+        LeaderboardID=LEADERBOARD_ID, defaults={'board': board, 'computed_at': timezone.now()}
+    )
+    return board
+
+
+def get_leaderboard():
+    """The stored leaderboard, recomputed when it's older than LEADERBOARD_CACHE_TTL"""
+    stored = Leaderboard.objects.filter(
+        LeaderboardID=LEADERBOARD_ID,
+        computed_at__gt=timezone.now() - timedelta(seconds=settings.LEADERBOARD_CACHE_TTL)
+    ).values_list('board', flat=True).first()
+    if stored is None:
+        stored = refresh()
+    return stored
+
+
+def page(board, number, page_size):
+    """One page (1-based) of the leaderboard's ranking, with the platform totals"""
+    top = board['top']
+    start = (number - 1) * page_size
+    return {
+        'as_of': board['as_of'],
+        'accounts': board['accounts'],
+        'aum': board['aum'],
+        'cash': board['cash'],
+        'market_value': board['market_value'],
+        'page': number,
+        'page_size': page_size,
+        'ranked': len(top),
+        'has_next': start + page_size < len(top),
+        'results': top[start:start + page_size],
+    }
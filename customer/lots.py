@@ -0,0 +1,191 @@
+"""
+Tax-lot ledger.
+
+Every buy fill opens a TaxLot. Every sell fill consumes open lots of that
+stock in the sell order's lot_method order:
+
+- FIFO: oldest first;
+- LIFO: newest first;
+- HIFO: highest cost first.
+
+Each consumption happens in the fill's own transaction. The Position keeps
+running totals, so P&L reads never touch the ledger:
+
+- cost_basis is the cost of the lots still open;
+- realized_pnl is the proceeds minus the cost of the lots consumed.
+
+Unrealized P&L is quantity * price - cost_basis.
+
+Lots follow fills, not reservations. A resting limit sell takes its shares
+out of Position.quantity when it's placed, but their lots stay open, and
+in cost_basis, until it fills. Readers count those reserved shares as
+held (matching.reservations()), so unrealized P&L stays right while the
+order rests. Shares sold with no open lot behind them
+(history from before the ledger) are treated as sold at cost; rebuild()
+replays the account's whole history to fix that.
+"""
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from .models import BrokerageAccount, Order, Position, TaxLot, Trade
+
+LOT_METHODS = [method for method, _ in Order.LOT_METHODS]
+_ORDERING = {
+    'FIFO': ('opened_at', 'LotID'),
+    'LIFO': ('-opened_at', '-LotID'),
+    'HIFO': ('-cost_per_share', 'opened_at', 'LotID'),
+}
+REBUILD_CHUNK_ROWS = 50_000
+
+
+def _add_to_position(account_id, stock_id, **totals):
+    positions = Position.objects.filter(account_id=account_id, stock_id=stock_id)
+    if positions.update(**totals):
+        return
+    # No row: a batch bought and sold the same shares, so its net quantity
+    # change was zero. Keep the totals on a zero-quantity position.
+    try:
+        with transaction.atomic():
+            Position.objects.create(account_id=account_id, stock_id=stock_id, quantity=0)
+    except IntegrityError:
+        pass
+    positions.update(**totals)
+
+
+def open_lot(account_id, stock_id, qty, price, order_id=None, opened_at=None):
+    """Record shares bought at `price`. Call after the Position row has the shares."""
+    TaxLot.objects.create(
+        account_id=account_id, stock_id=stock_id, order_id=order_id,
+        opened_at=opened_at or timezone.now(), quantity=qty, remaining=qty, cost_per_share=price
+    )
+    _add_to_position(account_id, stock_id, cost_basis=F('cost_basis') + price * qty)
+
+
+def close_lots(account_id, stock_id, qty, price, method='FIFO'):
+    """Consume lots for `qty` shares sold at `price`. Returns the realized P&L."""
+    lots = TaxLot.objects.select_for_update().filter(
+        account_id=account_id, stock_id=stock_id, remaining__gt=0
+    ).order_by(*_ORDERING[method])
+
+    left, cost, consumed = qty, Decimal('0.00'), []
+    for lot in lots:
+        take = min(left, lot.remaining)
+        lot.remaining -= take
+        cost += lot.cost_per_share * take
+        consumed.append(lot)
+        left -= take
+        if not left:
+            break
+    if consumed:
+        TaxLot.objects.bulk_update(consumed, ['remaining'])
+
+    # Shares with no lot behind them are taken to be sold at cost
+    realized = price * (qty - left) - cost
+    _add_to_position(
+        account_id, stock_id, cost_basis=F('cost_basis') - cost, realized_pnl=F('realized_pnl') + realized
+    )
+    return realized
+
+
+def _replay(fills):
+    """Lots and per-stock (cost basis, realized P&L) from one account's fills in time order"""
+    open_lots, closed_lots, totals = {}, [], {}
+    for stock_id, action, method, order_id, qty, price, executed_at in fills:
+        lots = open_lots.setdefault(stock_id, [])
+        cost_basis, realized = totals.get(stock_id, (Decimal('0.00'), Decimal('0.00')))
+        if action == 'BUY':
+            lots.append(TaxLot(
+                stock_id=stock_id, order_id=order_id, opened_at=executed_at,
+                quantity=qty, remaining=qty, cost_per_share=price
+            ))
+            cost_basis += price * qty
+        else:
+            if method == 'LIFO':
+                lots.reverse()
+            elif method == 'HIFO':
+                lots.sort(key=lambda lot: -lot.cost_per_share)
+            left, cost = qty, Decimal('0.00')
+            while left and lots:
+                lot = lots[0]
+                take = min(left, lot.remaining)
+                lot.remaining -= take
+                cost += lot.cost_per_share * take
+                left -= take
+                if not lot.remaining:
+                    closed_lots.append(lots.pop(0))
+            lots.sort(key=lambda lot: (lot.opened_at, lot.order_id or 0))
+            cost_basis -= cost
+            realized += price * (qty - left) - cost
+        totals[stock_id] = (cost_basis, realized)
+    return [lot for lots in open_lots.values() for lot in lots] + closed_lots, totals
+
+
+def _held(account_id):
+    """{StockID: shares} the account owns, counting shares reserved by resting limit sells"""
+    held = dict(Position.objects.filter(account_id=account_id).values_list('stock_id', 'quantity'))
+    reserved = (
+        Order.objects.filter(account_id=account_id, action='SELL', order_type='LIMIT', status='Open')
+        .values('stock_id').annotate(shares=Sum(F('quantity') - F('filled_qty'))).values_list('stock_id', 'shares')
+    )
+    for stock_id, shares in reserved:
+        held[stock_id] = held.get(stock_id, 0) + shares
+    return held
+
+
+def rebuild(account_ids=None, log=None):
+    """
+    Rebuild lots, cost basis and realized P&L from Trade history, one
+    account per transaction. Best run while trading is quiet. Returns
+    (accounts, lots written, mismatches): mismatches lists
+    (AccountID, StockID, shares in open lots, shares held) wherever the
+    history doesn't account for the shares held, e.g. shares granted
+    outside of trades.
+    """
+    if account_ids is None:
+        account_ids = list(
+            BrokerageAccount.objects.filter(pk__in=Order.objects.values('account_id')).values_list('pk', flat=True)
+        )
+
+    written, mismatches = 0, []
+    for done, account_id in enumerate(sorted(account_ids), 1):
+        with transaction.atomic():
+            fills = (
+                Trade.objects.filter(account_id=account_id)
+                .order_by('executed_time', 'TradeID')
+                .values_list(
+                    'order__stock_id', 'order__action', 'order__lot_method', 'order_id',
+                    'executed_qty', 'executed_price', 'executed_time'
+                )
+            )
+            lots, totals = _replay(fills.iterator(chunk_size=REBUILD_CHUNK_ROWS))
+            for lot in lots:
+                lot.account_id = account_id
+
+            TaxLot.objects.filter(account_id=account_id).delete()
+            TaxLot.objects.bulk_create(lots, batch_size=1000)
+            Position.objects.filter(account_id=account_id).update(cost_basis=0, realized_pnl=0)
+            # Stocks sold out before positions were kept at zero get a
+            # zero-quantity row to carry their realized P&L
+            Position.objects.bulk_create(
+                [
+                    Position(account_id=account_id, stock_id=stock_id, quantity=0,
+                             cost_basis=cost_basis, realized_pnl=realized)
+                    for stock_id, (cost_basis, realized) in totals.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['account', 'stock'],
+                update_fields=['cost_basis', 'realized_pnl'],
+            )
+
+            in_lots = {}
+            for lot in lots:
+                in_lots[lot.stock_id] = in_lots.get(lot.stock_id, 0) + lot.remaining
+            held = _held(account_id)
+            for stock_id in sorted(in_lots.keys() | held.keys()):
+                if in_lots.get(stock_id, 0) != held.get(stock_id, 0):
+                    mismatches.append((account_id, stock_id, in_lots.get(stock_id, 0), held.get(stock_id, 0)))
+        written += len(lots)
+        if log and (done % 100 == 0 or done == len(account_ids)):
+            log(f"{done:,}/{len(account_ids):,} accounts, {written:,} lots")
+    return len(account_ids), written, mismatches
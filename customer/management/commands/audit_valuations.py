@@ -0,0 +1,37 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from customer.valuations import audit
+
+
+class Command(BaseCommand):
+    help = "Check every account's cached valuation against a full recompute from positions"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Rewrite the valuations that differ instead of failing'
+        )
+        parser.add_argument(
+            '--show',
+            type=int,
+            default=20,
+            help='Mismatched accounts to list (default: 20)'
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        mismatches = audit(fix=options['fix'])
+        elapsed = time.perf_counter() - start
+
+        for account_id, cached, actual in mismatches[:options['show']]:
+            self.stdout.write(f"Account {account_id}: cached {cached if cached is not None else 'missing'}, actual {actual}")
+        if len(mismatches) > options['show']:
+            self.stdout.write(f"... and {len(mismatches) - options['show']:,} more")
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS(f"All valuations match ({elapsed:.2f}s)"))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {len(mismatches):,} valuations ({elapsed:.2f}s)"))
+        else:
+            raise CommandError(f"{len(mismatches):,} valuations differ from a full recompute; rerun with --fix")
@@ -0,0 +1,50 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from customer.matching import OrderBook, RestingOrder
+
+
+class Command(BaseCommand):
+    help = "Microbenchmark the in-memory limit order book (no database access)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--orders',
+            type=int,
+            default=200_000,
+            help='Number of limit orders to match (default: 200,000)'
+        )
+        parser.add_argument(
+            '--spread',
+            type=int,
+            default=100,
+            help='Orders are priced within +/- this many cents of $100 (default: 100)'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        count = options['orders']
+        spread = options['spread']
+        rng = random.Random(options['seed'])
+
+        orders = [
+            RestingOrder(
+                i,
+                rng.randrange(1000),
+                'BUY' if rng.random() < 0.5 else 'SELL',
+                10_000 + rng.randint(-spread, spread),
+                rng.randint(1, 500)
+            )
+            for i in range(count)
+        ]
+
+        book = OrderBook()
+        fills = 0
+        start = time.perf_counter()
+        for order in orders:
+            fills += len(book.match(order))
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(f"Matched {count:,} orders into {fills:,} fills in {elapsed:.2f}s")
+        self.stdout.write(f"Resting: {len(book):,} orders, best bid {book.best_bid()}, best ask {book.best_ask()}")
+        self.stdout.write(self.style.SUCCESS(f"{count / elapsed:,.0f} orders/sec"))
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from customer.quote_stream import QuoteHub, quote, quote_events
+
+
+class Command(BaseCommand):
+    help = "Load-test quote streaming: thousands of SSE subscribers on one hub (no database access)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--subscribers',
+            type=int,
+            default=5000,
+            help='Concurrent streams (default: 5,000)'
+        )
+        parser.add_argument(
+            '--stocks',
+            type=int,
+            default=1000,
+            help='Stocks whose prices move every round (default: 1,000)'
+        )
+        parser.add_argument(
+            '--tickers',
+            type=int,
+            default=5,
+            help='Tickers each stream follows (default: 5)'
+        )
+        parser.add_argument(
+            '--rounds',
+            type=int,
+            default=50,
+            help='Price writes to publish (default: 50)'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0.1,
+            help='Seconds between price writes (default: 0.1)'
+        )
+        parser.add_argument(
+            '--slow',
+            type=float,
+            default=0.1,
+            help='Fraction of streams whose client takes --slow-delay per message (default: 0.1)'
+        )
+        parser.add_argument(
+            '--slow-delay',
+            type=float,
+            default=0.5,
+            help='Seconds a slow client spends on each message (default: 0.5)'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['tickers'] > options['stocks']:
+            raise CommandError("--tickers can't exceed --stocks")
+        asyncio.run(self._run(options))
+
+    async def _run(self, options):
+        rng = random.Random(options['seed'])
+        hub = QuoteHub()
+        stock_ids = list(range(1, options['stocks'] + 1))
+        cents = {stock_id: 10_000 for stock_id in stock_ids}
+        current = lambda stock_id, now: quote(
+            f"S{stock_id}", cents[stock_id] / 100, cents[stock_id] / 100, cents[stock_id] / 100, ts=now
+        )
+
+        latencies, received, last_seen = [], [0] * options['subscribers'], [{} for _ in range(options['subscribers'])]
+
+        async def client(index, follows, slow):
+            events = quote_events({s: current(s, time.time()) for s in follows}, quote_hub=hub, heartbeat=3600)
+            try:
+                async for message in events:
+                    now = time.time()
+                    kind, data = message.split('\n', 1)
+                    for row in json.loads(data[len('data: '):]):
+                        last_seen[index][row['ticker']] = row['price']
+                        if kind == 'event: quotes' and not slow:
+                            latencies.append(now - row['ts'])
+                    received[index] += 1
+                    if slow:
+                        await asyncio.sleep(options['slow_delay'])
+            finally:
+                await events.aclose()
+
+        slow_count = int(options['subscribers'] * options['slow'])
+        subscriptions = [rng.sample(stock_ids, options['tickers']) for _ in range(options['subscribers'])]
+        tasks = [
+            asyncio.create_task(client(i, follows, i < slow_count))
+            for i, follows in enumerate(subscriptions)
+        ]
+        # Let every stream subscribe before prices start moving
+        while sum(received) < options['subscribers']:
+            await asyncio.sleep(0.01)
+        self.stdout.write(f"{options['subscribers']:,} streams subscribed ({slow_count:,} slow)")
+
+        published = [0]
+
+        def publisher():
+            # A price writer in another thread, as in production
+            for _ in range(options['rounds']):
+                now = time.time()
+                for stock_id in stock_ids:
+                    cents[stock_id] = max(1, cents[stock_id] + rng.randint(-25, 25))
+                hub.publish({stock_id: current(stock_id, now) for stock_id in stock_ids})
+                published[0] += 1
+                time.sleep(options['interval'])
+
+        start = time.perf_counter()
+        await asyncio.to_thread(publisher)
+        elapsed = time.perf_counter() - start
+        # Give slow clients time to take their final coalesced quotes
+        await asyncio.sleep(options['slow_delay'] * 2 + 0.5)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        final = {f"S{stock_id}": str(cents[stock_id] / 100) for stock_id in stock_ids}
+        stale = sum(
+            1 for seen in last_seen for ticker, price in seen.items() if final[ticker] != price
+        )
+        messages = sum(received) - options['subscribers']
+        slow_messages = sum(received[:slow_count]) - slow_count
+        latencies.sort()
+        pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+
+        self.stdout.write(
+            f"Published {published[0]} rounds of {len(stock_ids):,} quotes in {elapsed:.2f}s; "
+            f"delivered {messages:,} messages"
+        )
+        if slow_count:
+            self.stdout.write(
+                f"Slow clients: {slow_messages / slow_count:.1f} messages each for {published[0]} rounds "
+                f"(coalesced, no backlog)"
+            )
+        self.stdout.write(f"Fan-out latency: p50 {pct(0.5):.1f}ms, p99 {pct(0.99):.1f}ms, max {pct(1.0):.1f}ms")
+        if stale:
+            raise CommandError(f"{stale:,} streams ended on a stale quote")
+        self.stdout.write(self.style.SUCCESS("Every stream ended on the latest quote for each of its tickers"))
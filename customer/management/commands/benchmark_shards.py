@@ -0,0 +1,89 @@
+import time
+from decimal import Decimal
+from unittest import mock
+from django.core.management.base import BaseCommand
+from customer.execution import ShardedExecutor
+from customer.models import CustomUser, Stock, Order
+
+
+class Command(BaseCommand):
+    help = "Measure queued order throughput as execution shards are added (test rows are deleted afterwards)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--orders',
+            type=int,
+            default=2000,
+            help='Orders to queue for each shard count (default: 2000)'
+        )
+        parser.add_argument(
+            '--shards',
+            type=int,
+            nargs='+',
+            default=[1, 2, 4, 8],
+            help='Shard counts to try (default: 1 2 4 8)'
+        )
+        parser.add_argument(
+            '--stocks',
+            type=int,
+            default=32,
+            help='Number of tickers the orders are spread over (default: 32)'
+        )
+
+    def handle(self, *args, **options):
+        # Shard threads use their own connections, so this can't run inside a
+        # rolled-back transaction; everything is created up front and deleted
+        stocks = [
+            Stock.objects.create(
+                ticker=f"SHRD{i}",
+                name=f"Shard Benchmark {i}",
+                initial_price=Decimal('10.00'),
+                current_price=Decimal('10.00'),
+                opening_price=Decimal('10.00'),
+                day_high=Decimal('10.00'),
+                day_low=Decimal('10.00'),
+                float_shares=1_000_000
+            )
+            for i in range(options['stocks'])
+        ]
+        user = CustomUser.objects.create_user(
+            UserName='shard_benchmark',
+            email='shard_benchmark@investr.io',
+            FullName='Shard Benchmark',
+            Role='CUSTOMER',
+            password=None
+        )
+        account = user.account
+        account.cash_balance = Decimal('1000000000.00')
+        account.save()
+
+        try:
+            # Orders are queued already; don't depend on the real market hours
+            with mock.patch('customer.order_queue.is_market_open', return_value=(True, "Market is open")):
+                baseline = None
+                for shards in options['shards']:
+                    Order.objects.bulk_create([
+                        Order(
+                            account=account,
+                            stock=stocks[i % len(stocks)],
+                            action='BUY',
+                            quantity=1,
+                            status='Pending'
+                        )
+                        for i in range(options['orders'])
+                    ])
+
+                    executor = ShardedExecutor(shards=shards, batch_size=50, shard_key='stock')
+                    start = time.perf_counter()
+                    executed = executor.run_until_empty()
+                    elapsed = time.perf_counter() - start
+
+                    rate = executed / elapsed
+                    baseline = baseline or rate
+                    self.stdout.write(
+                        f"{shards:>3} shards: {rate:,.0f} orders/sec "
+                        f"({executed} orders, {rate / baseline:.2f}x)"
+                    )
+        finally:
+            user.delete()
+            Stock.objects.filter(pk__in=[s.pk for s in stocks]).delete()
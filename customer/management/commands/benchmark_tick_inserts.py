@@ -0,0 +1,111 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from customer.models import PriceTick, Stock
+from customer.pricing import WRITE_BATCH_SIZE, allocate_tick_ids, insert_ticks
+
+FILL_CHUNK_ROWS = 50_000
+
+
+class Command(BaseCommand):
+    help = (
+        "Grow PriceTick to each size and compare tick writes that read MAX(TickID) "
+        "with writes that reserve IDs from the sequence (benchmark rows are deleted afterwards)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[1_000_000, 10_000_000, 100_000_000],
+            help='PriceTick row counts to measure at (default: 1M 10M 100M)'
+        )
+        parser.add_argument(
+            '--batch',
+            type=int,
+            default=10_000,
+            help='Ticks per measured write, about one market-wide tick (default: 10000)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Measured writes per method at each size (default: 5)'
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help="Don't delete the benchmark ticks afterwards"
+        )
+
+    def handle(self, *args, **options):
+        stock_ids = list(Stock.objects.values_list('pk', flat=True)[:options['batch']])
+        if not stock_ids:
+            raise CommandError("Create at least one stock first")
+
+        # Everything this run writes comes from one reserved range, so cleanup
+        # is a range delete that can't touch real ticks
+        rows = PriceTick.objects.count()
+        needed = max(options['sizes']) - rows + 2 * len(options['sizes']) * options['repeat'] * options['batch']
+        first_id = allocate_tick_ids(max(needed, 1))
+        next_id = first_id
+        timestamp = timezone.now()
+        fill_timestamp = connection.ops.adapt_datetimefield_value(timestamp)
+
+        def ticks(count, first):
+            return [
+                PriceTick(TickID=first + i, stock_id=stock_ids[i % len(stock_ids)], price='100.00', timestamp=timestamp)
+                for i in range(count)
+            ]
+
+        self.stdout.write(f"{'rows':>12} {'MAX(TickID)':>12} {'allocate':>10} {'max+insert':>14} {'alloc+insert':>14}")
+        try:
+            for size in sorted(options['sizes']):
+                # Grow the table with the fast tuple insert; not part of the measurement
+                while rows < size:
+                    count = min(FILL_CHUNK_ROWS, size - rows)
+                    with transaction.atomic():
+                        insert_ticks([
+                            (next_id + i, stock_ids[i % len(stock_ids)], 100.0, fill_timestamp)
+                            for i in range(count)
+                        ])
+                    next_id += count
+                    rows += count
+
+                max_ms, alloc_ms, max_rate, alloc_rate = [], [], [], []
+                for _ in range(options['repeat']):
+                    # Old path: scan for the highest ID, then insert
+                    start = time.perf_counter()
+                    with transaction.atomic():
+                        PriceTick.objects.aggregate(Max('TickID'))
+                        scanned = time.perf_counter()
+                        PriceTick.objects.bulk_create(ticks(options['batch'], next_id), batch_size=WRITE_BATCH_SIZE)
+                    elapsed = time.perf_counter() - start
+                    max_ms.append((scanned - start) * 1000)
+                    max_rate.append(options['batch'] / elapsed)
+                    next_id += options['batch']
+
+                    # New path: reserve a block from the sequence, then insert
+                    start = time.perf_counter()
+                    allocate_tick_ids(options['batch'])
+                    allocated = time.perf_counter()
+                    with transaction.atomic():
+                        PriceTick.objects.bulk_create(ticks(options['batch'], next_id), batch_size=WRITE_BATCH_SIZE)
+                    elapsed = time.perf_counter() - start
+                    alloc_ms.append((allocated - start) * 1000)
+                    alloc_rate.append(options['batch'] / elapsed)
+                    next_id += options['batch']
+                    rows += 2 * options['batch']
+
+                self.stdout.write(
+                    f"{size:>12,} {min(max_ms):>10.2f}ms {min(alloc_ms):>8.2f}ms "
+                    f"{max(max_rate):>9,.0f} t/s {max(alloc_rate):>9,.0f} t/s"
+                )
+        finally:
+            if not options['keep']:
+                self.stdout.write("Deleting benchmark ticks...")
+                for start_id in range(first_id, next_id, FILL_CHUNK_ROWS):
+                    PriceTick.objects.filter(TickID__gte=start_id, TickID__lt=start_id + FILL_CHUNK_ROWS).delete()
@@ -0,0 +1,171 @@
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from customer.models import BrokerageAccount, CustomUser, Stock, MarketSchedule, Position
+from customer.order_queue import execute_pending_orders
+from customer.trading import MAX_BATCH_ORDERS, add_shares, debit_cash
+from customer.views import BrokerageAccountViewSet
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare orders/sec of the single-order trade API against trade_batch, and of the "
+        "cash and position writes with read-modify-save against conditional F() updates "
+        "(all writes are rolled back)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--orders',
+            type=int,
+            default=50,
+            help='Number of orders to execute on each path (default: 50)'
+        )
+        parser.add_argument(
+            '--intake',
+            choices=['sync', 'queue'],
+            default='sync',
+            help='ORDER_INTAKE_MODE for the single-order path (default: sync)'
+        )
+
+    def handle(self, *args, **options):
+        count = options['orders']
+        factory = APIRequestFactory()
+        trade_view = BrokerageAccountViewSet.as_view({'post': 'trade'})
+        batch_view = BrokerageAccountViewSet.as_view({'post': 'trade_batch'})
+
+        error = None
+        try:
+            with transaction.atomic():
+                user = self._setup()
+                tickers = list(Stock.objects.values_list('ticker', flat=True)[:10])
+                orders = [
+                    {'ticker': tickers[i % len(tickers)], 'type': 'BUY', 'quantity': 1}
+                    for i in range(count)
+                ]
+
+                latencies = []
+                start = time.perf_counter()
+                with override_settings(ORDER_INTAKE_MODE=options['intake']):
+                    for order in orders:
+                        request = factory.post('/api/v1/accounts/trade/', order, format='json')
+                        force_authenticate(request, user=user)
+                        sent = time.perf_counter()
+                        response = trade_view(request)
+                        latencies.append(time.perf_counter() - sent)
+                        if response.status_code not in (200, 202):
+                            error = f"trade failed: {response.data}"
+                            raise _Rollback()
+                if options['intake'] == 'queue':
+                    # Include the worker's time so orders/sec stays comparable
+                    while execute_pending_orders(MAX_BATCH_ORDERS):
+                        pass
+                single_elapsed = time.perf_counter() - start
+
+                start = time.perf_counter()
+                for i in range(0, count, MAX_BATCH_ORDERS):
+                    chunk = orders[i:i + MAX_BATCH_ORDERS]
+                    request = factory.post('/api/v1/accounts/trade_batch/', {'orders': chunk}, format='json')
+                    force_authenticate(request, user=user)
+                    response = batch_view(request)
+                    if response.status_code != 200:
+                        error = f"trade_batch failed: {response.data}"
+                        raise _Rollback()
+                batch_elapsed = time.perf_counter() - start
+
+                save_elapsed, update_elapsed = self._balance_updates(user.account, Stock.objects.first(), count)
+
+                # Never keep the benchmark's rows
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+        if error:
+            self.stderr.write(error)
+            return
+
+        single_rate = count / single_elapsed
+        batch_rate = count / batch_elapsed
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+        self.stdout.write(f"single trade ({options['intake']}): {single_rate:,.0f} orders/sec ({single_elapsed * 1000:.1f} ms)")
+        self.stdout.write(f"  submission latency p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+        self.stdout.write(f"trade_batch:  {batch_rate:,.0f} orders/sec ({batch_elapsed * 1000:.1f} ms)")
+        self.stdout.write(self.style.SUCCESS(f"Speedup: {batch_rate / single_rate:.1f}x"))
+
+        save_rate = count / save_elapsed
+        update_rate = count / update_elapsed
+        self.stdout.write(f"read-modify-save writes: {save_rate:,.0f} orders/sec ({save_elapsed * 1000:.1f} ms)")
+        self.stdout.write(f"conditional F() writes:  {update_rate:,.0f} orders/sec ({update_elapsed * 1000:.1f} ms)")
+        self.stdout.write(self.style.SUCCESS(f"Speedup: {update_rate / save_rate:.1f}x"))
+
+    def _balance_updates(self, account, stock, count):
+        """
+        Seconds to take `count` one-share buys' cash and shares the way trades
+        did before trading.py's conditional updates (read both rows, change
+        them in Python, save them back), then with debit_cash/add_shares.
+        """
+        price = stock.current_price
+        start = time.perf_counter()
+        for _ in range(count):
+            account = BrokerageAccount.objects.get(pk=account.pk)
+            if account.cash_balance < price:
+                raise _Rollback()
+            account.cash_balance -= price
+            account.save()
+            position, _ = Position.objects.get_or_create(account=account, stock=stock, defaults={'quantity': 0})
+            position.quantity += 1
+            position.save()
+        save_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(count):
+            if not debit_cash(account, price):
+                raise _Rollback()
+            add_shares(account, stock.pk, 1)
+        return save_elapsed, time.perf_counter() - start
+
+    def _setup(self):
+        # Everything created here disappears with the rollback
+        MarketSchedule.objects.update_or_create(
+            ScheduleID=1,
+            defaults={
+                'Status': 'OPEN',
+                'OpenHour': 0,
+                'OpenMinute': 0,
+                'CloseHour': 23,
+                'CloseMinute': 59,
+                'Holiday': False
+            }
+        )
+        if not Stock.objects.exists():
+            for i in range(10):
+                Stock.objects.create(
+                    ticker=f"BENCH{i}",
+                    name=f"Benchmark {i}",
+                    initial_price=Decimal('10.00'),
+                    current_price=Decimal('10.00'),
+                    opening_price=Decimal('10.00'),
+                    day_high=Decimal('10.00'),
+                    day_low=Decimal('10.00'),
+                    float_shares=1_000_000
+                )
+
+        user = CustomUser.objects.create_user(
+            UserName='benchmark_trader',
+            email='benchmark@investr.io',
+            FullName='Benchmark Trader',
+            Role='CUSTOMER',
+            password=None
+        )
+        user.account.cash_balance = Decimal('1000000000.00')
+        user.account.save()
+        return user
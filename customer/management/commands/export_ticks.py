@@ -0,0 +1,44 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from customer.models import Stock
+from customer.tick_store import export_ticks
+
+
+class Command(BaseCommand):
+    help = "Append new PriceTicks to the per-ticker columnar tick store (run before prune_ticks)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ticker',
+            nargs='+',
+            help='Only export these stocks (default: all)'
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Rewrite each ticker from scratch, picking up ticks inserted out of time order'
+        )
+        parser.add_argument(
+            '--dir',
+            default=settings.TICK_STORE_DIR,
+            help=f'Store directory (default: {settings.TICK_STORE_DIR})'
+        )
+
+    def handle(self, *args, **options):
+        stocks = Stock.objects.order_by('StockID')
+        if options['ticker']:
+            tickers = [ticker.upper() for ticker in options['ticker']]
+            stocks = stocks.filter(ticker__in=tickers)
+            if stocks.count() != len(tickers):
+                raise CommandError("Unknown ticker in --ticker")
+
+        start = time.perf_counter()
+        total = 0
+        for stock in stocks:
+            total += export_ticks(stock, root=options['dir'], rebuild=options['rebuild'])
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {total:,} ticks to {options['dir']} in {elapsed:.1f}s"
+        ))
@@ -1,62 +1,186 @@
+from datetime import time as dt_time
 from decimal import Decimal, ROUND_HALF_UP
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
-from django.db.models import Max
-from customer.models import Stock, PriceTick
-import random
+from django.utils import timezone
+from customer.candles import fold_price_ticks
+from customer.models import MarketSchedule, Stock, PriceTick
+from customer.price_models import MODELS, MarketModel, SECONDS_PER_TRADING_YEAR
+from customer.pricing import PriceArrays, WRITE_BATCH_SIZE, allocate_tick_ids, backfill, session_steps
+from customer.quote_stream import publish_quotes
+from customer.quotes import quotes_changed
+from customer.valuations import apply_price_moves
+import numpy as np
+import time
 
 class Command(BaseCommand):
-    help = "Update stock prices with random fluctuations"
-    
+    help = "Update stock prices with random fluctuations, or backfill historical ticks"
+
     def add_arguments(self, parser):
         parser.add_argument(
             '--volatility',
             type=float,
             default=0.5,
-            help='Price change percentage (default: 0.5%)'
+            help='Price change percentage for the uniform model (default: 0.5%)'
+        )
+        parser.add_argument(
+            '--model',
+            choices=sorted(MODELS),
+            default='uniform',
+            help='Price model for stocks without a StockPriceModel row (default: uniform)'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=60,
+            help='Seconds each tick covers; the time step for gbm/mean_reverting/jump_diffusion (default: 60)'
+        )
+        parser.add_argument(
+            '--backfill',
+            type=int,
+            metavar='DAYS',
+            help='Generate ticks every --interval seconds over the market session of the last DAYS days'
+        )
+        parser.add_argument('--seed', type=int, help='Seed for reproducible prices')
+        parser.add_argument(
+            '--engine',
+            choices=['vectorized', 'loop'],
+            default='vectorized',
+            help='vectorized: NumPy + bulk writes (default); loop: one UPDATE per stock, same price models'
+        )
+        parser.add_argument(
+            '--benchmark',
+            action='store_true',
+            help='Report stocks/sec for the update'
         )
-    
+
     def handle(self, *args, **options):
         volatility = options['volatility'] / 100
-        
-        stocks = Stock.objects.all()
-        if not stocks:
+        if options['interval'] <= 0:
+            raise CommandError("--interval must be positive")
+        if options['engine'] == 'loop' and options['backfill']:
+            raise CommandError("The loop engine only supports single updates")
+        rng = np.random.default_rng(options['seed'])
+        start = time.perf_counter()
+
+        if options['backfill'] is not None:
+            if options['backfill'] < 1:
+                raise CommandError("--backfill must be at least 1 day")
+            self._backfill(options, volatility, rng, start)
+            return
+
+        if options['engine'] == 'loop':
+            updated = self._run_loop(volatility, options['model'], options['interval'], rng)
+        else:
+            updated = self._run_vectorized(volatility, options['model'], options['interval'], rng)
+
+        if not updated:
+            self.stdout.write("No stocks to update")
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Updated {updated} stocks")
+        )
+        if options['benchmark']:
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{options['engine']} engine: {updated / elapsed:,.0f} stocks/sec ({elapsed * 1000:.1f} ms)"
+            )
+
+    def _run_vectorized(self, volatility, model_name, interval, rng):
+        prices = PriceArrays.load()
+        if not len(prices):
+            return 0
+
+        # Draw every stock's return at once, then write back in bulk
+        prices.step(MarketModel.for_stocks(prices.stocks, model_name, max_change=volatility), interval, rng)
+        # Reserve IDs before the write transaction so the sequence row isn't held for it
+        first_tick_id = allocate_tick_ids(len(prices))
+        timestamp = timezone.now()
+        with transaction.atomic():
+            prices.save()
+            PriceTick.objects.bulk_create(prices.ticks(first_tick_id, timestamp), batch_size=WRITE_BATCH_SIZE)
+            prices.fold_candles(timestamp)
+        return len(prices)
+
+    def _backfill(self, options, volatility, rng, start):
+        days, interval = options['backfill'], options['interval']
+        prices = PriceArrays.load()
+        if not len(prices):
             self.stdout.write("No stocks to update")
             return
-        
+
+        schedule = MarketSchedule.objects.first()
+        if schedule:
+            session = (dt_time(schedule.OpenHour, schedule.OpenMinute), dt_time(schedule.CloseHour, schedule.CloseMinute))
+        else:
+            session = (dt_time(9, 30), dt_time(16, 0))
+        total = days * session_steps(*session, interval) * len(prices)
+        self.stdout.write(
+            f"Backfilling {total:,} ticks: {len(prices)} stocks, {days} days, every {interval:g}s "
+            f"({session[0]:%H:%M}-{session[1]:%H:%M})"
+        )
+
+        model = MarketModel.for_stocks(prices.stocks, options['model'], max_change=volatility)
+        written = backfill(
+            prices, model, days, interval, session, allocate_tick_ids(total), rng, log=self.stdout.write
+        )
+        # Carry on from where the history ends
         with transaction.atomic():
-            # Figure out next PriceTick ID - start at 5 billion if none exist
-            last_tick_id = PriceTick.objects.aggregate(Max('TickID'))['TickID__max']
-            next_tick_id = (last_tick_id or 5_000_000_000) + 1
-            
+            prices.save()
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled {written:,} ticks in {elapsed:.1f}s ({written / elapsed:,.0f} ticks/sec)"
+        ))
+
+    def _run_loop(self, volatility, model_name, interval, rng):
+        stocks = list(Stock.objects.order_by('StockID'))
+        if not stocks:
+            return 0
+        model = MarketModel.for_stocks(stocks, model_name, max_change=volatility)
+
+        tick_id = allocate_tick_ids(len(stocks))
+        with transaction.atomic():
+            # Lock the rows and start from their latest prices, which the
+            # valuation deltas below are taken against
+            locked = dict(Stock.objects.select_for_update().order_by('StockID').values_list('StockID', 'current_price'))
+            for stock in stocks:
+                stock.current_price = locked.get(stock.pk, stock.current_price)
+            old_cents = [int(stock.current_price * 100) for stock in stocks]
+
+            # The same models (and seeded RNG) as the vectorized engine, one stock at a time after that
+            current = np.array([float(stock.current_price) for stock in stocks])
+            new_prices = model.step(current, interval / SECONDS_PER_TRADING_YEAR, rng).tolist()
+
             ticks = []
             updated = 0
-            
-            for stock in stocks:
-                change = Decimal(str(random.uniform(-volatility, volatility)))
-                new_price = stock.current_price * (1 + change)
-                
-                new_price = max(new_price, Decimal("0.01"))
+
+            for stock, new_price in zip(stocks, new_prices):
+                new_price = max(Decimal(str(new_price)), Decimal("0.01"))
                 new_price = new_price.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-                
+
                 if new_price > stock.day_high:
                     stock.day_high = new_price
                 if new_price < stock.day_low:
                     stock.day_low = new_price
-                
+
                 stock.current_price = new_price
                 stock.save(update_fields=['current_price', 'day_high', 'day_low'])
-                
+
                 ticks.append(PriceTick(
-                    TickID=next_tick_id,  # CHANGED FROM id
+                    TickID=tick_id,  # CHANGED FROM id
                     stock=stock,
                     price=new_price
                 ))
-                next_tick_id += 1
+                tick_id += 1
                 updated += 1
-            
+
             PriceTick.objects.bulk_create(ticks)
-            
-            self.stdout.write(
-                self.style.SUCCESS(f"Updated {updated} stocks")
-            )
\ No newline at end of file
+            fold_price_ticks(ticks)
+            apply_price_moves(
+                [stock.pk for stock in stocks], old_cents, [int(stock.current_price * 100) for stock in stocks]
+            )
+            quotes_changed()
+            publish_quotes(stocks)
+            return updated
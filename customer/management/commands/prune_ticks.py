@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from customer.retention import DEFAULT_BATCH_SIZE, prune_ticks
+
+
+class Command(BaseCommand):
+    help = (
+        "Move PriceTicks older than the retention window into downsampled monthly "
+        "archive tables and drop expired archives (safe to interrupt and re-run)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-days',
+            type=int,
+            default=settings.TICK_RETENTION_DAYS,
+            help=f'Days of full-resolution ticks to keep (default: {settings.TICK_RETENTION_DAYS})'
+        )
+        parser.add_argument(
+            '--archive-months',
+            type=int,
+            default=settings.TICK_ARCHIVE_MONTHS,
+            help=f'Months of downsampled archive to keep (default: {settings.TICK_ARCHIVE_MONTHS})'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Ticks moved per transaction (default: {DEFAULT_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--max-seconds',
+            type=float,
+            help='Stop after this long; the next run continues where this one stopped'
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.0,
+            help='Seconds to sleep between batches to give other writers the lock (default: 0)'
+        )
+
+    def handle(self, *args, **options):
+        if options['keep_days'] < 1 or options['archive_months'] < 1 or options['batch_size'] < 1:
+            raise CommandError("--keep-days, --archive-months and --batch-size must be at least 1")
+
+        try:
+            result = prune_ticks(
+                keep_days=options['keep_days'],
+                archive_months=options['archive_months'],
+                batch_size=options['batch_size'],
+                max_seconds=options['max_seconds'],
+                pause=options['pause'],
+                log=self.stdout.write
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for table in result['dropped']:
+            self.stdout.write(f"Dropped expired archive {table}")
+        message = f"Pruned {result['read']:,} ticks, archived {result['archived']:,}"
+        if result['complete']:
+            self.stdout.write(self.style.SUCCESS(message))
+        else:
+            self.stdout.write(self.style.WARNING(f"{message}; stopped at --max-seconds, run again to continue"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from customer.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = "Delete Idempotency-Key records whose TTL has passed"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows deleted per statement (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        removed = purge_expired_keys(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} expired idempotency keys"))
@@ -0,0 +1,48 @@
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.core.management.base import BaseCommand, CommandError
+from customer.candles import REBUILD_CHUNK_ROWS, rebuild
+from customer.models import Stock
+
+
+class Command(BaseCommand):
+    help = "Recompute the 1m/5m/1h/1d candles from PriceTick history"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ticker',
+            nargs='+',
+            help='Only rebuild these stocks (default: all)'
+        )
+        parser.add_argument(
+            '--since',
+            help='Only rebuild from this date on, YYYY-MM-DD in UTC (default: all history)'
+        )
+        parser.add_argument(
+            '--chunk',
+            type=int,
+            default=REBUILD_CHUNK_ROWS,
+            help=f'Ticks read and folded per batch (default: {REBUILD_CHUNK_ROWS})'
+        )
+
+    def handle(self, *args, **options):
+        stock_ids = None
+        if options['ticker']:
+            tickers = [ticker.upper() for ticker in options['ticker']]
+            stock_ids = list(Stock.objects.filter(ticker__in=tickers).values_list('pk', flat=True))
+            if len(stock_ids) != len(tickers):
+                raise CommandError("Unknown ticker in --ticker")
+
+        since = None
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d').replace(tzinfo=dt_timezone.utc)
+            except ValueError:
+                raise CommandError("--since must be YYYY-MM-DD")
+
+        start = time.perf_counter()
+        folded = rebuild(stock_ids, since, chunk_rows=options['chunk'], log=self.stdout.write)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt candles from {folded:,} ticks in {elapsed:.1f}s ({folded / max(elapsed, 1e-9):,.0f} ticks/sec)"
+        ))
@@ -0,0 +1,36 @@
+import time
+from django.core.management.base import BaseCommand
+from customer.lots import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild tax lots, cost basis and realized P&L by replaying each account's trade history"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--account',
+            type=int,
+            nargs='+',
+            help='Only these AccountIDs (default: every account with orders)'
+        )
+        parser.add_argument(
+            '--show',
+            type=int,
+            default=20,
+            help='Mismatched positions to list (default: 20)'
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        accounts, lots, mismatches = rebuild(options['account'], log=self.stdout.write)
+        elapsed = time.perf_counter() - start
+
+        for account_id, stock_id, in_lots, held in mismatches[:options['show']]:
+            self.stdout.write(f"Account {account_id}, stock {stock_id}: {in_lots:,} shares in lots, {held:,} held")
+        if len(mismatches) > options['show']:
+            self.stdout.write(f"... and {len(mismatches) - options['show']:,} more")
+        if mismatches:
+            self.stdout.write(self.style.WARNING(
+                f"{len(mismatches):,} positions hold shares the trade history doesn't account for"
+            ))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {lots:,} lots for {accounts:,} accounts in {elapsed:.1f}s"))
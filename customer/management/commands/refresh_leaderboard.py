@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from customer.leaderboard import refresh
+
+
+class Command(BaseCommand):
+    help = "Recompute the equity leaderboard and AUM with set-based aggregates and store the result"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--show',
+            type=int,
+            default=10,
+            help='Top accounts to print (default: 10)'
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        board = refresh()
+        elapsed = time.perf_counter() - start
+
+        for row in board['top'][:options['show']]:
+            self.stdout.write(f"{row['rank']:>5}. {row['user'] or row['account_id']}: ${row['equity']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"AUM ${board['aum']} (cash ${board['cash']}, positions ${board['market_value']}) "
+            f"across {board['accounts']:,} accounts, ranked in {elapsed:.2f}s"
+        ))
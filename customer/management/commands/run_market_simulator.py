@@ -0,0 +1,94 @@
+import math
+from django.core.management.base import BaseCommand, CommandError
+from customer.models import SimulatorControl
+from customer.price_models import MODELS
+from customer.simulator import MAX_INTERVAL_SECONDS, MAX_VOLATILITY, MarketSimulator
+
+
+class Command(BaseCommand):
+    help = "Continuously tick stock prices while the market is open (controlled from the admin dashboard)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Seconds between ticks; saved to the control row (default: keep current)'
+        )
+        parser.add_argument(
+            '--volatility',
+            type=float,
+            help='Max price change percentage per tick; saved to the control row'
+        )
+        parser.add_argument(
+            '--start',
+            action='store_true',
+            help='Set the desired state to RUNNING instead of waiting for the dashboard'
+        )
+        parser.add_argument(
+            '--flush-rows',
+            type=int,
+            default=50_000,
+            help='Flush buffered ticks once this many are waiting (default: 50000)'
+        )
+        parser.add_argument(
+            '--flush-interval',
+            type=float,
+            default=1.0,
+            help='Flush buffered ticks at least this often, in seconds (default: 1.0)'
+        )
+        parser.add_argument(
+            '--max-buffer-rows',
+            type=int,
+            default=500_000,
+            help='Block ticking while this many ticks are waiting to be written (default: 500000)'
+        )
+        parser.add_argument(
+            '--reload-every',
+            type=int,
+            default=60,
+            help='Reload stocks from the DB every N ticks to pick up new ones (default: 60)'
+        )
+        parser.add_argument(
+            '--model',
+            choices=sorted(MODELS),
+            default='uniform',
+            help='Price model for stocks without a StockPriceModel row (default: uniform)'
+        )
+        parser.add_argument('--seed', type=int, help='Seed for reproducible price paths')
+
+    def handle(self, *args, **options):
+        interval, volatility = options['interval'], options['volatility']
+        if interval is not None and not (math.isfinite(interval) and 0 < interval <= MAX_INTERVAL_SECONDS):
+            raise CommandError(f"--interval must be between 0 and {MAX_INTERVAL_SECONDS} seconds")
+        if volatility is not None and not (math.isfinite(volatility) and 0 < volatility <= MAX_VOLATILITY):
+            raise CommandError(f"--volatility must be between 0 and {MAX_VOLATILITY}")
+
+        control = SimulatorControl.get()
+        if options['interval'] is not None:
+            control.interval_seconds = options['interval']
+        if options['volatility'] is not None:
+            control.volatility = options['volatility']
+        if options['start']:
+            control.desired_state = 'RUNNING'
+        control.save()
+
+        self.stdout.write(
+            f"Market simulator started: {control.desired_state.lower()}, "
+            f"every {control.interval_seconds}s at {control.volatility}% volatility"
+        )
+
+        simulator = MarketSimulator(
+            flush_rows=options['flush_rows'],
+            flush_interval=options['flush_interval'],
+            max_buffer_rows=options['max_buffer_rows'],
+            reload_every=options['reload_every'],
+            seed=options['seed'],
+            model=options['model'],
+            log=self.stdout.write
+        )
+        try:
+            simulator.run()
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS("Market simulator stopped"))
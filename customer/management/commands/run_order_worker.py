@@ -0,0 +1,58 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from customer.execution import ShardedExecutor
+
+
+class Command(BaseCommand):
+    help = "Execute queued (Pending) orders in micro-batches until stopped"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Max orders executed per transaction (default: 100)'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=0.05,
+            help='Seconds to wait when the queue is empty (default: 0.05)'
+        )
+        parser.add_argument(
+            '--shards',
+            type=int,
+            default=settings.ORDER_EXECUTION_SHARDS,
+            help=f'Worker threads, each owning a partition of orders (default: {settings.ORDER_EXECUTION_SHARDS})'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the queue once and exit'
+        )
+
+    def handle(self, *args, **options):
+        executor = ShardedExecutor(
+            shards=options['shards'],
+            batch_size=options['batch_size'],
+            poll_interval=options['poll_interval']
+        )
+
+        if options['once']:
+            total = executor.run_until_empty()
+            self.stdout.write(self.style.SUCCESS(f"Executed {total} orders"))
+            return
+
+        self.stdout.write(
+            f"Order worker started ({executor.shards} shards by {executor.shard_key}, "
+            f"batch size {executor.batch_size})"
+        )
+        executor.start()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            executor.stop()
+
+        self.stdout.write(self.style.SUCCESS(f"Order worker stopped after {sum(executor.processed)} orders"))
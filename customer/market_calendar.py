@@ -0,0 +1,261 @@
+"""
+Market calendar.
+
+Trading sessions for the next MARKET_CALENDAR_DAYS days are precomputed
+from the MarketSchedule (hours, time zone, trading weekdays) and the
+MarketHoliday rows. They're kept as three parallel sorted lists: session
+day (date ordinal), open and close (epoch seconds). "Is the market open",
+"next open" and "next close" are then a bisect over those lists, with no
+database access.
+
+The schedule and the calendar are cached under a calendar version, an
+IdSequence row ('market_calendar') that every save or delete of a
+MarketSchedule or MarketHoliday advances (signals.py). Each process reads
+the version at most every MARKET_SCHEDULE_LOCAL_TTL seconds and keeps its
+copies while the version is unchanged. On a new version it looks in the
+cache under that version, so a change reaches every process within the
+local TTL, whether or not the cache is shared between them. The shared
+cache holds a calendar for MARKET_CALENDAR_CACHE_TTL. Recomputes are
+incremental:
+
+- adding, editing or deleting a holiday redoes just that day, and the
+  result is stored under the new version;
+- a change to the schedule's hours, time zone or trading days rebuilds
+  the whole calendar, since it no longer matches the schedule;
+- as days pass, past days are dropped and new ones appended.
+
+Hours are local to the schedule's time zone, so DST shifts are handled
+per day. The schedule's Status (admin open/close switch) isn't part of
+the calendar; utils.is_market_open checks it first.
+"""
+import time as clock
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+from django.conf import settings
+from django.core.cache import cache
+from .models import MarketHoliday
+from .sequences import advance, current
+
+CALENDAR_SEQUENCE = 'market_calendar'
+_local_version = None  # (version, expires at)
+_local_calendar = None  # (calendar, version, expires at)
+
+
+def _format_time(moment):
+    return moment.strftime('%I:%M %p')
+
+
+class MarketCalendar:
+    def __init__(self, schedule):
+        self.signature = self.signature_of(schedule)
+        self.tz = ZoneInfo(schedule.TimeZone)
+        self.trading_days = {int(day) for day in schedule.TradingDays}
+        self.open_time = time(schedule.OpenHour, schedule.OpenMinute)
+        self.close_time = time(schedule.CloseHour, schedule.CloseMinute)
+
+        self.days = []    # date ordinal of each session
+        self.opens = []   # epoch seconds
+        self.closes = []  # epoch seconds
+        self.holidays = {}  # date ordinal -> (name, early close or None)
+        self.first_day = self.last_day = None
+        self.roll_at = None
+
+    @staticmethod
+    def signature_of(schedule):
+        """Everything about the schedule the sessions depend on"""
+        return (
+            schedule.pk, schedule.OpenHour, schedule.OpenMinute, schedule.CloseHour,
+            schedule.CloseMinute, schedule.TimeZone, schedule.TradingDays,
+        )
+
+    def matches(self, schedule):
+        return self.signature == self.signature_of(schedule)
+
+    def today(self, now=None):
+        return datetime.fromtimestamp(clock.time() if now is None else now, self.tz).date()
+
+    def _epoch(self, day, at):
+        return int(datetime.combine(day, at, tzinfo=self.tz).timestamp())
+
+    def _session(self, day, holiday):
+        """(open, close) in epoch seconds for `day`, or None if there's no session"""
+        if day.weekday() not in self.trading_days:
+            return None
+        close_time = self.close_time
+        if holiday is not None:
+            if not holiday.early_close:
+                return None
+            close_time = time(holiday.close_hour, holiday.close_minute or 0)
+        opens, closes = self._epoch(day, self.open_time), self._epoch(day, close_time)
+        return (opens, closes) if closes > opens else None
+
+    def set_day(self, day, holiday):
+        """Recompute one day's session after its holiday was added, changed or removed"""
+        ordinal = day.toordinal()
+        self.holidays.pop(ordinal, None)
+        if holiday is not None:
+            self.holidays[ordinal] = (
+                holiday.name,
+                time(holiday.close_hour, holiday.close_minute or 0) if holiday.early_close else None,
+            )
+        if self.first_day is None or not self.first_day <= ordinal <= self.last_day:
+            return
+
+        i = bisect_left(self.days, ordinal)
+        if i < len(self.days) and self.days[i] == ordinal:
+            del self.days[i], self.opens[i], self.closes[i]
+        session = self._session(day, holiday)
+        if session is not None:
+            self.days.insert(i, ordinal)
+            self.opens.insert(i, session[0])
+            self.closes.insert(i, session[1])
+
+    def extend(self, start, end):
+        """Cover start..end (dates, inclusive): drop earlier days, append missing ones"""
+        start_ordinal, end_ordinal = start.toordinal(), end.toordinal()
+        if self.first_day is not None and start_ordinal > self.first_day:
+            cut = bisect_left(self.days, start_ordinal)
+            del self.days[:cut], self.opens[:cut], self.closes[:cut]
+            self.holidays = {day: value for day, value in self.holidays.items() if day >= start_ordinal}
+        if self.last_day is not None:
+            start_ordinal = max(start_ordinal, self.last_day + 1)
+        if start_ordinal <= end_ordinal:
+            first, last = date.fromordinal(start_ordinal), date.fromordinal(end_ordinal)
+            holidays = {holiday.date: holiday for holiday in MarketHoliday.objects.filter(date__range=(first, last))}
+            for ordinal in range(start_ordinal, end_ordinal + 1):
+                day = date.fromordinal(ordinal)
+                holiday = holidays.get(day)
+                if holiday is not None:
+                    self.set_day(day, holiday)
+                session = self._session(day, holiday)
+                if session is not None:
+                    self.days.append(ordinal)
+                    self.opens.append(session[0])
+                    self.closes.append(session[1])
+            self.last_day = end_ordinal
+        self.first_day = start.toordinal() if self.first_day is None else max(self.first_day, start.toordinal())
+        # Local midnight two days on, when first_day stops being "yesterday"
+        self.roll_at = self._epoch(date.fromordinal(self.first_day + 2), time())
+
+    def is_open(self, now):
+        i = bisect_right(self.opens, now) - 1
+        return i >= 0 and now <= self.closes[i]
+
+    def next_open(self, now):
+        """Epoch seconds of the first open after `now`, or None past the horizon"""
+        i = bisect_right(self.opens, now)
+        return self.opens[i] if i < len(self.opens) else None
+
+    def next_close(self, now):
+        """Close of the current session if open, else of the next one"""
+        i = bisect_left(self.closes, now)
+        return self.closes[i] if i < len(self.closes) else None
+
+    def session_on(self, day):
+        ordinal = day.toordinal()
+        i = bisect_left(self.days, ordinal)
+        if i < len(self.days) and self.days[i] == ordinal:
+            return self.opens[i], self.closes[i]
+        return None
+
+    def sessions(self, now, count):
+        """The next `count` sessions, including the current one, as (open, close)"""
+        i = bisect_left(self.closes, now)
+        return list(zip(self.opens[i:i + count], self.closes[i:i + count]))
+
+    def holiday_on(self, day):
+        """(name, early close time or None) if `day` is a holiday"""
+        return self.holidays.get(day.toordinal())
+
+    def local(self, epoch):
+        return datetime.fromtimestamp(epoch, self.tz)
+
+    def closed_message(self, now):
+        day = self.today(now)
+        session = self.session_on(day)
+        if session is not None:
+            if now < session[0]:
+                return f"Market opens at {_format_time(self.local(session[0]))}"
+            return f"Market closed at {_format_time(self.local(session[1]))}"
+        holiday = self.holiday_on(day)
+        if holiday is not None:
+            return f"Market is closed for {holiday[0]}"
+        if day.weekday() >= 5:
+            return "Market is closed on weekends"
+        return "Market is closed today"
+
+
+def _horizon(today):
+    return today - timedelta(days=1), today + timedelta(days=settings.MARKET_CALENDAR_DAYS)
+
+
+def calendar_version():
+    """The calendar version, re-read from the DB at most every MARKET_SCHEDULE_LOCAL_TTL seconds"""
+    global _local_version
+    local = _local_version
+    if local is not None and clock.monotonic() < local[1]:
+        return local[0]
+    version = current(CALENDAR_SEQUENCE, initial=clock.time_ns)
+    _local_version = (version, clock.monotonic() + settings.MARKET_SCHEDULE_LOCAL_TTL)
+    return version
+
+
+def _calendar_key(version):
+    return f'market_calendar:{version}'
+
+
+def _keep(calendar, version):
+    # Local copies don't outlive the shared one, a safety net for changes
+    # that bypass the signals (QuerySet.update, raw SQL)
+    global _local_calendar
+    _local_calendar = (calendar, version, clock.monotonic() + settings.MARKET_CALENDAR_CACHE_TTL)
+
+
+def _store(calendar, version):
+    cache.set(_calendar_key(version), calendar, settings.MARKET_CALENDAR_CACHE_TTL)
+    _keep(calendar, version)
+
+
+def get_calendar(schedule):
+    """The precomputed MarketCalendar for `schedule`, building or extending it if needed"""
+    version = calendar_version()
+    local = _local_calendar
+    if local is not None and local[1] == version and clock.monotonic() < local[2] and local[0].matches(schedule):
+        calendar = local[0]
+    else:
+        calendar = cache.get(_calendar_key(version))
+        if calendar is None or not calendar.matches(schedule):
+            calendar = MarketCalendar(schedule)
+            calendar.extend(*_horizon(calendar.today()))
+            _store(calendar, version)
+        else:
+            _keep(calendar, version)
+
+    # Roll the horizon forward once a day. Yesterday is kept because its
+    # session can still be running in UTC terms.
+    if clock.time() >= calendar.roll_at:
+        calendar.extend(*_horizon(calendar.today()))
+        _store(calendar, version)
+    return calendar
+
+
+def calendar_changed(days=()):
+    """
+    Advance the calendar version for a schedule change, or for holiday
+    changes on `days`, as part of the current transaction. The cached
+    calendar is carried over to the new version with those days recomputed.
+    """
+    global _local_version
+    old, version = advance(CALENDAR_SEQUENCE)
+    # This process re-reads the version, so it sees its own change straight away
+    _local_version = None
+
+    calendar = cache.get(_calendar_key(old))
+    if calendar is None:
+        return
+    if days:
+        holidays = {holiday.date: holiday for holiday in MarketHoliday.objects.filter(date__in=days)}
+        for day in days:
+            calendar.set_day(day, holidays.get(day))
+    _store(calendar, version)
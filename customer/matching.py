@@ -0,0 +1,342 @@
+"""
+In-memory limit order book and matching engine.
+
+Each ticker has an OrderBook with bid and ask price levels kept in heaps
+(best price on top) and a FIFO queue of resting orders per level, giving
+price-time priority. Prices are held as integer cents. Adding a price level
+or consuming one is O(log n) in the number of levels; everything else is O(1).
+Cancels are lazy like the heaps: a cancelled order is only forgotten, and
+is dropped from its level's queue once it reaches the front.
+
+An order never trades with its own account's resting orders: one that
+would is rejected whole, and its transaction rolls back.
+
+Resting orders live in the `Order` table (status 'Open', OrderType 'LIMIT')
+so a book is rebuilt from one indexed query whenever it may be stale.
+Books are cached per process, but web workers and the order worker all
+match, so each ticker has a version row (IdSequence 'order_book:<StockID>').
+Every place or cancel bumps it in its own transaction. The UPDATE locks
+the row until commit, so one process at a time changes a ticker's book.
+A cached book is used only if nobody has bumped the version since this
+process last committed a write to it; otherwise it is reloaded from the DB
+under the lock.
+"""
+import heapq
+import threading
+from collections import defaultdict, deque
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from .lots import close_lots, open_lot
+from .models import BrokerageAccount, Order, Trade, Transaction
+from .sequences import allocate
+from .trading import TradeError, debit_cash, credit_cash, add_shares, remove_shares
+
+
+def to_cents(price):
+    return int((Decimal(price) * 100).to_integral_value())
+
+
+def from_cents(cents):
+    return Decimal(cents) / 100
+
+
+class RestingOrder:
+    __slots__ = ('order_id', 'account_id', 'side', 'price', 'remaining')
+
+    def __init__(self, order_id, account_id, side, price, remaining):
+        self.order_id = order_id
+        self.account_id = account_id
+        self.side = side
+        self.price = price
+        self.remaining = remaining
+
+
+class Fill:
+    __slots__ = ('maker', 'taker', 'price', 'quantity')
+
+    def __init__(self, maker, taker, price, quantity):
+        self.maker = maker
+        self.taker = taker
+        self.price = price
+        self.quantity = quantity
+
+
+class OrderBook:
+    def __init__(self):
+        # Heaps of price levels; bids are negated so the best bid is on top
+        self._bid_prices = []
+        self._ask_prices = []
+        self._bids = {}
+        self._asks = {}
+        self._orders = {}
+
+    def __len__(self):
+        return len(self._orders)
+
+    def best_bid(self):
+        return self._top_level(self._bids, self._bid_prices, -1)[0]
+
+    def best_ask(self):
+        return self._top_level(self._asks, self._ask_prices, 1)[0]
+
+    def add(self, order):
+        """Rest an order at the back of its price level's queue"""
+        if order.side == 'BUY':
+            levels, prices, key = self._bids, self._bid_prices, -order.price
+        else:
+            levels, prices, key = self._asks, self._ask_prices, order.price
+
+        level = levels.get(order.price)
+        if level is None:
+            level = levels[order.price] = deque()
+            heapq.heappush(prices, key)
+        level.append(order)
+        self._orders[order.order_id] = order
+
+    def cancel(self, order_id):
+        """Take an order off the book. Returns it, or None if it isn't resting."""
+        # Still queued in its level; _top_level() discards it lazily
+        return self._orders.pop(order_id, None)
+
+    def _top_level(self, levels, prices, sign):
+        while prices:
+            price = prices[0] * sign
+            level = levels[price]
+            # Drop orders cancelled since they were queued
+            while level and self._orders.get(level[0].order_id) is not level[0]:
+                level.popleft()
+            if level:
+                return price, level
+            del levels[price]
+            heapq.heappop(prices)
+        return None, None
+
+    def match(self, order):
+        """
+        Match an incoming order against the opposite side and return its
+        fills. Whatever is left of the order rests on the book. Raises
+        TradeError, leaving the book part-matched, if the order reaches one of
+        its own account's; the caller reloads the book.
+        """
+        if order.side == 'BUY':
+            levels, prices, sign = self._asks, self._ask_prices, 1
+            crosses = lambda level_price: level_price <= order.price
+        else:
+            levels, prices, sign = self._bids, self._bid_prices, -1
+            crosses = lambda level_price: level_price >= order.price
+
+        fills = []
+        while order.remaining:
+            level_price, level = self._top_level(levels, prices, sign)
+            if level is None or not crosses(level_price):
+                break
+
+            maker = level[0]
+            if maker.account_id == order.account_id:
+                raise TradeError("Order would trade with your own resting order")
+            qty = min(order.remaining, maker.remaining)
+            fills.append(Fill(maker, order, level_price, qty))
+            order.remaining -= qty
+            maker.remaining -= qty
+
+            if not maker.remaining:
+                level.popleft()
+                del self._orders[maker.order_id]
+                if not level:
+                    del levels[level_price]
+                    heapq.heappop(prices)
+
+        if order.remaining:
+            self.add(order)
+        return fills
+
+
+def reservations(account_id):
+    """
+    (cash, {StockID: shares}) the account's resting limit orders have
+    reserved: buys hold limit price * unfilled quantity, sells their unfilled
+    shares. Both are still the account's, just not in its balance or
+    Position.quantity.
+    """
+    unfilled = F('quantity') - F('filled_qty')
+    rows = (
+        Order.objects.filter(account_id=account_id, order_type='LIMIT', status='Open')
+        .values('stock_id', 'action')
+        .annotate(shares=Sum(unfilled), cash=Sum(F('limit_price') * unfilled))
+        .values_list('stock_id', 'action', 'shares', 'cash')
+    )
+    cash, shares = Decimal('0.00'), {}
+    for stock_id, action, reserved_shares, reserved_cash in rows:
+        if action == 'BUY':
+            # Quantized: SQLite sums DECIMAL columns as floats
+            cash += Decimal(reserved_cash).quantize(Decimal('0.01'))
+        else:
+            shares[stock_id] = reserved_shares
+    return cash, shares
+
+
+class MatchingEngine:
+    """One OrderBook per stock, cached while no other process changes it"""
+
+    def __init__(self):
+        self._books = {}  # StockID -> (book version after our last write, OrderBook)
+        self._locks = defaultdict(threading.Lock)
+
+    def book(self, stock_id):
+        """
+        Lock the stock's book until the current transaction ends and return
+        it, reloaded from the DB if another process changed it since.
+        """
+        version = allocate(f'order_book:{stock_id}', 1)
+        cached = self._books.pop(stock_id, None)
+        if cached is not None and cached[0] == version:
+            book = cached[1]
+        else:
+            book = self._load(stock_id)
+        # Cached again only if our writes commit: the caller's transaction may
+        # be an outer one (an idempotent request) that still rolls back
+        transaction.on_commit(lambda: self._books.__setitem__(stock_id, (version + 1, book)))
+        return book
+
+    def reload(self, stock_id):
+        self._books.pop(stock_id, None)
+
+    def _load(self, stock_id):
+        book = OrderBook()
+        resting = (
+            Order.objects.filter(stock_id=stock_id, status='Open', order_type='LIMIT')
+            .order_by('OrderID')
+            .values_list('OrderID', 'account_id', 'action', 'limit_price', 'quantity', 'filled_qty')
+        )
+        for order_id, account_id, side, price, quantity, filled in resting:
+            book.add(RestingOrder(order_id, account_id, side, to_cents(price), quantity - filled))
+        return book
+
+    def place(self, account, stock, side, quantity, limit_price, order=None, lot_method='FIFO'):
+        """
+        Reserve funds (buys) or shares (sells), persist the order, match it and
+        settle the fills. Returns (order, fills). Pass `order` to execute an
+        already queued Order row instead of creating one; it keeps its own
+        lot_method.
+        """
+        with self._locks[stock.pk]:
+            try:
+                with transaction.atomic():
+                    return self._place(account, stock, side, quantity, limit_price, order, lot_method)
+            except Exception:
+                # The book may have been changed for writes that rolled back
+                self.reload(stock.pk)
+                raise
+
+    def _place(self, account, stock, side, quantity, limit_price, order, lot_method):
+        # Load the book before the new order row exists
+        book = self.book(stock.pk)
+
+        if side == 'BUY':
+            if not debit_cash(account, limit_price * quantity):
+                raise TradeError("Insufficient funds")
+        elif not remove_shares(account, stock.pk, quantity):
+            raise TradeError("Not enough shares")
+
+        if order is None:
+            order = Order.objects.create(
+                account=account,
+                stock=stock,
+                action=side,
+                order_type='LIMIT',
+                limit_price=limit_price,
+                quantity=quantity,
+                lot_method=lot_method,
+                status='Open'
+            )
+        else:
+            order.status = 'Open'
+            order.save(update_fields=['status'])
+
+        incoming = RestingOrder(order.pk, account.pk, side, to_cents(limit_price), quantity)
+        fills = book.match(incoming)
+        if fills:
+            self._settle(stock, incoming, fills)
+            order.refresh_from_db(fields=['filled_qty', 'status', 'executed_at'])
+        return order, fills
+
+    def _settle(self, stock, taker, fills):
+        now = timezone.now()
+        trades, transactions = [], []
+        filled = {}
+        # Sellers' shares were reserved when their orders were placed; their
+        # lots close now, at the fill price
+        sell_orders = {fill.taker.order_id if fill.taker.side == 'SELL' else fill.maker.order_id for fill in fills}
+        lot_methods = dict(Order.objects.filter(pk__in=sell_orders).values_list('pk', 'lot_method'))
+
+        for fill in fills:
+            price = from_cents(fill.price)
+            total = price * fill.quantity
+            buyer, seller = (fill.taker, fill.maker) if fill.taker.side == 'BUY' else (fill.maker, fill.taker)
+            buyer_account = BrokerageAccount(pk=buyer.account_id)
+            seller_account = BrokerageAccount(pk=seller.account_id)
+
+            # Both sides reserved up front: the buyer's cash at their limit
+            # price (refund any price improvement), the seller's shares
+            add_shares(buyer_account, stock.pk, fill.quantity)
+            improvement = (from_cents(buyer.price) - price) * fill.quantity
+            if improvement:
+                credit_cash(buyer_account, improvement)
+            credit_cash(seller_account, total)
+            open_lot(buyer.account_id, stock.pk, fill.quantity, price, order_id=buyer.order_id, opened_at=now)
+            close_lots(seller.account_id, stock.pk, fill.quantity, price, lot_methods[seller.order_id])
+
+            for order in (fill.maker, fill.taker):
+                trades.append(Trade(
+                    order_id=order.order_id, account_id=order.account_id, executed_price=price, executed_qty=fill.quantity
+                ))
+                filled[order.order_id] = filled.get(order.order_id, 0) + fill.quantity
+
+            # Same transaction types the market order handlers record
+            transactions.append(Transaction(account=buyer_account, transaction_type='STOCK_TRADE', amount=total))
+            transactions.append(Transaction(account=seller_account, transaction_type='SELL', amount=total))
+
+        Trade.objects.bulk_create(trades)
+        Transaction.objects.bulk_create(transactions)
+
+        for order_id, qty in filled.items():
+            Order.objects.filter(pk=order_id).update(filled_qty=F('filled_qty') + qty)
+
+        done = {fill.maker.order_id for fill in fills if not fill.maker.remaining}
+        if not taker.remaining:
+            done.add(taker.order_id)
+        if done:
+            Order.objects.filter(pk__in=done).update(status='Filled', executed_at=now)
+
+    def cancel(self, account, order_id):
+        """Cancel a resting limit order and release its reserved cash or shares"""
+        open_orders = Order.objects.filter(pk=order_id, account=account, order_type='LIMIT', status='Open')
+        stock_id = open_orders.values_list('stock_id', flat=True).first()
+        if stock_id is None:
+            raise TradeError("Order not found or not open")
+
+        with self._locks[stock_id]:
+            try:
+                with transaction.atomic():
+                    book = self.book(stock_id)
+                    # Re-read under the book's lock in case it filled or was
+                    # cancelled meanwhile, here or in another process
+                    order = open_orders.first()
+                    if order is None:
+                        raise TradeError("Order not found or not open")
+                    resting = book.cancel(order.pk)
+                    remaining = resting.remaining if resting else order.quantity - order.filled_qty
+                    if order.action == 'BUY':
+                        credit_cash(account, order.limit_price * remaining)
+                    else:
+                        add_shares(account, order.stock_id, remaining)
+                    order.status = 'Cancelled'
+                    order.save(update_fields=['status'])
+            except Exception:
+                self.reload(stock_id)
+                raise
+            return order
+
+engine = MatchingEngine()
@@ -0,0 +1,66 @@
+"""
+Process-local counters and timers.
+
+Cheap enough to call on hot paths; read them through the admin metrics
+endpoint (api/v1/admin/metrics/) or `metrics.snapshot()`.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._timers = {}
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, ms):
+        """Record one duration in milliseconds"""
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                self._timers[name] = [1, ms, ms]
+            else:
+                timer[0] += 1
+                timer[1] += ms
+                timer[2] = max(timer[2], ms)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000)
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges),
+                'timers': {
+                    name: {
+                        'count': count,
+                        'avg_ms': round(total / count, 3),
+                        'max_ms': round(peak, 3),
+                    }
+                    for name, (count, total, peak) in self._timers.items()
+                },
+            }
+
+
+metrics = Metrics()
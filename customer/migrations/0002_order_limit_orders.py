@@ -0,0 +1,75 @@
+# Generated by Django 5.2.8 on 2026-10-17 07:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customer", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name="marketschedule",
+            old_name="close_hour",
+            new_name="CloseHour",
+        ),
+        migrations.RenameField(
+            model_name="marketschedule",
+            old_name="close_minute",
+            new_name="CloseMinute",
+        ),
+        migrations.RenameField(
+            model_name="marketschedule",
+            old_name="holiday",
+            new_name="Holiday",
+        ),
+        migrations.RenameField(
+            model_name="marketschedule",
+            old_name="open_hour",
+            new_name="OpenHour",
+        ),
+        migrations.RenameField(
+            model_name="marketschedule",
+            old_name="open_minute",
+            new_name="OpenMinute",
+        ),
+        migrations.RenameField(
+            model_name="marketschedule",
+            old_name="status",
+            new_name="Status",
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="filled_qty",
+            field=models.BigIntegerField(db_column="FilledQty", default=0),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="limit_price",
+            field=models.DecimalField(
+                blank=True,
+                db_column="LimitPrice",
+                decimal_places=2,
+                max_digits=12,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="order_type",
+            field=models.CharField(
+                choices=[("MARKET", "Market"), ("LIMIT", "Limit")],
+                db_column="OrderType",
+                default="MARKET",
+                max_length=10,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["stock", "status"], name="order_stock_status_idx"
+            ),
+        ),
+    ]
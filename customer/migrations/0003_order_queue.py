@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-17 07:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customer", "0002_order_limit_orders"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="reject_reason",
+            field=models.CharField(
+                blank=True, db_column="RejectReason", default="", max_length=100
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["status", "OrderID"], name="order_status_idx"),
+        ),
+    ]
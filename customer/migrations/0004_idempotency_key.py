@@ -0,0 +1,58 @@
+# Generated by Django 5.2.8 on 2026-10-17 07:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customer", "0003_order_queue"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IdempotencyKey",
+            fields=[
+                (
+                    "KeyID",
+                    models.BigAutoField(
+                        db_column="KeyID", primary_key=True, serialize=False
+                    ),
+                ),
+                ("key", models.CharField(db_column="IdempotencyKey", max_length=64)),
+                ("endpoint", models.CharField(db_column="Endpoint", max_length=30)),
+                (
+                    "status_code",
+                    models.PositiveSmallIntegerField(
+                        blank=True, db_column="StatusCode", null=True
+                    ),
+                ),
+                (
+                    "response_body",
+                    models.JSONField(blank=True, db_column="ResponseBody", null=True),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, db_column="CreatedAt"),
+                ),
+                ("expires_at", models.DateTimeField(db_column="ExpiresAt")),
+                (
+                    "account",
+                    models.ForeignKey(
+                        db_column="AccountID",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="idempotency_keys",
+                        to="customer.brokerageaccount",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "IdempotencyKey",
+                "indexes": [
+                    models.Index(fields=["expires_at"], name="idempotency_expires_idx")
+                ],
+                "unique_together": {("account", "key")},
+            },
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.8 on 2026-10-17 07:58
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customer", "0004_idempotency_key"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SimulatorControl",
+            fields=[
+                (
+                    "SimulatorID",
+                    models.BigAutoField(
+                        db_column="SimulatorID", primary_key=True, serialize=False
+                    ),
+                ),
+                (
+                    "desired_state",
+                    models.CharField(
+                        choices=[("RUNNING", "Running"), ("STOPPED", "Stopped")],
+                        db_column="DesiredState",
+                        default="STOPPED",
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "interval_seconds",
+                    models.FloatField(db_column="IntervalSeconds", default=5.0),
+                ),
+                ("volatility", models.FloatField(db_column="Volatility", default=0.5)),
+                (
+                    "status",
+                    models.CharField(
+                        db_column="Status", default="OFFLINE", max_length=20
+                    ),
+                ),
+                (
+                    "heartbeat_at",
+                    models.DateTimeField(
+                        blank=True, db_column="HeartbeatAt", null=True
+                    ),
+                ),
+                (
+                    "last_tick_at",
+                    models.DateTimeField(blank=True, db_column="LastTickAt", null=True),
+                ),
+                (
+                    "ticks_total",
+                    models.BigIntegerField(db_column="TicksTotal", default=0),
+                ),
+                (
+                    "last_tick_lag_ms",
+                    models.FloatField(db_column="LastTickLagMs", default=0),
+                ),
+                (
+                    "last_write_ms",
+                    models.FloatField(db_column="LastWriteMs", default=0),
+                ),
+            ],
+            options={
+                "db_table": "SimulatorControl",
+            },
+        ),
+        migrations.AlterField(
+            model_name="pricetick",
+            name="timestamp",
+            field=models.DateTimeField(
+                db_column="Timestamp", default=django.utils.timezone.now
+            ),
+        ),
+    ]
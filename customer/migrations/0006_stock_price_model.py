@@ -0,0 +1,86 @@
+# Generated by Django 5.2.8 on 2026-10-17 08:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customer", "0005_simulator_control"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockPriceModel",
+            fields=[
+                (
+                    "PriceModelID",
+                    models.BigAutoField(
+                        db_column="PriceModelID", primary_key=True, serialize=False
+                    ),
+                ),
+                (
+                    "model",
+                    models.CharField(
+                        choices=[
+                            ("gbm", "Geometric Brownian motion"),
+                            (
+                                "mean_reverting",
+                                "Mean-reverting (Ornstein-Uhlenbeck on log price)",
+                            ),
+                            ("jump_diffusion", "Jump diffusion (Merton)"),
+                        ],
+                        db_column="Model",
+                        default="gbm",
+                        max_length=20,
+                    ),
+                ),
+                ("drift", models.FloatField(blank=True, db_column="Drift", null=True)),
+                (
+                    "volatility",
+                    models.FloatField(blank=True, db_column="Volatility", null=True),
+                ),
+                (
+                    "mean_reversion",
+                    models.FloatField(blank=True, db_column="MeanReversion", null=True),
+                ),
+                (
+                    "long_run_price",
+                    models.DecimalField(
+                        blank=True,
+                        db_column="LongRunPrice",
+                        decimal_places=2,
+                        max_digits=12,
+                        null=True,
+                    ),
+                ),
+                (
+                    "jump_intensity",
+                    models.FloatField(blank=True, db_column="JumpIntensity", null=True),
+                ),
+                (
+                    "jump_mean",
+                    models.FloatField(blank=True, db_column="JumpMean", null=True),
+                ),
+                (
+                    "jump_volatility",
+                    models.FloatField(
+                        blank=True, db_column="JumpVolatility", null=True
+                    ),
+                ),
+                (
+                    "stock",
+                    models.OneToOneField(
+                        db_column="StockID",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="price_model",
+                        to="customer.stock",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "StockPriceModel",
+            },
+        ),
+    ]
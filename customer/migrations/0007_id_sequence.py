@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-17 08:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customer", "0006_stock_price_model"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IdSequence",
+            fields=[
+                (
+                    "name",
+                    models.CharField(
+                        db_column="SequenceName",
+                        max_length=50,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("next_value", models.BigIntegerField(db_column="NextValue")),
+            ],
+            options={
+                "db_table": "IdSequence",
+            },
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.8 on 2026-10-17 08:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customer", "0007_id_sequence"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Candle",
+            fields=[
+                (
+                    "CandleID",
+                    models.BigAutoField(
+                        db_column="CandleID", primary_key=True, serialize=False
+                    ),
+                ),
+                (
+                    "resolution",
+                    models.IntegerField(
+                        choices=[(60, "1m"), (300, "5m"), (3600, "1h"), (86400, "1d")],
+                        db_column="Resolution",
+                    ),
+                ),
+                ("start", models.DateTimeField(db_column="StartTime")),
+                (
+                    "open",
+                    models.DecimalField(
+                        db_column="Open", decimal_places=2, max_digits=12
+                    ),
+                ),
+                (
+                    "high",
+                    models.DecimalField(
+                        db_column="High", decimal_places=2, max_digits=12
+                    ),
+                ),
+                (
+                    "low",
+                    models.DecimalField(
+                        db_column="Low", decimal_places=2, max_digits=12
+                    ),
+                ),
+                (
+                    "close",
+                    models.DecimalField(
+                        db_column="Close", decimal_places=2, max_digits=12
+                    ),
+                ),
+                ("tick_count", models.IntegerField(db_column="TickCount", default=0)),
+                (
+                    "stock",
+                    models.ForeignKey(
+                        db_column="StockID",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="candles",
+                        to="customer.stock",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "Candle",
+                "indexes": [
+                    models.Index(
+                        fields=["resolution", "start"],
+                        name="candle_resolution_start_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("stock", "resolution", "start"), name="unique_candle"
+                    )
+                ],
+            },
+        ),
+    ]
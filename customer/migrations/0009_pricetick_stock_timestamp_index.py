@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-17 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customer", "0008_candle"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="pricetick",
+            index=models.Index(
+                fields=["stock", "timestamp"], name="pricetick_stock_ts_idx"
+            ),
+        ),
+    ]
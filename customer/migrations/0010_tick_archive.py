@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-17 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customer", "0009_pricetick_stock_timestamp_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TickArchive",
+            fields=[
+                (
+                    "ArchiveID",
+                    models.BigAutoField(
+                        db_column="ArchiveID", primary_key=True, serialize=False
+                    ),
+                ),
+                ("month", models.DateField(db_column="Month", unique=True)),
+                ("table_name", models.CharField(db_column="TableName", max_length=64)),
+                ("row_count", models.BigIntegerField(db_column="RowCount", default=0)),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, db_column="CreatedAt"),
+                ),
+            ],
+            options={
+                "db_table": "TickArchive",
+                "ordering": ["month"],
+            },
+        ),
+    ]
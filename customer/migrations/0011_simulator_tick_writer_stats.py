@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-17 08:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customer", "0010_tick_archive"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="simulatorcontrol",
+            name="last_flush_ms",
+            field=models.FloatField(db_column="LastFlushMs", default=0),
+        ),
+        migrations.AddField(
+            model_name="simulatorcontrol",
+            name="queue_rows",
+            field=models.BigIntegerField(db_column="QueueRows", default=0),
+        ),
+        migrations.AddField(
+            model_name="simulatorcontrol",
+            name="write_rows_per_sec",
+            field=models.FloatField(db_column="WriteRowsPerSec", default=0),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.8 on 2026-10-17 08:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customer", "0011_simulator_tick_writer_stats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MarketHoliday",
+            fields=[
+                (
+                    "HolidayID",
+                    models.BigAutoField(
+                        db_column="HolidayID", primary_key=True, serialize=False
+                    ),
+                ),
+                ("date", models.DateField(db_column="Date", unique=True)),
+                ("name", models.CharField(db_column="Name", max_length=100)),
+                (
+                    "close_hour",
+                    models.IntegerField(blank=True, db_column="CloseHour", null=True),
+                ),
+                (
+                    "close_minute",
+                    models.IntegerField(blank=True, db_column="CloseMinute", null=True),
+                ),
+            ],
+            options={
+                "db_table": "MarketHoliday",
+                "ordering": ["date"],
+            },
+        ),
+        migrations.AddField(
+            model_name="marketschedule",
+            name="TimeZone",
+            field=models.CharField(db_column="TimeZone", default="UTC", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="marketschedule",
+            name="TradingDays",
+            field=models.CharField(
+                db_column="TradingDays", default="0123456", max_length=7
+            ),
+        ),
+    ]
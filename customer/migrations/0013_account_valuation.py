@@ -0,0 +1,64 @@
+# Generated by Django 5.2.8 on 2026-10-17 08:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def populate_valuations(apps, schema_editor):
+    BrokerageAccount = apps.get_model("customer", "BrokerageAccount")
+    AccountValuation = apps.get_model("customer", "AccountValuation")
+    Position = apps.get_model("customer", "Position")
+    values = dict(
+        Position.objects.values("account_id")
+        .annotate(value=Sum(F("quantity") * F("stock__current_price")))
+        .values_list("account_id", "value")
+    )
+    AccountValuation.objects.bulk_create(
+        [
+            AccountValuation(
+                account_id=account_id, market_value=values.get(account_id) or 0
+            )
+            for account_id in BrokerageAccount.objects.values_list("pk", flat=True)
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customer", "0012_market_calendar"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AccountValuation",
+            fields=[
+                (
+                    "account",
+                    models.OneToOneField(
+                        db_column="AccountID",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="valuation",
+                        serialize=False,
+                        to="customer.brokerageaccount",
+                    ),
+                ),
+                (
+                    "market_value",
+                    models.DecimalField(
+                        db_column="MarketValue",
+                        decimal_places=2,
+                        default=0,
+                        max_digits=16,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "AccountValuation",
+            },
+        ),
+        migrations.RunPython(populate_valuations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.8 on 2026-10-17 08:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customer", "0013_account_valuation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EquitySnapshot",
+            fields=[
+                (
+                    "SnapshotID",
+                    models.BigAutoField(
+                        db_column="SnapshotID", primary_key=True, serialize=False
+                    ),
+                ),
+                ("date", models.DateField(db_column="Date")),
+                (
+                    "cash",
+                    models.DecimalField(
+                        db_column="Cash", decimal_places=2, max_digits=16
+                    ),
+                ),
+                (
+                    "market_value",
+                    models.DecimalField(
+                        db_column="MarketValue", decimal_places=2, max_digits=16
+                    ),
+                ),
+                (
+                    "net_flow",
+                    models.DecimalField(
+                        db_column="NetFlow", decimal_places=2, default=0, max_digits=16
+                    ),
+                ),
+                (
+                    "account",
+                    models.ForeignKey(
+                        db_column="AccountID",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="equity_snapshots",
+                        to="customer.brokerageaccount",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "EquitySnapshot",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("account", "date"), name="unique_equity_snapshot"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 5.2.8 on 2026-10-17 08:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customer", "0014_equity_snapshot"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="lot_method",
+            field=models.CharField(
+                choices=[
+                    ("FIFO", "First in, first out"),
+                    ("LIFO", "Last in, first out"),
+                    ("HIFO", "Highest cost first"),
+                ],
+                db_column="LotMethod",
+                default="FIFO",
+                max_length=4,
+            ),
+        ),
+        migrations.AddField(
+            model_name="position",
+            name="cost_basis",
+            field=models.DecimalField(
+                db_column="CostBasis", decimal_places=2, default=0, max_digits=16
+            ),
+        ),
+        migrations.AddField(
+            model_name="position",
+            name="realized_pnl",
+            field=models.DecimalField(
+                db_column="RealizedPnL", decimal_places=2, default=0, max_digits=16
+            ),
+        ),
+        migrations.CreateModel(
+            name="TaxLot",
+            fields=[
+                (
+                    "LotID",
+                    models.BigAutoField(
+                        db_column="LotID", primary_key=True, serialize=False
+                    ),
+                ),
+                ("opened_at", models.DateTimeField(db_column="OpenedAt")),
+                ("quantity", models.BigIntegerField(db_column="Quantity")),
+                ("remaining", models.BigIntegerField(db_column="Remaining")),
+                (
+                    "cost_per_share",
+                    models.DecimalField(
+                        db_column="CostPerShare", decimal_places=2, max_digits=12
+                    ),
+                ),
+                (
+                    "account",
+                    models.ForeignKey(
+                        db_column="AccountID",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="tax_lots",
+                        to="customer.brokerageaccount",
+                    ),
+                ),
+                (
+                    "order",
+                    models.ForeignKey(
+                        blank=True,
+                        db_column="OrderID",
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="customer.order",
+                    ),
+                ),
+                (
+                    "stock",
+                    models.ForeignKey(
+                        db_column="StockID",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="customer.stock",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "TaxLot",
+                "indexes": [
+                    models.Index(
+                        fields=["account", "stock", "opened_at"],
+                        name="taxlot_account_stock_idx",
+                    )
+                ],
+            },
+        ),
+    ]
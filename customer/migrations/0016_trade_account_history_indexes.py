@@ -0,0 +1,61 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def populate_trade_accounts(apps, schema_editor):
+    Order = apps.get_model("customer", "Order")
+    Trade = apps.get_model("customer", "Trade")
+    Trade.objects.update(
+        account_id=Subquery(
+            Order.objects.filter(pk=OuterRef("order_id")).values("account_id")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customer", "0015_tax_lots"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trade",
+            name="account",
+            field=models.ForeignKey(
+                db_column="AccountID",
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="trades",
+                to="customer.brokerageaccount",
+            ),
+        ),
+        migrations.RunPython(populate_trade_accounts, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="trade",
+            name="account",
+            field=models.ForeignKey(
+                db_column="AccountID",
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="trades",
+                to="customer.brokerageaccount",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["account", "created_at", "OrderID"],
+                name="order_account_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="trade",
+            index=models.Index(
+                fields=["account", "executed_time", "TradeID"],
+                name="trade_account_time_idx",
+            ),
+        ),
+    ]
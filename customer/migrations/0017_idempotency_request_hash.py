@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customer", "0016_trade_account_history_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="idempotencykey",
+            name="request_hash",
+            field=models.CharField(db_column="RequestHash", default="", max_length=64),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 09:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customer", "0017_idempotency_request_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="candle",
+            name="close_epoch",
+            field=models.BigIntegerField(blank=True, db_column="CloseEpoch", null=True),
+        ),
+        migrations.AddField(
+            model_name="candle",
+            name="open_epoch",
+            field=models.BigIntegerField(blank=True, db_column="OpenEpoch", null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-17 14:10
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def value_current_positions(apps, schema_editor):
+    # Cached valuations already count every share held
+    Position = apps.get_model("customer", "Position")
+    Position.objects.update(valued_qty=F("quantity"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customer", "0018_candle_tick_epochs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="position",
+            name="valued_qty",
+            field=models.BigIntegerField(db_column="ValuedQuantity", default=0),
+        ),
+        migrations.RunPython(value_current_positions, migrations.RunPython.noop),
+    ]
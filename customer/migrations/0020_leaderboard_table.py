@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-17 09:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customer", "0019_position_valued_quantity"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Leaderboard",
+            fields=[
+                (
+                    "LeaderboardID",
+                    models.BigAutoField(
+                        db_column="LeaderboardID", primary_key=True, serialize=False
+                    ),
+                ),
+                ("board", models.JSONField(db_column="Board")),
+                ("computed_at", models.DateTimeField(db_column="ComputedAt")),
+            ],
+            options={
+                "db_table": "Leaderboard",
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 
 
@@ -20,7 +21,8 @@ class CustomUserManager(BaseUserManager):
         user.save(using=self._db)
         
         # Auto-create brokerage account
-        BrokerageAccount.objects.create(user=user, cash_balance=0.00)
+        account = BrokerageAccount.objects.create(user=user, cash_balance=0.00)
+        AccountValuation.objects.create(account=account)
         return user
     
     def create_superuser(self, UserName, email, FullName, Role, password=None, **extra_fields):
@@ -102,37 +104,137 @@ class Position(models.Model):
     account = models.ForeignKey(BrokerageAccount, on_delete=models.CASCADE, related_name='positions', db_column='AccountID')
     stock = models.ForeignKey(Stock, on_delete=models.CASCADE, db_column='StockID')
     quantity = models.BigIntegerField(db_column='Quantity')
+    # Shares counted in AccountValuation.market_value. Trades only change
+    # quantity; the price writers catch this up (customer/valuations.py).
+    valued_qty = models.BigIntegerField(default=0, db_column='ValuedQuantity')
+    # Running totals from the tax-lot ledger (customer/lots.py). A fully sold
+    # position is kept at quantity 0 so its realized P&L isn't lost.
+    cost_basis = models.DecimalField(max_digits=16, decimal_places=2, default=0, db_column='CostBasis')
+    realized_pnl = models.DecimalField(max_digits=16, decimal_places=2, default=0, db_column='RealizedPnL')
     
     class Meta:
         db_table = 'Position'
         unique_together = ('account', 'stock')
 
 
+class AccountValuation(models.Model):
+    # Materialized market value of the account's Position.valued_qty at
+    # current prices, kept up to date by the price writers (customer/valuations.py)
+    account = models.OneToOneField(
+        BrokerageAccount, on_delete=models.CASCADE, primary_key=True, related_name='valuation', db_column='AccountID'
+    )
+    market_value = models.DecimalField(max_digits=16, decimal_places=2, default=0, db_column='MarketValue')
+    
+    class Meta:
+        db_table = 'AccountValuation'
+    
+    @property
+    def equity(self):
+        return self.account.cash_balance + self.market_value
+    
+    def __str__(self):
+        return f"{self.account_id}: {self.market_value}"
+
+
+class EquitySnapshot(models.Model):
+    # End-of-day (UTC) cash and market value per account, replayed from
+    # trades, cash flows and daily candles by snapshot_equity (customer/performance.py)
+    SnapshotID = models.BigAutoField(primary_key=True, db_column='SnapshotID')
+    account = models.ForeignKey(BrokerageAccount, on_delete=models.CASCADE, related_name='equity_snapshots', db_column='AccountID')
+    date = models.DateField(db_column='Date')
+    cash = models.DecimalField(max_digits=16, decimal_places=2, db_column='Cash')
+    market_value = models.DecimalField(max_digits=16, decimal_places=2, db_column='MarketValue')
+    net_flow = models.DecimalField(max_digits=16, decimal_places=2, default=0, db_column='NetFlow')  # deposits - withdrawals
+    
+    class Meta:
+        db_table = 'EquitySnapshot'
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'date'], name='unique_equity_snapshot'),
+        ]
+    
+    @property
+    def equity(self):
+        return self.cash + self.market_value
+    
+    def __str__(self):
+        return f"{self.account_id} {self.date}: {self.equity}"
+
+
 class Order(models.Model):
     ORDER_ACTIONS = [('BUY', 'Buy'), ('SELL', 'Sell')]
+    ORDER_TYPES = [('MARKET', 'Market'), ('LIMIT', 'Limit')]
+    LOT_METHODS = [('FIFO', 'First in, first out'), ('LIFO', 'Last in, first out'), ('HIFO', 'Highest cost first')]
     
     OrderID = models.BigAutoField(primary_key=True, db_column='OrderID')
     account = models.ForeignKey(BrokerageAccount, on_delete=models.CASCADE, related_name='orders', db_column='AccountID')
     stock = models.ForeignKey(Stock, on_delete=models.CASCADE, db_column='StockID')
     action = models.CharField(max_length=10, choices=ORDER_ACTIONS, db_column='Action')
+    order_type = models.CharField(max_length=10, choices=ORDER_TYPES, default='MARKET', db_column='OrderType')
+    limit_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, db_column='LimitPrice')
     quantity = models.BigIntegerField(db_column='Quantity')
+    filled_qty = models.BigIntegerField(default=0, db_column='FilledQty')
     status = models.CharField(max_length=20, db_column='Status')
+    reject_reason = models.CharField(max_length=100, blank=True, default='', db_column='RejectReason')
+    lot_method = models.CharField(max_length=4, choices=LOT_METHODS, default='FIFO', db_column='LotMethod')  # sells only
     created_at = models.DateTimeField(auto_now_add=True, db_column='CreatedAt')
     executed_at = models.DateTimeField(null=True, blank=True, db_column='ExecutedAt')
     
     class Meta:
         db_table = 'Order'
+        indexes = [
+            # Rebuilding a ticker's book reads its resting limit orders
+            models.Index(fields=['stock', 'status'], name='order_stock_status_idx'),
+            # The order worker claims the oldest Pending orders
+            models.Index(fields=['status', 'OrderID'], name='order_status_idx'),
+            # Order history pages: one account's orders by (CreatedAt, OrderID)
+            models.Index(fields=['account', 'created_at', 'OrderID'], name='order_account_created_idx'),
+        ]
 
 
 class Trade(models.Model):
     TradeID = models.BigAutoField(primary_key=True, db_column='TradeID')
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='trades', db_column='OrderID')
+    # Copy of order.account, so an account's trades are read by index without joining Order
+    account = models.ForeignKey(BrokerageAccount, on_delete=models.CASCADE, related_name='trades', db_column='AccountID')
     executed_price = models.DecimalField(max_digits=12, decimal_places=2, db_column='ExecutedPrice')
     executed_qty = models.BigIntegerField(db_column='ExecutedQty')
     executed_time = models.DateTimeField(auto_now_add=True, db_column='ExecutedTime')
     
     class Meta:
         db_table = 'Trade'
+        indexes = [
+            # Trade history pages and replays: one account's trades by (ExecutedTime, TradeID)
+            models.Index(fields=['account', 'executed_time', 'TradeID'], name='trade_account_time_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        # bulk_create skips this, so bulk writers set account themselves
+        if self.account_id is None:
+            self.account_id = self.order.account_id
+        super().save(*args, **kwargs)
+
+
+class TaxLot(models.Model):
+    # Shares bought by one fill. Sells consume `remaining` from an account's
+    # lots in the sell order's lot_method order (customer/lots.py).
+    LotID = models.BigAutoField(primary_key=True, db_column='LotID')
+    account = models.ForeignKey(BrokerageAccount, on_delete=models.CASCADE, related_name='tax_lots', db_column='AccountID')
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, db_column='StockID')
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, db_column='OrderID')
+    opened_at = models.DateTimeField(db_column='OpenedAt')
+    quantity = models.BigIntegerField(db_column='Quantity')
+    remaining = models.BigIntegerField(db_column='Remaining')
+    cost_per_share = models.DecimalField(max_digits=12, decimal_places=2, db_column='CostPerShare')
+    
+    class Meta:
+        db_table = 'TaxLot'
+        indexes = [
+            # Sells read one account's open lots in a stock
+            models.Index(fields=['account', 'stock', 'opened_at'], name='taxlot_account_stock_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.account_id} {self.stock_id}: {self.remaining}/{self.quantity} @ {self.cost_per_share}"
 
 
 class Transaction(models.Model):
@@ -148,15 +250,37 @@ class Transaction(models.Model):
         db_table = 'Transaction'
 
 
+class IdempotencyKey(models.Model):
+    KeyID = models.BigAutoField(primary_key=True, db_column='KeyID')
+    account = models.ForeignKey(BrokerageAccount, on_delete=models.CASCADE, related_name='idempotency_keys', db_column='AccountID')
+    key = models.CharField(max_length=64, db_column='IdempotencyKey')
+    endpoint = models.CharField(max_length=30, db_column='Endpoint')
+    request_hash = models.CharField(max_length=64, default='', db_column='RequestHash')  # SHA-256 of method, path and body
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True, db_column='StatusCode')  # NULL only before the first response commits
+    response_body = models.JSONField(null=True, blank=True, db_column='ResponseBody')
+    created_at = models.DateTimeField(auto_now_add=True, db_column='CreatedAt')
+    expires_at = models.DateTimeField(db_column='ExpiresAt')
+    
+    class Meta:
+        db_table = 'IdempotencyKey'
+        unique_together = ('account', 'key')
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ]
+
+
 class PriceTick(models.Model):
     TickID = models.BigAutoField(primary_key=True, db_column='TickID')
     stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='price_ticks', db_column='StockID')
-    timestamp = models.DateTimeField(auto_now_add=True, db_column='Timestamp')
+    timestamp = models.DateTimeField(default=timezone.now, db_column='Timestamp')  # set explicitly by buffered writers
     price = models.DecimalField(max_digits=12, decimal_places=2, db_column='Price')
     
     class Meta:
         db_table = 'PriceTick'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['stock', 'timestamp'], name='pricetick_stock_ts_idx'),
+        ]
 
 
 class MarketSchedule(models.Model):
@@ -167,9 +291,162 @@ class MarketSchedule(models.Model):
     CloseHour = models.IntegerField(db_column='CloseHour')                 
     CloseMinute = models.IntegerField(db_column='CloseMinute')             
     Holiday = models.BooleanField(default=False, db_column='Holiday')      
+    # Hours above are local to TimeZone; TradingDays lists weekdays, 0=Monday
+    TimeZone = models.CharField(max_length=64, default='UTC', db_column='TimeZone')
+    TradingDays = models.CharField(max_length=7, default='0123456', db_column='TradingDays')
     
     class Meta:
         db_table = 'MarketSchedule'
     
     def __str__(self):
-        return f"Market {self.Status} ({self.OpenHour}:{self.OpenMinute:02d} - {self.CloseHour}:{self.CloseMinute:02d})"
\ No newline at end of file
+        return f"Market {self.Status} ({self.OpenHour}:{self.OpenMinute:02d} - {self.CloseHour}:{self.CloseMinute:02d})"
+
+
+class MarketHoliday(models.Model):
+    # A full-day closure, or an early close when CloseHour/CloseMinute are set
+    HolidayID = models.BigAutoField(primary_key=True, db_column='HolidayID')
+    date = models.DateField(unique=True, db_column='Date')
+    name = models.CharField(max_length=100, db_column='Name')
+    close_hour = models.IntegerField(null=True, blank=True, db_column='CloseHour')
+    close_minute = models.IntegerField(null=True, blank=True, db_column='CloseMinute')
+    
+    class Meta:
+        db_table = 'MarketHoliday'
+        ordering = ['date']
+    
+    @property
+    def early_close(self):
+        return self.close_hour is not None
+    
+    def __str__(self):
+        if self.early_close:
+            return f"{self.date} {self.name} (closes {self.close_hour}:{self.close_minute or 0:02d})"
+        return f"{self.date} {self.name}"
+
+
+class SimulatorControl(models.Model):
+    # Single row shared by the admin dashboard (desired state) and the
+    # run_market_simulator daemon (status and metrics)
+    DESIRED_STATES = [('RUNNING', 'Running'), ('STOPPED', 'Stopped')]
+    
+    SimulatorID = models.BigAutoField(primary_key=True, db_column='SimulatorID')
+    desired_state = models.CharField(max_length=10, choices=DESIRED_STATES, default='STOPPED', db_column='DesiredState')
+    interval_seconds = models.FloatField(default=5.0, db_column='IntervalSeconds')
+    volatility = models.FloatField(default=0.5, db_column='Volatility')
+    status = models.CharField(max_length=20, default='OFFLINE', db_column='Status')
+    heartbeat_at = models.DateTimeField(null=True, blank=True, db_column='HeartbeatAt')
+    last_tick_at = models.DateTimeField(null=True, blank=True, db_column='LastTickAt')
+    ticks_total = models.BigIntegerField(default=0, db_column='TicksTotal')
+    last_tick_lag_ms = models.FloatField(default=0, db_column='LastTickLagMs')
+    last_write_ms = models.FloatField(default=0, db_column='LastWriteMs')
+    # TickWriter buffer depth and flush performance
+    queue_rows = models.BigIntegerField(default=0, db_column='QueueRows')
+    last_flush_ms = models.FloatField(default=0, db_column='LastFlushMs')
+    write_rows_per_sec = models.FloatField(default=0, db_column='WriteRowsPerSec')
+    
+    class Meta:
+        db_table = 'SimulatorControl'
+    
+    @classmethod
+    def get(cls):
+        control, _ = cls.objects.get_or_create(SimulatorID=1)
+        return control
+
+
+class Leaderboard(models.Model):
+    # Single row holding the last computed equity leaderboard and AUM
+    # (customer/leaderboard.py), shared by every process
+    LeaderboardID = models.BigAutoField(primary_key=True, db_column='LeaderboardID')
+    board = models.JSONField(db_column='Board')
+    computed_at = models.DateTimeField(db_column='ComputedAt')
+    
+    class Meta:
+        db_table = 'Leaderboard'
+
+
+class StockPriceModel(models.Model):
+    # Per-stock stochastic model parameters used by generate_prices and the
+    # market simulator; stocks without a row use the command's --model with
+    # default parameters.
+    # Rates and volatilities are annualized (see customer/price_models.py).
+    MODELS = [
+        ('gbm', 'Geometric Brownian motion'),
+        ('mean_reverting', 'Mean-reverting (Ornstein-Uhlenbeck on log price)'),
+        ('jump_diffusion', 'Jump diffusion (Merton)'),
+    ]
+    
+    PriceModelID = models.BigAutoField(primary_key=True, db_column='PriceModelID')
+    stock = models.OneToOneField(Stock, on_delete=models.CASCADE, related_name='price_model', db_column='StockID')
+    model = models.CharField(max_length=20, choices=MODELS, default='gbm', db_column='Model')
+    drift = models.FloatField(null=True, blank=True, db_column='Drift')
+    volatility = models.FloatField(null=True, blank=True, db_column='Volatility')
+    mean_reversion = models.FloatField(null=True, blank=True, db_column='MeanReversion')
+    long_run_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, db_column='LongRunPrice')
+    jump_intensity = models.FloatField(null=True, blank=True, db_column='JumpIntensity')
+    jump_mean = models.FloatField(null=True, blank=True, db_column='JumpMean')
+    jump_volatility = models.FloatField(null=True, blank=True, db_column='JumpVolatility')
+    
+    class Meta:
+        db_table = 'StockPriceModel'
+    
+    def __str__(self):
+        return f"{self.stock.ticker}: {self.model}"
+
+
+class IdSequence(models.Model):
+    # Next unallocated ID of each named sequence; writers reserve blocks here
+    # instead of reading MAX() of the table they insert into
+    name = models.CharField(max_length=50, primary_key=True, db_column='SequenceName')
+    next_value = models.BigIntegerField(db_column='NextValue')
+    
+    class Meta:
+        db_table = 'IdSequence'
+    
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+
+class Candle(models.Model):
+    # OHLC rollup of PriceTick per stock at 1m/5m/1h/1d, folded in as ticks
+    # are written (customer/candles.py). tick_count stands in for volume.
+    RESOLUTIONS = [(60, '1m'), (300, '5m'), (3600, '1h'), (86400, '1d')]
+    
+    CandleID = models.BigAutoField(primary_key=True, db_column='CandleID')
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='candles', db_column='StockID')
+    resolution = models.IntegerField(choices=RESOLUTIONS, db_column='Resolution')  # seconds
+    start = models.DateTimeField(db_column='StartTime')
+    open = models.DecimalField(max_digits=12, decimal_places=2, db_column='Open')
+    high = models.DecimalField(max_digits=12, decimal_places=2, db_column='High')
+    low = models.DecimalField(max_digits=12, decimal_places=2, db_column='Low')
+    close = models.DecimalField(max_digits=12, decimal_places=2, db_column='Close')
+    # When the open and close ticks were taken (epoch seconds), so a batch
+    # folded late can't replace them with older or newer prices. NULL on
+    # candles folded before these were kept.
+    open_epoch = models.BigIntegerField(null=True, blank=True, db_column='OpenEpoch')
+    close_epoch = models.BigIntegerField(null=True, blank=True, db_column='CloseEpoch')
+    tick_count = models.IntegerField(default=0, db_column='TickCount')
+    
+    class Meta:
+        db_table = 'Candle'
+        constraints = [
+            models.UniqueConstraint(fields=['stock', 'resolution', 'start'], name='unique_candle'),
+        ]
+        indexes = [
+            models.Index(fields=['resolution', 'start'], name='candle_resolution_start_idx'),
+        ]
+
+
+class TickArchive(models.Model):
+    # One row per monthly PriceTick archive table created by prune_ticks
+    ArchiveID = models.BigAutoField(primary_key=True, db_column='ArchiveID')
+    month = models.DateField(unique=True, db_column='Month')  # first day of the month
+    table_name = models.CharField(max_length=64, db_column='TableName')
+    row_count = models.BigIntegerField(default=0, db_column='RowCount')
+    created_at = models.DateTimeField(auto_now_add=True, db_column='CreatedAt')
+    
+    class Meta:
+        db_table = 'TickArchive'
+        ordering = ['month']
+    
+    def __str__(self):
+        return self.table_name
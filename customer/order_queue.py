@@ -0,0 +1,120 @@
+"""
+DB-backed order intake queue.
+
+In queue mode the trade API only validates an order and stores it with status
+'Pending'. The `run_order_worker` command drains pending orders oldest first
+in micro-batches; each batch runs in one transaction so its writes are
+committed together. Each order runs in its own savepoint within it: an order
+that fails is rolled back alone and rejected, so it can't sink its batch and
+stay at the head of its shard's queue.
+"""
+import logging
+from django.db import transaction
+from django.db.models.functions import Mod
+from django.utils import timezone
+from .lots import close_lots, open_lot
+from .matching import engine as matching_engine
+from .models import BrokerageAccount, Order, Trade, Transaction
+from .trading import TradeError, debit_cash, credit_cash, add_shares, remove_shares
+from .utils import is_market_open
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_order(account, stock, side, quantity, order_type='MARKET', limit_price=None, lot_method='FIFO'):
+    """Store a validated order for the worker and return it"""
+    return Order.objects.create(
+        account=account,
+        stock=stock,
+        action=side,
+        order_type=order_type,
+        limit_price=limit_price,
+        quantity=quantity,
+        lot_method=lot_method,
+        status='Pending'
+    )
+
+
+def _fill_market_order(order, now, trades, transactions):
+    # Market orders fill at the price when the worker executes them
+    price = order.stock.current_price
+    total = price * order.quantity
+    account = BrokerageAccount(pk=order.account_id)
+
+    if order.action == 'BUY':
+        if not debit_cash(account, total):
+            raise TradeError("Insufficient funds")
+        add_shares(account, order.stock_id, order.quantity)
+        open_lot(account.pk, order.stock_id, order.quantity, price, order_id=order.pk, opened_at=now)
+    else:
+        if not remove_shares(account, order.stock_id, order.quantity):
+            raise TradeError("Not enough shares")
+        credit_cash(account, total)
+        close_lots(account.pk, order.stock_id, order.quantity, price, order.lot_method)
+
+    order.status = 'Filled'
+    order.filled_qty = order.quantity
+    order.executed_at = now
+    trades.append(Trade(order=order, account=account, executed_price=price, executed_qty=order.quantity))
+    transactions.append(Transaction(
+        account=account,
+        transaction_type='STOCK_TRADE' if order.action == 'BUY' else 'SELL',
+        amount=total
+    ))
+
+
+def execute_pending_orders(batch_size=100, shard=None, shard_key='stock'):
+    """
+    Execute up to `batch_size` pending orders in one transaction and return
+    how many were processed. Orders that can't be filled, or fail with an
+    unexpected error, are marked 'Rejected' with a reason.
+
+    `shard` is an (index, count) pair: only orders whose StockID (or
+    AccountID, with shard_key='account') falls in that partition are taken.
+    """
+    market_open, message = is_market_open()
+    now = timezone.now()
+    trades, transactions, done = [], [], []
+
+    with transaction.atomic():
+        pending = (
+            Order.objects.select_for_update(skip_locked=True)
+            .select_related('stock', 'account')
+            .filter(status='Pending')
+            .order_by('OrderID')
+        )
+        if shard is not None:
+            index, count = shard
+            column = 'stock_id' if shard_key == 'stock' else 'account_id'
+            pending = pending.alias(shard=Mod(column, count)).filter(shard=index)
+        pending = list(pending[:batch_size])
+
+        for order in pending:
+            try:
+                with transaction.atomic():
+                    if not market_open:
+                        raise TradeError(f"Trading not allowed: {message}")
+                    if order.order_type == 'LIMIT':
+                        # The engine updates the order row itself
+                        matching_engine.place(
+                            order.account, order.stock, order.action,
+                            order.quantity, order.limit_price, order=order
+                        )
+                        continue
+                    _fill_market_order(order, now, trades, transactions)
+            except TradeError as e:
+                order.status = 'Rejected'
+                order.reject_reason = e.message[:100]
+            except Exception:
+                # Only this order's savepoint rolled back; the batch goes on
+                logger.exception("Order %s failed to execute", order.pk)
+                order.status = 'Rejected'
+                order.reject_reason = 'Execution failed'
+            done.append(order)
+
+        if done:
+            Order.objects.bulk_update(done, ['status', 'filled_qty', 'executed_at', 'reject_reason'])
+        Trade.objects.bulk_create(trades)
+        Transaction.objects.bulk_create(transactions)
+
+    return len(pending)
@@ -0,0 +1,90 @@
+"""
+Keyset (cursor) pagination for history endpoints.
+
+Pages are ordered newest first on (timestamp, id), and the cursor is the
+last row's (timestamp, id). The next page is the rows strictly before it:
+
+    WHERE ts <= :ts AND (ts < :ts OR id < :id) ORDER BY ts DESC, id DESC LIMIT n
+
+With an index on (account, ts, id) that is one index range scan of n rows.
+Page 1,000 costs the same as page 1, unlike LIMIT/OFFSET, which reads and
+discards every row before the page. The ts <= :ts conjunct gives MySQL a
+range to seek to; the OR alone would not.
+
+Views set `keyset_fields = (timestamp field, id field)`.
+"""
+import base64
+import binascii
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def _page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def _decode(self, cursor):
+        try:
+            timestamp, pk = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii').split('|')
+            timestamp, pk = parse_datetime(timestamp), int(pk)
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound("Invalid cursor")
+        if timestamp is None:
+            raise NotFound("Invalid cursor")
+        return timestamp, pk
+
+    def _encode(self, timestamp, pk):
+        return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{pk}".encode('ascii')).decode('ascii')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        time_field, id_field = view.keyset_fields
+        self.request = request
+        size = self._page_size(request)
+
+        queryset = queryset.order_by(f'-{time_field}', f'-{id_field}')
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            timestamp, pk = self._decode(cursor)
+            queryset = queryset.filter(**{f'{time_field}__lte': timestamp}).filter(
+                Q(**{f'{time_field}__lt': timestamp}) | Q(**{f'{id_field}__lt': pk})
+            )
+
+        # One extra row tells whether there is a next page
+        rows = list(queryset[:size + 1])
+        self.next_cursor = None
+        if len(rows) > size:
+            rows = rows[:size]
+            last = rows[-1]
+            self.next_cursor = self._encode(getattr(last, time_field), last.pk)
+        return rows
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,243 @@
+"""
+Account equity curves and returns.
+
+snapshot_account() replays one account's history day by day (UTC days,
+matching the 1d candles) with array math. It does not loop over events.
+
+- Cash is the running sum of deposits, withdrawals and trade proceeds.
+- Holdings are the running sum of filled quantities, one column per stock.
+- Prices are the daily candle closes, forward-filled over days without
+  ticks and seeded with trade prices before a stock's first candle.
+
+Equity is cash plus holdings times prices. The result replaces the
+account's EquitySnapshot rows, one per day. Cash reserved by open limit
+orders still counts as equity: the replay only sees fills.
+
+snapshot_accounts() runs that over many accounts in a process pool; the
+snapshot_equity command is the nightly/on-demand entry point. Requests
+only read the stored snapshots: performance() turns a window of them into
+the equity curve, a time-weighted return (chained daily returns, which
+cancel out deposits and withdrawals) and a money-weighted return (the
+IRR of the flows, which doesn't).
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+import django
+import numpy as np
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import BrokerageAccount, Candle, EquitySnapshot, Order, Trade, Transaction
+
+DAY_SECONDS = 86400
+DEFAULT_CHUNK_ACCOUNTS = 50
+_EPOCH_DAY = date(1970, 1, 1).toordinal()
+
+
+def _day(timestamp):
+    """UTC day number (days since the epoch) of an aware datetime"""
+    return int(timestamp.timestamp()) // DAY_SECONDS
+
+
+def _date(day):
+    return date.fromordinal(_EPOCH_DAY + day)
+
+
+def _cents(values):
+    return np.fromiter((int(value * 100) for value in values), dtype=np.int64)
+
+
+def replay(account_id, end=None):
+    """
+    The account's daily history up to `end` (a date, default today) as
+    (dates, cash, market_value, net_flow), amounts in cents. None if the
+    account has no activity.
+    """
+    end_day = (end or timezone.now().date()).toordinal() - _EPOCH_DAY
+    flows = list(
+        Transaction.objects.filter(account_id=account_id, transaction_type__in=['DEPOSIT', 'WITHDRAW'])
+        .values_list('created_at', 'transaction_type', 'amount')
+    )
+    fills = list(
+        Trade.objects.filter(account_id=account_id)
+        .values_list('executed_time', 'order__stock_id', 'order__action', 'executed_qty', 'executed_price')
+    )
+    starts = [_day(row[0]) for row in flows] + [_day(row[0]) for row in fills]
+    if not starts or min(starts) > end_day:
+        return None
+    first_day = min(starts)
+    days = end_day - first_day + 1
+
+    net_flow = np.zeros(days, dtype=np.int64)
+    if flows:
+        flow_days = np.array([_day(row[0]) for row in flows], dtype=np.int64) - first_day
+        sign = np.array([1 if row[1] == 'DEPOSIT' else -1 for row in flows], dtype=np.int64)
+        keep = flow_days < days
+        np.add.at(net_flow, flow_days[keep], (sign * _cents(row[2] for row in flows))[keep])
+    cash = net_flow.copy()
+    market_value = np.zeros(days, dtype=np.int64)
+
+    if fills:
+        fill_days = np.array([_day(row[0]) for row in fills], dtype=np.int64) - first_day
+        keep = fill_days < days
+        fill_days = fill_days[keep]
+        stocks, column = np.unique(np.array([row[1] for row in fills], dtype=np.int64)[keep], return_inverse=True)
+        signed_qty = np.array(
+            [row[3] if row[2] == 'BUY' else -row[3] for row in fills], dtype=np.int64
+        )[keep]
+        fill_cents = _cents(row[4] for row in fills)[keep]
+        np.add.at(cash, fill_days, -signed_qty * fill_cents)
+
+        holdings = np.zeros((days, len(stocks)), dtype=np.int64)
+        np.add.at(holdings, (fill_days, column), signed_qty)
+        np.cumsum(holdings, axis=0, out=holdings)
+
+        # Trade prices first, so daily closes overwrite them wherever a candle exists
+        prices = np.full((days, len(stocks)), np.nan)
+        prices[fill_days, column] = fill_cents
+        candles = Candle.objects.filter(
+            stock_id__in=stocks.tolist(),
+            resolution=DAY_SECONDS,
+            start__gte=datetime.fromtimestamp(first_day * DAY_SECONDS, tz=dt_timezone.utc),
+            start__lte=datetime.fromtimestamp(end_day * DAY_SECONDS, tz=dt_timezone.utc),
+        ).values_list('start', 'stock_id', 'close')
+        rows = list(candles)
+        if rows:
+            prices[
+                np.array([_day(row[0]) for row in rows], dtype=np.int64) - first_day,
+                np.searchsorted(stocks, np.array([row[1] for row in rows], dtype=np.int64))
+            ] = _cents(row[2] for row in rows)
+
+        # Forward-fill each column from its last known price
+        known = np.where(np.isnan(prices), 0, np.arange(days)[:, None])
+        np.maximum.accumulate(known, axis=0, out=known)
+        prices = np.nan_to_num(prices[known, np.arange(len(stocks))])
+        market_value = np.rint((holdings * prices).sum(axis=1)).astype(np.int64)
+
+    np.cumsum(cash, out=cash)
+    dates = [_date(first_day + i) for i in range(days)]
+    return dates, cash, market_value, net_flow
+
+
+def snapshot_account(account_id, end=None):
+    """Replace the account's snapshots with a fresh replay. Returns the number of days written."""
+    history = replay(account_id, end)
+    with transaction.atomic():
+        EquitySnapshot.objects.filter(account_id=account_id).delete()
+        if history is None:
+            return 0
+        dates, cash, market_value, net_flow = history
+        to_decimal = lambda cents: Decimal(cents).scaleb(-2)
+        EquitySnapshot.objects.bulk_create([
+            EquitySnapshot(
+                account_id=account_id, date=day, cash=to_decimal(c), market_value=to_decimal(m), net_flow=to_decimal(f)
+            )
+            for day, c, m, f in zip(dates, cash.tolist(), market_value.tolist(), net_flow.tolist())
+        ], batch_size=1000)
+    return len(dates)
+
+
+def _snapshot_chunk(account_ids, end):
+    try:
+        return sum(snapshot_account(account_id, end) for account_id in account_ids)
+    finally:
+        connections.close_all()
+
+
+def snapshot_accounts(account_ids=None, end=None, workers=1, chunk=DEFAULT_CHUNK_ACCOUNTS, log=None):
+    """
+    Snapshot many accounts (default: every account with activity), `chunk`
+    accounts per task across `workers` processes. Returns (accounts, days written).
+    """
+    if account_ids is None:
+        account_ids = list(
+            BrokerageAccount.objects.filter(
+                Q(pk__in=Order.objects.values('account_id')) | Q(pk__in=Transaction.objects.values('account_id'))
+            ).values_list('pk', flat=True)
+        )
+    account_ids = sorted(account_ids)
+    chunks = [account_ids[i:i + chunk] for i in range(0, len(account_ids), chunk)]
+
+    written = 0
+    if workers <= 1:
+        for done, ids in enumerate(chunks, 1):
+            written += sum(snapshot_account(account_id, end) for account_id in ids)
+            if log:
+                log(f"{min(done * chunk, len(account_ids)):,}/{len(account_ids):,} accounts")
+        return len(account_ids), written
+
+    # Children must open their own connections, not share the parent's.
+    # django.setup() covers platforms that spawn rather than fork workers.
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+        for done, days in enumerate(pool.map(_snapshot_chunk, chunks, [end] * len(chunks)), 1):
+            written += days
+            if log:
+                log(f"{min(done * chunk, len(account_ids)):,}/{len(account_ids):,} accounts")
+    return len(account_ids), written
+
+
+def time_weighted_return(equity, net_flow):
+    """Chained daily returns, with each day's flow counted at the start of the day"""
+    if len(equity) < 2:
+        return None
+    base = equity[:-1] + net_flow[1:]
+    daily = np.divide(equity[1:], base, out=np.ones(len(base)), where=base > 0)
+    return float(np.prod(daily) - 1)
+
+
+def money_weighted_return(days, equity, net_flow, iterations=100):
+    """
+    IRR: the rate at which the starting equity and each later flow, grown
+    to the end, equal the final equity. Annualized for windows of a year or
+    more; shorter windows get the rate over the window itself, since
+    annualizing a few days' return overstates it wildly. None if undefined.
+    """
+    if len(equity) < 2:
+        return None
+    # Investor's view: money in is negative, the final equity comes back out
+    flows = -net_flow.astype(np.float64)
+    flows[0] = -equity[0]
+    flows[-1] += equity[-1]
+    years = (days - days[0]) / 365.0
+    if not (flows < 0).any() or not (flows > 0).any():
+        return None
+
+    npv = lambda rate: (flows * (1 + rate) ** -years).sum()
+    # Bisection on a bracket that holds the root for any realistic return
+    low, high = -0.9999, 100.0
+    if npv(low) * npv(high) > 0:
+        return None
+    for _ in range(iterations):
+        mid = (low + high) / 2
+        if npv(low) * npv(mid) <= 0:
+            high = mid
+        else:
+            low = mid
+    rate = (low + high) / 2
+    return float(rate if years[-1] >= 1 else (1 + rate) ** years[-1] - 1)
+
+
+def performance(account, start=None, end=None):
+    """Equity curve and returns over the stored snapshots between start and end (dates)"""
+    snapshots = account.equity_snapshots.order_by('date')
+    if start is not None:
+        snapshots = snapshots.filter(date__gte=start)
+    if end is not None:
+        snapshots = snapshots.filter(date__lte=end)
+    rows = list(snapshots.values_list('date', 'cash', 'market_value', 'net_flow'))
+    if not rows:
+        return {'points': [], 'time_weighted_return': None, 'money_weighted_return': None, 'as_of': None}
+
+    days = np.array([row[0].toordinal() for row in rows], dtype=np.float64)
+    equity = np.array([float(row[1] + row[2]) for row in rows])
+    net_flow = np.array([float(row[3]) for row in rows])
+    twr = time_weighted_return(equity, net_flow)
+    mwr = money_weighted_return(days, equity, net_flow)
+    return {
+        'points': [[row[0].isoformat(), str(row[1] + row[2])] for row in rows],
+        'time_weighted_return': None if twr is None else round(twr, 6),
+        'money_weighted_return': None if mwr is None else round(mwr, 6),
+        'as_of': rows[-1][0].isoformat(),
+    }
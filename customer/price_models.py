@@ -0,0 +1,150 @@
+"""
+Stochastic price models for generate_prices and the market simulator.
+
+A model moves an array of float prices (one per stock) forward by dt years.
+Parameters are scalars or per-stock arrays; rates and volatilities are
+annualized over a 252-day, 6.5-hour trading year, so the same parameters
+work for a single live tick or a backfill at any interval.
+
+MarketModel applies a different model to each group of stocks, built from
+the StockPriceModel rows.
+"""
+import numpy as np
+from .models import StockPriceModel
+
+SECONDS_PER_TRADING_YEAR = 252 * 6.5 * 3600
+MIN_PRICE = 0.01
+
+
+class PriceModel:
+    name = None
+    defaults = {}
+
+    def __init__(self, **params):
+        for name, default in self.defaults.items():
+            value = params.get(name)
+            setattr(self, name, np.asarray(default if value is None else value, dtype=np.float64))
+
+    def step(self, price, dt, rng):
+        """Prices after dt years"""
+        raise NotImplementedError
+
+    def path(self, price, dt, steps, rng):
+        """A (steps, len(price)) array of consecutive prices"""
+        out = np.empty((steps, len(price)))
+        for i in range(steps):
+            price = out[i] = self.step(price, dt, rng)
+        return out
+
+
+class Uniform(PriceModel):
+    # The original generate_prices noise: up to +/- max_change per tick, whatever dt is
+    name = 'uniform'
+    defaults = {'max_change': 0.005}
+
+    def step(self, price, dt, rng):
+        change = rng.uniform(-1.0, 1.0, len(price)) * self.max_change
+        return np.maximum(price * (1.0 + change), MIN_PRICE)
+
+
+class GBM(PriceModel):
+    name = 'gbm'
+    defaults = {'drift': 0.05, 'volatility': 0.30}
+
+    def _log_returns(self, n, dt, steps, rng):
+        drift = (self.drift - 0.5 * self.volatility ** 2) * dt
+        return drift + self.volatility * np.sqrt(dt) * rng.standard_normal((steps, n))
+
+    def step(self, price, dt, rng):
+        return price * np.exp(self._log_returns(len(price), dt, 1, rng)[0])
+
+    def path(self, price, dt, steps, rng):
+        # Independent increments, so the whole path is one cumulative sum
+        return price * np.exp(np.cumsum(self._log_returns(len(price), dt, steps, rng), axis=0))
+
+
+class JumpDiffusion(GBM):
+    # Merton: GBM plus Poisson jumps with normally distributed log size.
+    # The drift is compensated so jumps don't change the expected return.
+    name = 'jump_diffusion'
+    defaults = {
+        'drift': 0.05,
+        'volatility': 0.25,
+        'jump_intensity': 10.0,  # jumps per year
+        'jump_mean': -0.02,
+        'jump_volatility': 0.05,
+    }
+
+    def _log_returns(self, n, dt, steps, rng):
+        expected_jump = np.exp(self.jump_mean + 0.5 * self.jump_volatility ** 2) - 1.0
+        drift = (self.drift - self.jump_intensity * expected_jump - 0.5 * self.volatility ** 2) * dt
+        diffusion = self.volatility * np.sqrt(dt) * rng.standard_normal((steps, n))
+        # The sum of k normal jumps is N(k * mean, k * var)
+        jumps = rng.poisson(np.broadcast_to(self.jump_intensity * dt, (steps, n)))
+        jump_size = jumps * self.jump_mean + np.sqrt(jumps) * self.jump_volatility * rng.standard_normal((steps, n))
+        return drift + diffusion + jump_size
+
+
+class MeanReverting(PriceModel):
+    # Ornstein-Uhlenbeck on log price, pulled towards long_run_price at
+    # mean_reversion per year. Uses the exact discretization, so any dt is stable.
+    name = 'mean_reverting'
+    defaults = {'mean_reversion': 5.0, 'volatility': 0.30, 'long_run_price': 100.0}
+
+    def step(self, price, dt, rng):
+        decay = np.exp(-self.mean_reversion * dt)
+        noise = self.volatility * np.sqrt((1.0 - decay ** 2) / (2.0 * self.mean_reversion))
+        mean = np.log(self.long_run_price)
+        log_price = mean + (np.log(price) - mean) * decay + noise * rng.standard_normal(len(price))
+        return np.exp(log_price)
+
+
+MODELS = {model.name: model for model in (Uniform, GBM, JumpDiffusion, MeanReverting)}
+
+
+class MarketModel:
+    def __init__(self, groups):
+        # [(stock indices, PriceModel)]
+        self.groups = groups
+
+    @classmethod
+    def for_stocks(cls, stocks, default_model='uniform', **default_params):
+        """
+        One model per group of stocks: each stock's StockPriceModel row if it
+        has one, otherwise `default_model` with `default_params`. Unset row
+        fields fall back to the model defaults; long_run_price falls back to
+        the stock's initial price.
+        """
+        rows = {row.stock_id: row for row in StockPriceModel.objects.all()}
+        members = {}
+        for i, stock in enumerate(stocks):
+            row = rows.get(stock.pk)
+            members.setdefault(row.model if row else default_model, []).append((i, stock, row))
+
+        groups = []
+        for name, group in members.items():
+            model_class = MODELS[name]
+            params = {}
+            for param, default in model_class.defaults.items():
+                values = []
+                for _, stock, row in group:
+                    value = getattr(row, param, None) if row else default_params.get(param)
+                    if value is None and param == 'long_run_price':
+                        value = stock.initial_price
+                    values.append(default if value is None else float(value))
+                params[param] = values
+            indices = np.fromiter((i for i, _, _ in group), dtype=np.int64, count=len(group))
+            groups.append((indices, model_class(**params)))
+        return cls(groups)
+
+    def step(self, price, dt, rng):
+        out = np.empty_like(price, dtype=np.float64)
+        for indices, model in self.groups:
+            out[indices] = model.step(price[indices], dt, rng)
+        return np.maximum(out, MIN_PRICE, out=out)
+
+    def path(self, price, dt, steps, rng):
+        out = np.empty((steps, len(price)))
+        for indices, model in self.groups:
+            out[:, indices] = model.path(price[indices], dt, steps, rng)
+        return np.maximum(out, MIN_PRICE, out=out)
@@ -0,0 +1,241 @@
+"""
+Real-time quote streaming.
+
+The hub (QuoteHub) is an in-process pub/sub keyed by StockID. Every
+streaming client (Server-Sent Events at /api/v1/stream/quotes/) holds a
+Subscription to a few tickers. Publishing a batch of quotes forwards only
+the ones that changed, to the subscribers of those stocks.
+
+Quotes reach the hub two ways:
+
+- Writers in this process (generate_prices run from the admin API) call
+  publish_quotes() after their transaction commits.
+- Writers in other processes (run_market_simulator, generate_prices from
+  the shell) are picked up by QuoteFeed, one thread per process. It polls
+  the quote version row (customer/quotes.py), which every price write
+  bumps in its own transaction, and re-reads the subscribed stocks
+  whenever the version moves. This stands in for a broker: one
+  primary-key read per poll, and one indexed query per price write no
+  matter how many clients are connected.
+
+The stream is an async generator, so it is only served under ASGI
+(investr.asgi); the view answers 501 under WSGI.
+
+Updates are coalesced: a subscription keeps only the latest quote per
+stock until its client is ready for more. A slow client therefore gets the
+current price on its next send, never a backlog, and memory per client is
+bounded by the number of tickers it follows.
+"""
+import asyncio
+import json
+import threading
+import time
+from django.conf import settings
+from django.db import connection, transaction
+from .models import Stock
+from .quotes import quote_version
+from .valuations import IN_LIST_LIMIT
+
+
+def quote(ticker, price, day_high, day_low, ts=None):
+    return {
+        'ticker': ticker,
+        'price': str(price),
+        'day_high': str(day_high),
+        'day_low': str(day_low),
+        'ts': round(ts or time.time(), 3),
+    }
+
+
+def _same(a, b):
+    return a['price'] == b['price'] and a['day_high'] == b['day_high'] and a['day_low'] == b['day_low']
+
+
+class Subscription:
+    """One client's tickers and its coalesced, not yet delivered quotes"""
+
+    def __init__(self, stock_ids, loop):
+        self.stock_ids = frozenset(stock_ids)
+        self.loop = loop
+        self.event = asyncio.Event()
+        self.pending = {}
+        self.signalled = False
+        # Updates replaced by a newer quote before the client took them
+        self.coalesced = 0
+
+
+class QuoteHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # StockID -> set of Subscriptions
+        self._last = {}  # StockID -> last quote published, for subscribed stocks only
+
+    def active(self):
+        return bool(self._subscribers)
+
+    def subscribed_ids(self):
+        with self._lock:
+            return list(self._subscribers)
+
+    def subscribe(self, initial, loop):
+        """Subscribe to the stocks in `initial` ({StockID: quote}, what the client was sent first)"""
+        subscription = Subscription(initial, loop)
+        with self._lock:
+            for stock_id, current in initial.items():
+                self._subscribers.setdefault(stock_id, set()).add(subscription)
+                self._last.setdefault(stock_id, current)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for stock_id in subscription.stock_ids:
+                subscribers = self._subscribers.get(stock_id)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    # Nobody watches it: forget its last quote, which would go stale
+                    del self._subscribers[stock_id]
+                    self._last.pop(stock_id, None)
+
+    def publish(self, quotes):
+        """
+        Forward the quotes ({StockID: quote}) that changed to their
+        subscribers. Safe to call from any thread. Returns the number of
+        subscriptions woken.
+        """
+        wake = []
+        with self._lock:
+            for stock_id, current in quotes.items():
+                subscribers = self._subscribers.get(stock_id)
+                if not subscribers:
+                    continue
+                last = self._last.get(stock_id)
+                if last is not None and _same(last, current):
+                    continue
+                self._last[stock_id] = current
+                for subscription in subscribers:
+                    if stock_id in subscription.pending:
+                        subscription.coalesced += 1
+                    subscription.pending[stock_id] = current
+                    if not subscription.signalled:
+                        subscription.signalled = True
+                        wake.append(subscription)
+        for subscription in wake:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.event.set)
+            except RuntimeError:
+                # Its event loop has closed; the stream's cleanup unsubscribes it
+                pass
+        return len(wake)
+
+    def drain(self, subscription):
+        """Take the subscription's pending quotes (latest per stock)"""
+        with self._lock:
+            pending, subscription.pending = subscription.pending, {}
+            subscription.signalled = False
+            subscription.event.clear()
+        return pending
+
+
+hub = QuoteHub()
+
+
+def load_quotes(stock_ids=None, tickers=None):
+    """{StockID: quote} read from the Stock table"""
+    stocks = Stock.objects.values_list('StockID', 'ticker', 'current_price', 'day_high', 'day_low')
+    if tickers is not None:
+        stocks = stocks.filter(ticker__in=tickers)
+    elif stock_ids is not None and len(stock_ids) <= IN_LIST_LIMIT:
+        stocks = stocks.filter(pk__in=stock_ids)
+    now = time.time()
+    return {row[0]: quote(*row[1:], ts=now) for row in stocks}
+
+
+def publish_quotes(stocks):
+    """Publish the given Stock instances' prices once the current transaction commits"""
+    if not hub.active():
+        return
+    watched = set(hub.subscribed_ids())
+    now = time.time()
+    quotes = {
+        stock.pk: quote(stock.ticker, stock.current_price, stock.day_high, stock.day_low, ts=now)
+        for stock in stocks if stock.pk in watched
+    }
+    if quotes:
+        transaction.on_commit(lambda: hub.publish(quotes))
+
+
+class QuoteFeed(threading.Thread):
+    """Publishes price writes from other processes by watching the quote version row"""
+
+    def __init__(self, hub, interval):
+        super().__init__(name='quote-feed', daemon=True)
+        self.hub = hub
+        self.interval = interval
+        self.version = None
+        self.polled = set()
+
+    def poll(self):
+        watched = set(self.hub.subscribed_ids())
+        if not watched:
+            self.polled = set()
+            return
+        version = quote_version()
+        # Stocks subscribed since the last read are read even without a new
+        # version, in case they moved between the client's snapshot and now
+        if version == self.version and watched <= self.polled:
+            return
+        quotes = load_quotes(stock_ids=list(watched))
+        self.version, self.polled = version, watched
+        self.hub.publish(quotes)
+
+    def run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception:
+                # Database hiccup: drop the connection and retry next poll
+                connection.close()
+            time.sleep(self.interval)
+
+
+_feed = None
+_feed_lock = threading.Lock()
+
+
+def ensure_feed():
+    """Start this process's QuoteFeed, once"""
+    global _feed
+    with _feed_lock:
+        if _feed is None:
+            _feed = QuoteFeed(hub, settings.QUOTE_STREAM_POLL_INTERVAL)
+            _feed.start()
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+async def quote_events(initial, quote_hub=None, heartbeat=None):
+    """
+    Server-Sent Events for one client: a snapshot of `initial` ({StockID:
+    quote}), then each batch of changed quotes as it's published, with a
+    comment line every `heartbeat` seconds to keep idle connections open.
+    """
+    quote_hub = quote_hub or hub
+    heartbeat = heartbeat or settings.QUOTE_STREAM_HEARTBEAT
+    subscription = quote_hub.subscribe(initial, asyncio.get_running_loop())
+    try:
+        yield sse('snapshot', list(initial.values()))
+        while True:
+            try:
+                await asyncio.wait_for(subscription.event.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            batch = quote_hub.drain(subscription)
+            if batch:
+                yield sse('quotes', list(batch.values()))
+    finally:
+        quote_hub.unsubscribe(subscription)
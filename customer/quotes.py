@@ -0,0 +1,66 @@
+"""
+Quote version and cached stock list.
+
+The quote version is an IdSequence row ('quote_version'). Every write
+that changes stocks bumps it inside its own transaction:
+- PriceArrays.save() (the simulator and generate_prices);
+- generate_prices' per-stock loop;
+- admin_create_stock_api.
+
+The new version therefore commits together with the prices, and every
+process reads the same number however the cache is configured.
+Reading it is one primary-key lookup.
+
+Renderings of the stock list are cached under the version they were built
+for: the /api/v1/stocks/ JSON and the buy page's <option> list. A poll
+whose If-None-Match names the current version gets a 304. A poll with an
+old or missing ETag gets the cached bytes. Neither touches the Stock
+table or a serializer; only the first request per process after a bump
+does. The version is read before the stocks, so a rendering is never
+older than the version it's stored under.
+
+A missing row (a fresh database) starts from the current time in
+nanoseconds. It can't come back as a number an old ETag was built for.
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags
+from .sequences import allocate, current
+
+QUOTE_SEQUENCE = 'quote_version'
+
+
+def quote_version():
+    """The current quote version, starting one if there's none"""
+    return current(QUOTE_SEQUENCE, initial=time.time_ns)
+
+
+def quotes_changed():
+    """Bump the quote version as part of the current transaction"""
+    allocate(QUOTE_SEQUENCE, 1, initial=time.time_ns)
+
+
+def etag(version):
+    return f'"q{version}"'
+
+
+def etag_matches(if_none_match, tag):
+    """
+    Whether an If-None-Match header names `tag`. Each entity tag is compared
+    whole; weak (W/) tags match their strong form, and * matches anything.
+    """
+    etags = parse_etags(if_none_match or '')
+    if etags == ['*']:
+        return True
+    return any(candidate.removeprefix('W/') == tag for candidate in etags)
+
+
+def cached_rendering(name, version, render):
+    """`render()` for this quote version, computed once per version per cache"""
+    key = f'{name}:{version}'
+    content = cache.get(key)
+    if content is None:
+        content = render()
+        cache.set(key, content, settings.QUOTE_CACHE_TTL)
+    return content
@@ -0,0 +1,191 @@
+"""
+PriceTick retention.
+
+The hot PriceTick table keeps full-resolution ticks for
+TICK_RETENTION_DAYS. prune_ticks then moves older ticks out, keeping only
+the last tick per stock in each TICK_DOWNSAMPLE_SECONDS bucket. Those go
+into one archive table per month (PriceTickArchive_YYYYMM), listed in
+TickArchive. Once a whole month is older than TICK_ARCHIVE_MONTHS, its
+table is dropped, which is much cheaper than deleting its rows.
+
+Work is done one stock and one bounded chunk at a time on the
+(StockID, Timestamp) index. A chunk always ends on a bucket boundary, so
+each bucket is archived exactly once. Buckets must divide a day, so none
+straddles the midnight cutoff and gets archived again by the next day's
+run. Each chunk copies and deletes in its own short transaction, so locks
+are brief. The hot table itself records the progress:
+an interrupted run just picks up again.
+
+Candles aren't touched; charts over old windows keep reading them.
+"""
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.utils import timezone
+from .models import PriceTick, Stock, TickArchive
+
+DEFAULT_BATCH_SIZE = 5000
+DAY_SECONDS = 86400
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def archive_table_name(month):
+    return f"{PriceTick._meta.db_table}Archive_{month:%Y%m}"
+
+
+def _midnight(day):
+    return datetime.combine(day, datetime.min.time(), tzinfo=dt_timezone.utc)
+
+
+def _archive_table(month, cache):
+    """Table name for `month`, creating the table the first time it's needed"""
+    month = month_start(month)
+    if month in cache:
+        return cache[month]
+    archive = TickArchive.objects.filter(month=month).first()
+    if archive is None:
+        table = archive_table_name(month)
+        quote = connection.ops.quote_name
+        bigint = models.BigIntegerField().db_type(connection)
+        field_type = lambda name: PriceTick._meta.get_field(name).db_type(connection)
+        column = lambda name: quote(PriceTick._meta.get_field(name).column)
+        # No registry row means nothing was ever archived here; clear any half-created table
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {quote(table)}")
+            cursor.execute(
+                f"CREATE TABLE {quote(table)} ("
+                f"{column('TickID')} {bigint} NOT NULL PRIMARY KEY, "
+                f"{column('stock')} {bigint} NOT NULL, "
+                f"{column('timestamp')} {field_type('timestamp')} NOT NULL, "
+                f"{column('price')} {field_type('price')} NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX {quote(table + '_stock_ts')} ON {quote(table)} "
+                f"({column('stock')}, {column('timestamp')})"
+            )
+        archive = TickArchive.objects.create(month=month, table_name=table)
+    cache[month] = archive.table_name
+    return archive.table_name
+
+
+def _downsample(rows, bucket_seconds):
+    """Last tick of each bucket from (TickID, timestamp, price) rows in time order"""
+    kept = []
+    for row in rows:
+        bucket = int(row[1].timestamp()) // bucket_seconds
+        if kept and int(kept[-1][1].timestamp()) // bucket_seconds == bucket:
+            kept[-1] = row
+        else:
+            kept.append(row)
+    return kept
+
+
+def _prune_chunk(stock_id, archive_before, expire_before, batch_size, bucket_seconds, tables):
+    """Archive and delete one chunk of one stock's old ticks. Returns (read, archived)."""
+    ticks = (
+        PriceTick.objects.filter(stock_id=stock_id, timestamp__lt=archive_before)
+        .order_by('timestamp', 'TickID')
+        .values_list('TickID', 'timestamp', 'price')
+    )
+    rows = list(ticks[:batch_size])
+    if not rows:
+        return 0, 0
+
+    if len(rows) == batch_size:
+        # Only whole buckets are downsampled, or one bucket split across
+        # chunks would be archived once per chunk. Leave the trailing bucket
+        # for the next chunk; if it's the only one, read the rest of it now.
+        last_bucket = int(rows[-1][1].timestamp()) // bucket_seconds
+        complete = [row for row in rows if int(row[1].timestamp()) // bucket_seconds < last_bucket]
+        if complete:
+            rows = complete
+        else:
+            bucket_end = datetime.fromtimestamp((last_bucket + 1) * bucket_seconds, tz=dt_timezone.utc)
+            rows = list(ticks.filter(timestamp__lt=min(bucket_end, archive_before)))
+
+    # Months past the archive window are deleted without being copied
+    keep = _downsample([row for row in rows if row[1] >= expire_before], bucket_seconds)
+    by_table = {}
+    for tick_id, timestamp, price in keep:
+        by_table.setdefault(_archive_table(timestamp.date(), tables), []).append(
+            (tick_id, stock_id, connection.ops.adapt_datetimefield_value(timestamp), price)
+        )
+
+    quote = connection.ops.quote_name
+    columns = ', '.join(
+        quote(PriceTick._meta.get_field(name).column) for name in ('TickID', 'stock', 'timestamp', 'price')
+    )
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for table, values in by_table.items():
+                cursor.executemany(
+                    f"INSERT INTO {quote(table)} ({columns}) VALUES (%s, %s, %s, %s)",
+                    [(tick_id, stock, ts, str(price)) for tick_id, stock, ts, price in values]
+                )
+        PriceTick.objects.filter(TickID__in=[row[0] for row in rows]).delete()
+        for table, values in by_table.items():
+            TickArchive.objects.filter(table_name=table).update(row_count=models.F('row_count') + len(values))
+    return len(rows), len(keep)
+
+
+def drop_expired_archives(expire_before):
+    """Drop whole archive tables for months before `expire_before`. Returns the table names."""
+    dropped = []
+    for archive in TickArchive.objects.filter(month__lt=expire_before):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {connection.ops.quote_name(archive.table_name)}")
+        archive.delete()
+        dropped.append(archive.table_name)
+    return dropped
+
+
+def prune_ticks(keep_days=None, archive_months=None, batch_size=DEFAULT_BATCH_SIZE,
+                bucket_seconds=None, max_seconds=None, pause=0.0, log=None):
+    """
+    Apply the retention policy. Stops early after `max_seconds`; run again to
+    continue. Sleeps `pause` seconds between chunks to let other writers in.
+    Returns a dict of counts. Raises ValueError unless `bucket_seconds`
+    (default TICK_DOWNSAMPLE_SECONDS) divides a day.
+    """
+    keep_days = settings.TICK_RETENTION_DAYS if keep_days is None else keep_days
+    archive_months = settings.TICK_ARCHIVE_MONTHS if archive_months is None else archive_months
+    bucket_seconds = bucket_seconds or settings.TICK_DOWNSAMPLE_SECONDS
+    if bucket_seconds <= 0 or DAY_SECONDS % bucket_seconds:
+        raise ValueError(f"TICK_DOWNSAMPLE_SECONDS must divide {DAY_SECONDS}, not {bucket_seconds}")
+    started = time.monotonic()
+
+    today = timezone.now().date()
+    archive_before = _midnight(today - timedelta(days=keep_days))
+    expire_month = add_months(month_start(today), -archive_months)
+    expire_before = _midnight(expire_month)
+
+    result = {'read': 0, 'archived': 0, 'dropped': drop_expired_archives(expire_month), 'complete': True}
+    tables = {}
+    for stock_id in Stock.objects.order_by('StockID').values_list('pk', flat=True):
+        stock_read = 0
+        while True:
+            if max_seconds is not None and time.monotonic() - started > max_seconds:
+                result['complete'] = False
+                return result
+            read, archived = _prune_chunk(
+                stock_id, archive_before, expire_before, batch_size, bucket_seconds, tables
+            )
+            if not read:
+                break
+            stock_read += read
+            result['read'] += read
+            result['archived'] += archived
+            if pause:
+                time.sleep(pause)
+        if log and stock_read:
+            log(f"Stock {stock_id}: {stock_read:,} ticks pruned ({result['read']:,} total, {result['archived']:,} archived)")
+    return result
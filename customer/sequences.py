@@ -0,0 +1,80 @@
+"""
+Block-based ID allocation.
+
+allocate() reserves a contiguous range from an IdSequence row with one
+conditional UPDATE, so concurrent writers get disjoint ranges without ever
+reading the table they insert into. Call it outside long transactions: the
+sequence row stays locked until the surrounding transaction commits.
+
+IdBlock keeps a process-local block so most calls don't touch the DB.
+IDs left in a block when the process exits are skipped, never reused.
+
+A sequence can also serve as a version number that processes compare
+against their cached copies: current() reads it and advance() moves it on.
+"""
+import time
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .models import IdSequence
+
+
+def allocate(name, count, initial=None):
+    """Reserve `count` consecutive IDs and return the first. `initial()` seeds a new sequence."""
+    while True:
+        with transaction.atomic():
+            if IdSequence.objects.filter(name=name).update(next_value=F('next_value') + count):
+                # The row is locked by our UPDATE, so nobody can move it in between
+                return IdSequence.objects.filter(name=name).values_list('next_value', flat=True).get() - count
+        try:
+            with transaction.atomic():
+                IdSequence.objects.create(name=name, next_value=initial() if initial else 1)
+        except IntegrityError:
+            pass  # Another writer created it first
+
+
+def current(name, initial=None):
+    """A sequence's next value, without reserving it. `initial()` seeds a new sequence."""
+    value = IdSequence.objects.filter(name=name).values_list('next_value', flat=True).first()
+    if value is None:
+        try:
+            with transaction.atomic():
+                IdSequence.objects.create(name=name, next_value=initial() if initial else 1)
+        except IntegrityError:
+            pass  # Another writer created it first
+        value = IdSequence.objects.filter(name=name).values_list('next_value', flat=True).get()
+    return value
+
+
+def advance(name):
+    """
+    Move a version sequence to the current time in nanoseconds, or one past
+    its value if that's later, and return (previous value, new value). The
+    row stays locked until the surrounding transaction commits. A value seen
+    only by a transaction that rolled back is never handed out again, so
+    nothing cached under it can be mistaken for a later version.
+    """
+    current(name, time.time_ns)
+    with transaction.atomic():
+        rows = IdSequence.objects.select_for_update().filter(name=name)
+        previous = rows.values_list('next_value', flat=True).get()
+        value = max(previous + 1, time.time_ns())
+        rows.update(next_value=value)
+    return previous, value
+
+
+class IdBlock:
+    def __init__(self, allocator, block_size):
+        # allocator(count) -> first ID, e.g. pricing.allocate_tick_ids
+        self.allocator = allocator
+        self.block_size = block_size
+        self._next = self._end = 0
+
+    def take(self, count):
+        """First of `count` consecutive IDs, reserving a new block when this one runs out"""
+        if self._next + count > self._end:
+            size = max(self.block_size, count)
+            self._next = self.allocator(size)
+            self._end = self._next + size
+        first = self._next
+        self._next += count
+        return first
@@ -20,16 +20,21 @@ class PositionSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Position
-        fields = ['id', 'stock_ticker', 'quantity']
+        fields = ['PositionID', 'stock_ticker', 'quantity', 'cost_basis', 'realized_pnl']
 
 class BrokerageAccountSerializer(serializers.ModelSerializer):
-    positions = PositionSerializer(many=True, read_only=True)
+    positions = serializers.SerializerMethodField()
     user = UserSerializer(read_only=True)
     
     class Meta:
         model = BrokerageAccount
         fields = ['user', 'cash_balance', 'positions']
 
+    def get_positions(self, account):
+        # Sold-out positions stay in the table for their realized P&L
+        positions = account.positions.filter(quantity__gt=0).select_related('stock')
+        return PositionSerializer(positions, many=True).data
+
 class TransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
@@ -39,15 +44,18 @@ class OrderSerializer(serializers.ModelSerializer):
     stock_ticker = serializers.CharField(source='stock.ticker')
     class Meta:
         model = Order
-        fields = ['id', 'account', 'stock_ticker', 'action', 'quantity', 'status', 'created_at', 'executed_at']
+        fields = [
+            'OrderID', 'account', 'stock_ticker', 'action', 'order_type', 'limit_price',
+            'quantity', 'filled_qty', 'status', 'reject_reason', 'lot_method', 'created_at', 'executed_at'
+        ]
 
 class TradeSerializer(serializers.ModelSerializer):
-    order_id = serializers.IntegerField(source='order.id')
+    order_id = serializers.IntegerField()
     stock_ticker = serializers.CharField(source='order.stock.ticker')
     
     class Meta:
         model = Trade
-        fields = ['id', 'order_id', 'stock_ticker', 'executed_price', 'executed_qty', 'executed_time']
+        fields = ['TradeID', 'order_id', 'stock_ticker', 'executed_price', 'executed_qty', 'executed_time']
 
 class MarketScheduleSerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,27 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .market_calendar import calendar_changed
+from .models import MarketHoliday, MarketSchedule
+
+
+@receiver([post_save, post_delete], sender=MarketSchedule)
+def market_schedule_changed(sender, **kwargs):
+    # Every process re-reads the schedule; the calendar notices if the new
+    # schedule no longer matches it and rebuilds
+    calendar_changed()
+
+
+@receiver(pre_save, sender=MarketHoliday)
+def market_holiday_saving(sender, instance, **kwargs):
+    # Moving a holiday to another date has to recompute the old date too
+    instance._previous_date = None
+    if instance.pk is not None:
+        instance._previous_date = sender.objects.filter(pk=instance.pk).values_list('date', flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=MarketHoliday)
+def market_holiday_changed(sender, instance, **kwargs):
+    days = {instance.date}
+    if getattr(instance, '_previous_date', None) is not None:
+        days.add(instance._previous_date)
+    calendar_changed(days)
@@ -0,0 +1,137 @@
+"""
+Continuous market simulator.
+
+Run with `python manage.py run_market_simulator`. The daemon keeps every
+stock in memory (PriceArrays), moves all prices once per interval while the
+market is open and writes the Stock rows each tick. Prices move under the
+same price models as generate_prices: each stock's StockPriceModel row, or
+the simulator's default model, re-read whenever stocks are reloaded.
+PriceTicks go through a TickWriter, which flushes them in batches from its
+own thread.
+
+Start/stop and the tick interval come from the SimulatorControl row, which
+the admin dashboard edits; the daemon writes its status, heartbeat and
+metrics back to the same row.
+"""
+import time
+import numpy as np
+from django.db import OperationalError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from .metrics import metrics
+from .models import SimulatorControl
+from .price_models import MarketModel
+from .pricing import PriceArrays
+from .tick_writer import TickWriter
+from .utils import is_market_open
+
+# Bounds on the SimulatorControl settings the dashboard and command accept
+MAX_INTERVAL_SECONDS = 3600
+MAX_VOLATILITY = 50  # percent per tick
+
+
+class MarketSimulator:
+    def __init__(self, flush_rows=50_000, flush_interval=1.0, max_buffer_rows=500_000,
+                 reload_every=60, seed=None, model='uniform', log=None):
+        self.reload_every = reload_every
+        self.model_name = model
+        self.rng = np.random.default_rng(seed)
+        self.log = log or (lambda message: None)
+        self.prices = None
+        self.model = None  # (volatility, MarketModel)
+        self.ticks_since_reload = 0
+        self.writer = TickWriter(
+            flush_rows=flush_rows, flush_interval=flush_interval, max_rows=max_buffer_rows, log=self.log
+        )
+
+    def load(self):
+        """(Re)load all stocks into memory, picking up newly created ones"""
+        self.prices = PriceArrays.load()
+        self.model = None
+        self.ticks_since_reload = 0
+        self.log(f"Loaded {len(self.prices)} stocks")
+
+    def _market_model(self, volatility):
+        # Volatility only sets the default model's max_change, so rebuild just when it changes
+        if self.model is None or self.model[0] != volatility:
+            self.model = (
+                volatility,
+                MarketModel.for_stocks(self.prices.stocks, self.model_name, max_change=volatility / 100)
+            )
+        return self.model[1]
+
+    def tick(self, volatility, interval):
+        """Move prices over `interval` seconds, write the Stock rows and queue the ticks. Returns write time in ms."""
+        if self.prices is None or self.ticks_since_reload >= self.reload_every:
+            self.load()
+        if not len(self.prices):
+            return 0.0
+
+        self.prices.step(self._market_model(volatility), interval, self.rng)
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            self.prices.save()
+        # Blocks while the writer is backed up, which shows up as tick lag
+        self.writer.put(self.prices.stock_ids, self.prices.price, timezone.now())
+        self.ticks_since_reload += 1
+        return (time.perf_counter() - start) * 1000
+
+    def run(self, stop_after=None):
+        """Tick until interrupted (or for `stop_after` ticks)"""
+        ticks = 0
+        next_due = time.monotonic()
+        self.writer.start()
+        try:
+            while stop_after is None or ticks < stop_after:
+                control = SimulatorControl.get()
+                now = timezone.now()
+
+                if control.desired_state != 'RUNNING':
+                    status = 'PAUSED'
+                elif not is_market_open()[0]:
+                    status = 'MARKET_CLOSED'
+                else:
+                    status = 'RUNNING'
+
+                if status == 'RUNNING':
+                    lag_ms = max(0.0, (time.monotonic() - next_due) * 1000)
+                    try:
+                        write_ms = self.tick(control.volatility, control.interval_seconds)
+                    except OperationalError as e:
+                        # Dropped connection: reconnect on the next query and
+                        # reload prices from the DB, which still has the last good tick
+                        self.log(f"Tick failed, reconnecting: {e}")
+                        connection.close()
+                        self.prices = None
+                    else:
+                        ticks += 1
+                        metrics.observe('simulator.tick_lag_ms', lag_ms)
+                        metrics.observe('simulator.write_ms', write_ms)
+                        SimulatorControl.objects.filter(pk=control.pk).update(
+                            status=status,
+                            heartbeat_at=now,
+                            last_tick_at=now,
+                            ticks_total=F('ticks_total') + 1,
+                            last_tick_lag_ms=lag_ms,
+                            last_write_ms=write_ms,
+                            **self.writer.stats()
+                        )
+                else:
+                    SimulatorControl.objects.filter(pk=control.pk).update(
+                        status=status, heartbeat_at=now, **self.writer.stats()
+                    )
+
+                # Fixed schedule; if a tick overran, skip ahead instead of bursting
+                next_due += control.interval_seconds
+                delay = next_due - time.monotonic()
+                if delay < 0:
+                    next_due = time.monotonic()
+                    delay = 0
+                time.sleep(delay)
+        finally:
+            self.writer.close()
+            SimulatorControl.objects.filter(pk=1).update(
+                status='OFFLINE', heartbeat_at=timezone.now(), **self.writer.stats()
+            )
+
@@ -1,3 +1,1710 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+import numpy as np
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
 
-# Create your tests here.
+from . import (
+    candles, history, leaderboard, lots, market_calendar, order_queue, performance, price_models, quote_stream,
+    sequences, tick_store
+)
+from .execution import ShardedExecutor
+from .market_calendar import get_calendar
+from .matching import MatchingEngine
+from .order_queue import enqueue_order, execute_pending_orders
+from .retention import prune_ticks
+from .simulator import MarketSimulator
+from .tick_writer import CLOSE_RETRIES, FLUSH_RETRIES, TickWriter
+from .trading import add_shares, remove_shares
+from .valuations import audit, market_value
+from .pricing import PriceArrays
+from .models import (
+    CustomUser, Stock, Position, Order, MarketSchedule, MarketHoliday, Trade, Transaction, TaxLot, IdempotencyKey,
+    Candle, PriceTick, SimulatorControl, StockPriceModel, TickArchive
+)
+from .trading import TradeError
+from .utils import get_schedule, is_market_open
+from .views import BrokerageAccountViewSet
+
+
+def create_stock(ticker, price='10.00'):
+    """A stock whose current, opening, high and low prices are all `price`"""
+    price = Decimal(price)
+    return Stock.objects.create(
+        ticker=ticker, name=f'{ticker.title()} Inc', initial_price=price, current_price=price,
+        opening_price=price, day_high=price, day_low=price, float_shares=1_000_000
+    )
+
+
+def create_customer(name, cash=None):
+    """A CUSTOMER user called `name` whose account holds `cash`, if given"""
+    user = CustomUser.objects.create_user(
+        UserName=name, email=f'{name}@investr.io', FullName=name.title(), Role='CUSTOMER', password='pw'
+    )
+    if cash is not None:
+        user.account.cash_balance = Decimal(cash)
+        user.account.save()
+    return user
+
+
+@mock.patch('customer.views.is_market_open', return_value=(True, 'Market is open'))
+class TradeBatchTests(TestCase):
+    """A batch fills every order in sequence, or leaves no trace at all"""
+
+    def setUp(self):
+        self.apple, self.bank = create_stock('APPL'), create_stock('BANK', '20.00')
+        self.user = create_customer('batcher', cash='100.00')
+        self.account = self.user.account
+        Position.objects.create(account=self.account, stock=self.bank, quantity=2)
+        self.view = BrokerageAccountViewSet.as_view({'post': 'trade_batch'})
+
+    def _batch(self, *orders):
+        request = APIRequestFactory().post(
+            '/api/v1/accounts/trade_batch/',
+            {'orders': [{'ticker': ticker, 'type': side, 'quantity': qty} for ticker, side, qty in orders]},
+            format='json'
+        )
+        force_authenticate(request, user=self.user)
+        return self.view(request)
+
+    def _holdings(self):
+        self.account.refresh_from_db()
+        shares = dict(Position.objects.filter(account=self.account).values_list('stock__ticker', 'quantity'))
+        return self.account.cash_balance, shares
+
+    def _assert_untouched(self):
+        self.assertEqual(self._holdings(), (Decimal('100.00'), {'BANK': 2}))
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Trade.objects.exists())
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_orders_fill_in_sequence(self, market_open):
+        # The sell only has the shares bought earlier in the same batch
+        response = self._batch(('APPL', 'BUY', 5), ('APPL', 'SELL', 3), ('BANK', 'SELL', 2))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([order['type'] for order in response.data['orders']], ['BUY', 'SELL', 'SELL'])
+        self.assertEqual(response.data['new_cash'], '120.00')
+        self.assertEqual(self._holdings(), (Decimal('120.00'), {'APPL': 2, 'BANK': 0}))
+        self.assertEqual(Trade.objects.filter(account=self.account).count(), 3)
+
+    def test_one_bad_order_rejects_the_whole_batch(self, market_open):
+        for orders, index in (
+            ((('APPL', 'BUY', 5), ('BANK', 'SELL', 3)), 1),
+            ((('APPL', 'BUY', 5), ('APPL', 'BUY', 6)), 1),
+            ((('NOPE', 'BUY', 1),), 0),
+        ):
+            response = self._batch(*orders)
+            self.assertEqual(response.status_code, 400, orders)
+            self.assertEqual(response.data['index'], index)
+            self._assert_untouched()
+
+    def test_write_that_loses_a_race_rolls_back_the_batch(self, market_open):
+        # Another request sells the BANK shares between the checks and the writes
+        with mock.patch('customer.trading.remove_shares', return_value=False):
+            response = self._batch(('APPL', 'BUY', 5), ('BANK', 'SELL', 2))
+        self.assertEqual(response.status_code, 400)
+        self._assert_untouched()
+
+
+class ConcurrentTradeTests(TransactionTestCase):
+    """Hammer one account from many threads and check nothing is lost"""
+
+    THREADS = 8
+    TRADES_PER_THREAD = 25
+
+    def setUp(self):
+        MarketSchedule.objects.create(
+            Status='OPEN', OpenHour=0, OpenMinute=0, CloseHour=23, CloseMinute=59
+        )
+        self.stock = create_stock('RACE')
+        self.user = create_customer('racer')
+        self.factory = APIRequestFactory()
+
+    def _run_threads(self, action, payload):
+        view = BrokerageAccountViewSet.as_view({'post': action})
+        statuses = []
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                for _ in range(self.TRADES_PER_THREAD):
+                    request = self.factory.post(f'/api/v1/accounts/{action}/', payload, format='json')
+                    force_authenticate(request, user=self.user)
+                    response = view(request)
+                    with lock:
+                        statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(statuses), self.THREADS * self.TRADES_PER_THREAD)
+        return statuses
+
+    def test_concurrent_deposits_are_not_lost(self):
+        statuses = self._run_threads('deposit', {'amount': '1.00'})
+        self.assertEqual(statuses.count(200), len(statuses))
+
+        self.user.account.refresh_from_db()
+        self.assertEqual(self.user.account.cash_balance, Decimal(len(statuses)))
+
+    def test_concurrent_buys_never_overdraw(self):
+        # Enough cash for exactly half of the attempted buys
+        attempts = self.THREADS * self.TRADES_PER_THREAD
+        account = self.user.account
+        account.cash_balance = Decimal('10.00') * (attempts // 2)
+        account.save()
+
+        statuses = self._run_threads('trade', {'ticker': 'RACE', 'type': 'BUY', 'quantity': 1})
+        filled = statuses.count(200)
+        self.assertEqual(filled, attempts // 2)
+        self.assertEqual(statuses.count(400), attempts - filled)
+
+        account.refresh_from_db()
+        self.assertEqual(account.cash_balance, Decimal('0.00'))
+        self.assertEqual(Position.objects.get(account=account, stock=self.stock).quantity, filled)
+        self.assertEqual(Order.objects.filter(account=account).count(), filled)
+
+
+class IdempotencyKeyTests(TestCase):
+    """A key replays its first response, and only for the same request"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_customer('retrier')
+        self.factory = APIRequestFactory()
+        self.view = BrokerageAccountViewSet.as_view({'post': 'deposit'})
+
+    def _deposit(self, amount, key='key-1'):
+        request = self.factory.post(
+            '/api/v1/accounts/deposit/', {'amount': amount}, format='json', HTTP_IDEMPOTENCY_KEY=key
+        )
+        force_authenticate(request, user=self.user)
+        return self.view(request)
+
+    def _balance(self):
+        self.user.account.refresh_from_db()
+        return self.user.account.cash_balance
+
+    def test_retry_replays_without_running_again(self):
+        first = self._deposit('5.00')
+        cache.clear()  # The stored row replays too, not just the cache
+        retry = self._deposit('5.00')
+        self.assertEqual(retry.status_code, first.status_code)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(self._balance(), Decimal('5.00'))
+
+    def test_reused_key_with_another_body_conflicts(self):
+        self._deposit('5.00')
+        response = self._deposit('500.00')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self._balance(), Decimal('5.00'))
+
+    def test_response_commits_with_the_deposit(self):
+        with mock.patch.object(IdempotencyKey, 'save', side_effect=DatabaseError('disk full')):
+            with self.assertRaises(DatabaseError):
+                self._deposit('5.00')
+        # Neither half is left behind for a retry to trip over
+        self.assertEqual(self._balance(), Decimal('0.00'))
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        self.assertEqual(self._deposit('5.00').status_code, 200)
+        self.assertEqual(self._balance(), Decimal('5.00'))
+
+    def test_server_error_releases_the_key(self):
+        with mock.patch('customer.views.credit_cash', side_effect=DatabaseError('deadlock')):
+            self.assertEqual(self._deposit('5.00').status_code, 500)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        response = self._deposit('5.00')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(self._balance(), Decimal('5.00'))
+
+    def test_expired_key_runs_again(self):
+        self._deposit('5.00')
+        cache.clear()
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        response = self._deposit('5.00')
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(self._balance(), Decimal('10.00'))
+        stored = IdempotencyKey.objects.get(account=self.user.account, key='key-1')
+        self.assertGreater(stored.expires_at, timezone.now() + timedelta(hours=1))
+
+
+@mock.patch('customer.order_queue.is_market_open', return_value=(True, 'Market is open'))
+class OrderQueueTests(TestCase):
+    """The worker executes queued orders oldest first, one savepoint per order"""
+
+    def setUp(self):
+        self.stock = create_stock('QUEUE')
+        self.account = create_customer('queuer', cash='100.00').account
+
+    def _enqueue(self, quantity, side='BUY'):
+        return enqueue_order(self.account, self.stock, side, quantity)
+
+    @override_settings(ORDER_INTAKE_MODE='queue')
+    @mock.patch('customer.views.is_market_open', return_value=(True, 'Market is open'))
+    def test_queue_intake_stores_the_order_without_executing_it(self, views_market_open, market_open):
+        user = self.account.user
+        view = BrokerageAccountViewSet.as_view({'post': 'trade'})
+        responses = []
+        for body in ({'ticker': 'QUEUE', 'type': 'BUY', 'quantity': 3},
+                     {'ticker': 'QUEUE', 'type': 'HOLD', 'quantity': 3},
+                     {'ticker': 'QUEUE', 'type': 'BUY', 'quantity': 3, 'order_type': 'LIMIT', 'limit_price': '-1'}):
+            request = APIRequestFactory().post('/api/v1/accounts/trade/', body, format='json')
+            force_authenticate(request, user=user)
+            responses.append(view(request))
+
+        self.assertEqual([response.status_code for response in responses], [202, 400, 400])
+        order = Order.objects.get()
+        self.assertEqual((responses[0].data['order_id'], order.status), (order.pk, 'Pending'))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.cash_balance, Decimal('100.00'))
+
+        self.assertEqual(execute_pending_orders(), 1)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'Filled')
+
+    def test_worker_executes_oldest_first_in_batches(self, market_open):
+        first, too_big, sell = self._enqueue(6), self._enqueue(6), self._enqueue(2, 'SELL')
+
+        self.assertEqual(execute_pending_orders(batch_size=2), 2)
+        self.assertEqual(Order.objects.get(pk=sell.pk).status, 'Pending')
+        self.assertEqual(execute_pending_orders(batch_size=2), 1)
+        self.assertEqual(execute_pending_orders(batch_size=2), 0)
+
+        orders = {order.pk: order for order in Order.objects.all()}
+        self.assertEqual((orders[first.pk].status, orders[first.pk].filled_qty), ('Filled', 6))
+        self.assertEqual(
+            (orders[too_big.pk].status, orders[too_big.pk].reject_reason), ('Rejected', 'Insufficient funds')
+        )
+        self.assertEqual(orders[sell.pk].status, 'Filled')
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.cash_balance, Decimal('60.00'))
+        self.assertEqual(Position.objects.get(account=self.account).quantity, 4)
+        self.assertEqual(Trade.objects.filter(account=self.account).count(), 2)
+
+    def test_orders_are_rejected_while_the_market_is_closed(self, market_open):
+        market_open.return_value = (False, 'Market is currently closed')
+        order = self._enqueue(1)
+        self.assertEqual(execute_pending_orders(), 1)
+        order.refresh_from_db()
+        self.assertEqual(
+            (order.status, order.reject_reason), ('Rejected', 'Trading not allowed: Market is currently closed')
+        )
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.cash_balance, Decimal('100.00'))
+
+    def test_unexpected_error_rejects_only_its_order(self, market_open):
+        poison, first, second = self._enqueue(1), self._enqueue(2), self._enqueue(3)
+        real_add_shares = order_queue.add_shares
+
+        def add_shares(account, stock_id, qty):
+            if qty == 1:
+                raise IntegrityError('FOREIGN KEY constraint failed')
+            return real_add_shares(account, stock_id, qty)
+
+        with mock.patch('customer.order_queue.add_shares', side_effect=add_shares):
+            with self.assertLogs('customer.order_queue', 'ERROR'):
+                self.assertEqual(execute_pending_orders(), 3)
+
+        poison.refresh_from_db()
+        self.assertEqual((poison.status, poison.reject_reason), ('Rejected', 'Execution failed'))
+        self.assertEqual(Order.objects.get(pk=first.pk).status, 'Filled')
+        self.assertEqual(Order.objects.get(pk=second.pk).status, 'Filled')
+        # The poison order's debit rolled back with its savepoint
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.cash_balance, Decimal('50.00'))
+        self.assertEqual(Position.objects.get(account=self.account).quantity, 5)
+        self.assertEqual(Trade.objects.filter(account=self.account).count(), 2)
+        # Nothing is left at the head of the queue
+        self.assertEqual(execute_pending_orders(), 0)
+
+
+@mock.patch('customer.order_queue.is_market_open', return_value=(True, 'Market is open'))
+class ShardedExecutionTests(TransactionTestCase):
+    """Each shard takes only its own partition of the queue, and together they take all of it"""
+
+    def setUp(self):
+        self.stocks = [create_stock(f'SHARD{i}') for i in range(4)]
+        self.accounts = [create_customer(f'sharder{i}', cash='1000.00').account for i in range(3)]
+        for account in self.accounts:
+            for stock in self.stocks:
+                enqueue_order(account, stock, 'BUY', 1)
+
+    def _filled(self, column):
+        return sorted(Order.objects.filter(status='Filled').values_list(column, flat=True).distinct())
+
+    def test_shard_takes_only_its_stocks(self, market_open):
+        ids = sorted(stock.pk for stock in self.stocks)
+        self.assertEqual(execute_pending_orders(shard=(1, 2)), 6)
+        self.assertEqual(self._filled('stock_id'), [pk for pk in ids if pk % 2 == 1])
+        self.assertEqual(execute_pending_orders(shard=(1, 2)), 0)
+        self.assertEqual(execute_pending_orders(shard=(0, 2)), 6)
+        self.assertEqual(self._filled('stock_id'), ids)
+
+    def test_shard_takes_only_its_accounts(self, market_open):
+        ids = sorted(account.pk for account in self.accounts)
+        self.assertEqual(execute_pending_orders(shard=(ids[0] % 3, 3), shard_key='account'), 4)
+        self.assertEqual(self._filled('account_id'), [ids[0]])
+
+    def test_executor_drains_every_shard(self, market_open):
+        executor = ShardedExecutor(shards=3, batch_size=2, poll_interval=0.01, shard_key='stock')
+        self.assertEqual(executor.run_until_empty(), 12)
+        for index, processed in enumerate(executor.processed):
+            self.assertEqual(processed, 3 * sum(1 for stock in self.stocks if stock.pk % 3 == index))
+        self.assertFalse(Order.objects.exclude(status='Filled').exists())
+        for account in self.accounts:
+            account.refresh_from_db()
+            self.assertEqual(account.cash_balance, Decimal('960.00'))
+
+
+class MatchingEngineTests(TestCase):
+    """Limit orders cross, partially fill and cancel consistently across engines (processes)"""
+
+    def setUp(self):
+        self.stock = create_stock('BOOK')
+        self.buyer = self._account('buyer', cash='1000.00')
+        self.seller = self._account('seller', shares=10)
+        self.engine = MatchingEngine()
+
+    def _account(self, name, cash='0.00', shares=0):
+        account = create_customer(name, cash).account
+        if shares:
+            Position.objects.create(account=account, stock=self.stock, quantity=shares)
+            TaxLot.objects.create(
+                account=account, stock=self.stock, opened_at=timezone.now(), quantity=shares, remaining=shares,
+                cost_per_share=Decimal('8.00')
+            )
+            Position.objects.filter(account=account).update(cost_basis=Decimal('8.00') * shares)
+        return account
+
+    def _cash(self, account):
+        account.refresh_from_db()
+        return account.cash_balance
+
+    def _shares(self, account):
+        return Position.objects.get(account=account, stock=self.stock).quantity
+
+    def test_crossing_orders_fill_at_the_resting_price(self):
+        sell, fills = self.engine.place(self.seller, self.stock, 'SELL', 10, Decimal('9.00'))
+        self.assertEqual(fills, [])
+        buy, fills = self.engine.place(self.buyer, self.stock, 'BUY', 10, Decimal('9.50'))
+
+        self.assertEqual(len(fills), 1)
+        self.assertEqual(buy.status, 'Filled')
+        self.assertEqual(Order.objects.get(pk=sell.pk).status, 'Filled')
+        # The buyer reserved 9.50 a share and gets the improvement back
+        self.assertEqual(self._cash(self.buyer), Decimal('910.00'))
+        self.assertEqual(self._cash(self.seller), Decimal('90.00'))
+        self.assertEqual(self._shares(self.buyer), 10)
+        self.assertEqual(self._shares(self.seller), 0)
+        self.assertEqual(Position.objects.get(account=self.seller).realized_pnl, Decimal('10.00'))
+
+    def test_partial_fill_rests_the_remainder(self):
+        sell, _ = self.engine.place(self.seller, self.stock, 'SELL', 10, Decimal('9.00'))
+        buy, fills = self.engine.place(self.buyer, self.stock, 'BUY', 4, Decimal('9.00'))
+
+        self.assertEqual(sum(fill.quantity for fill in fills), 4)
+        self.assertEqual(buy.status, 'Filled')
+        sell.refresh_from_db()
+        self.assertEqual((sell.status, sell.filled_qty), ('Open', 4))
+
+        # The rest is still on the book for the next buyer
+        _, fills = self.engine.place(self.buyer, self.stock, 'BUY', 6, Decimal('9.00'))
+        self.assertEqual(sum(fill.quantity for fill in fills), 6)
+        sell.refresh_from_db()
+        self.assertEqual(sell.status, 'Filled')
+        self.assertEqual(self._shares(self.buyer), 10)
+        self.assertEqual(self._cash(self.buyer), Decimal('910.00'))
+
+    def test_cancel_refunds_only_the_unfilled_part(self):
+        buy, _ = self.engine.place(self.buyer, self.stock, 'BUY', 10, Decimal('9.00'))
+        self.assertEqual(self._cash(self.buyer), Decimal('910.00'))
+        self.engine.place(self.seller, self.stock, 'SELL', 4, Decimal('9.00'))
+
+        self.engine.cancel(self.buyer, buy.pk)
+        self.assertEqual(Order.objects.get(pk=buy.pk).status, 'Cancelled')
+        self.assertEqual(self._cash(self.buyer), Decimal('964.00'))
+        self.assertEqual(self._shares(self.buyer), 4)
+        with self.assertRaises(TradeError):
+            self.engine.cancel(self.buyer, buy.pk)
+        self.assertEqual(self._cash(self.buyer), Decimal('964.00'))
+
+    def test_order_cancelled_elsewhere_never_fills(self):
+        # Two engines stand for two worker processes with their own cached books
+        other = MatchingEngine()
+        sell, _ = self.engine.place(self.seller, self.stock, 'SELL', 10, Decimal('9.00'))
+        other.book(self.stock.pk)
+        self.engine.cancel(self.seller, sell.pk)
+        self.assertEqual(self._shares(self.seller), 10)
+
+        buy, fills = other.place(self.buyer, self.stock, 'BUY', 10, Decimal('9.00'))
+        self.assertEqual(fills, [])
+        self.assertEqual(buy.status, 'Open')
+        self.assertEqual(self._shares(self.seller), 10)
+        self.assertEqual(self._cash(self.seller), Decimal('0.00'))
+
+    def test_orders_resting_in_different_engines_cross(self):
+        other = MatchingEngine()
+        sell, _ = self.engine.place(self.seller, self.stock, 'SELL', 10, Decimal('9.00'))
+        buy, fills = other.place(self.buyer, self.stock, 'BUY', 10, Decimal('9.00'))
+        self.assertEqual([fill.maker.order_id for fill in fills], [sell.pk])
+        self.assertEqual(buy.status, 'Filled')
+
+        # The first engine's cached book no longer has the filled sell
+        _, fills = self.engine.place(self.buyer, self.stock, 'BUY', 1, Decimal('9.00'))
+        self.assertEqual(fills, [])
+
+    def test_rolled_back_place_leaves_no_order_in_the_cached_book(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.engine.place(self.buyer, self.stock, 'BUY', 1, Decimal('5.00'))
+        # Placed inside an outer transaction (an idempotent request) that rolls back
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.engine.place(self.seller, self.stock, 'SELL', 10, Decimal('8.00'))
+            raise RuntimeError('response could not be stored')
+        # Another process moves the version on to what our write would have left
+        with self.captureOnCommitCallbacks(execute=True):
+            MatchingEngine().place(self.buyer, self.stock, 'BUY', 1, Decimal('5.00'))
+
+        buy, fills = self.engine.place(self.buyer, self.stock, 'BUY', 10, Decimal('9.00'))
+        self.assertEqual(fills, [])
+        self.assertEqual(buy.status, 'Open')
+        self.assertEqual(self._shares(self.seller), 10)
+
+    def test_order_that_would_trade_with_its_own_account_is_rejected(self):
+        other = self._account('other', shares=5)
+        Position.objects.filter(account=self.buyer).delete()
+        add_shares(self.buyer, self.stock.pk, 5)
+        self.engine.place(other, self.stock, 'SELL', 5, Decimal('9.00'))
+        self.engine.place(self.buyer, self.stock, 'SELL', 5, Decimal('9.50'))
+
+        # Would fill the other seller's 5, then reach the buyer's own ask
+        with self.assertRaises(TradeError):
+            self.engine.place(self.buyer, self.stock, 'BUY', 10, Decimal('10.00'))
+        self.assertEqual(self._cash(self.buyer), Decimal('1000.00'))
+        self.assertEqual(Order.objects.filter(account=self.buyer, action='BUY').count(), 0)
+
+        # Nothing was taken off the book
+        _, fills = self.engine.place(self.seller, self.stock, 'SELL', 1, Decimal('9.00'))
+        self.assertEqual(fills, [])
+        _, fills = MatchingEngine().place(create_customer('third', '100.00').account, self.stock, 'BUY', 5,
+                                          Decimal('9.00'))
+        self.assertEqual(sum(fill.quantity for fill in fills), 5)
+
+    def test_cancelled_orders_are_skipped_at_the_front_of_their_level(self):
+        first, _ = self.engine.place(self.seller, self.stock, 'SELL', 4, Decimal('9.00'))
+        second, _ = self.engine.place(self.seller, self.stock, 'SELL', 6, Decimal('9.00'))
+        self.engine.cancel(self.seller, first.pk)
+        book = self.engine.book(self.stock.pk)
+        self.assertEqual((len(book), book.best_ask()), (1, 900))
+
+        _, fills = self.engine.place(self.buyer, self.stock, 'BUY', 6, Decimal('9.00'))
+        self.assertEqual([fill.maker.order_id for fill in fills], [second.pk])
+        self.engine.cancel(self.buyer, self.engine.place(self.buyer, self.stock, 'BUY', 1, Decimal('8.00'))[0].pk)
+        book = self.engine.book(self.stock.pk)
+        self.assertEqual((len(book), book.best_ask(), book.best_bid()), (0, None, None))
+
+
+class IdSequenceTests(TransactionTestCase):
+    """Concurrent writers get disjoint ID ranges, even while the sequence is being created"""
+
+    THREADS = 8
+    CALLS_PER_THREAD = 20
+
+    def _run_threads(self, work):
+        results = []
+        lock = threading.Lock()
+
+        def worker(index):
+            try:
+                for call in range(self.CALLS_PER_THREAD):
+                    result = work(index, call)
+                    with lock:
+                        results.append(result)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(self.THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(results), self.THREADS * self.CALLS_PER_THREAD)
+        return results
+
+    def test_concurrent_allocations_tile_the_sequence(self):
+        def work(index, call):
+            count = (index + call) % 5 + 1
+            return sequences.allocate('test', count, initial=lambda: 1000), count
+
+        ranges = sorted(self._run_threads(work))
+        # Back to back from the seeded start: no overlaps and no gaps
+        self.assertEqual(ranges[0][0], 1000)
+        for (first, count), (following, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(first + count, following)
+        self.assertEqual(sequences.current('test'), ranges[-1][0] + ranges[-1][1])
+
+    def test_id_blocks_in_many_processes_never_share_an_id(self):
+        allocator = lambda count: sequences.allocate('test', count)
+        blocks = [sequences.IdBlock(allocator, block_size=10) for _ in range(self.THREADS)]
+
+        def work(index, call):
+            # A take bigger than the block gets a block of its own
+            count = 25 if call == 7 else 3
+            first = blocks[index].take(count)
+            return range(first, first + count)
+
+        ids = [tick_id for taken in self._run_threads(work) for tick_id in taken]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(len(ids), self.THREADS * (19 * 3 + 25))
+
+
+class PriceWriteTests(TestCase):
+    """PriceArrays.save writes only prices, and only for stocks that still exist"""
+
+    def setUp(self):
+        for ticker in ('KEEP', 'GONE'):
+            create_stock(ticker)
+
+    def test_save_leaves_other_columns_and_deleted_stocks_alone(self):
+        prices = PriceArrays.load()
+        # Changed by other writers after load()
+        Stock.objects.filter(ticker='GONE').delete()
+        Stock.objects.filter(ticker='KEEP').update(name='Renamed Inc', float_shares=5)
+
+        prices.apply_returns(np.full(len(prices), 0.1))
+        prices.save()
+
+        self.assertFalse(Stock.objects.filter(ticker='GONE').exists())
+        stock = Stock.objects.get(ticker='KEEP')
+        self.assertEqual((stock.name, stock.float_shares), ('Renamed Inc', 5))
+        self.assertEqual(
+            (stock.current_price, stock.day_high, stock.day_low),
+            (Decimal('11.00'), Decimal('11.00'), Decimal('10.00'))
+        )
+
+
+class PriceModelTests(TestCase):
+    """Every price writer moves stocks under their StockPriceModel, reproducibly when seeded"""
+
+    def setUp(self):
+        self.free = create_stock('FREE')
+        pinned = create_stock('PIN')
+        # Reverts all the way to $42 within any tick, with no noise
+        StockPriceModel.objects.create(
+            stock=pinned, model='mean_reverting', mean_reversion=1e12, volatility=0, long_run_price=Decimal('42.00')
+        )
+
+    def _prices(self):
+        return dict(Stock.objects.values_list('ticker', 'current_price'))
+
+    def test_simulator_uses_stock_price_models(self):
+        simulator = MarketSimulator(seed=1)
+        simulator.tick(1.0, 5.0)
+        prices = self._prices()
+        self.assertEqual(prices['PIN'], Decimal('42.00'))
+        self.assertTrue(Decimal('9.90') <= prices['FREE'] <= Decimal('10.10'))
+
+    def test_seeded_loop_engine_is_reproducible(self):
+        runs = []
+        for _ in range(2):
+            Stock.objects.filter(pk=self.free.pk).update(current_price=Decimal('10.00'))
+            call_command('generate_prices', engine='loop', seed=7, volatility=5, stdout=StringIO())
+            runs.append(self._prices())
+        self.assertEqual(runs[0], runs[1])
+        self.assertEqual(runs[0]['PIN'], Decimal('42.00'))
+        self.assertNotEqual(runs[0]['FREE'], Decimal('10.00'))
+
+    def test_noiseless_models_follow_their_closed_forms(self):
+        rng = np.random.default_rng(0)
+        price = np.array([100.0])
+        gbm = price_models.GBM(drift=0.1, volatility=0)
+        np.testing.assert_allclose(gbm.step(price, 0.5, rng), 100 * np.exp(0.05))
+        np.testing.assert_allclose(gbm.path(price, 0.5, 2, rng)[:, 0], 100 * np.exp([0.05, 0.1]))
+        # No jumps and no diffusion leave just the drift
+        jumps = price_models.JumpDiffusion(drift=0.1, volatility=0, jump_intensity=0)
+        np.testing.assert_allclose(jumps.step(price, 0.5, rng), 100 * np.exp(0.05))
+        # Halfway (in log terms) to the long-run price after ln(2) / mean_reversion years
+        reverting = price_models.MeanReverting(mean_reversion=2, volatility=0, long_run_price=25)
+        np.testing.assert_allclose(reverting.step(price, np.log(2) / 2, rng), 50)
+
+        moves = price_models.Uniform(max_change=0.01).step(np.full(1000, 100.0), 1.0, rng)
+        self.assertTrue(np.all((moves >= 99) & (moves <= 101)))
+        self.assertGreater(np.ptp(moves), 1)
+
+    def test_seeded_backfill_is_reproducible(self):
+        # Ticks every ten minutes from 09:30 through 10:30: seven a day
+        MarketSchedule.objects.create(Status='OPEN', OpenHour=9, OpenMinute=30, CloseHour=10, CloseMinute=30)
+        runs = []
+        for _ in range(2):
+            PriceTick.objects.all().delete()
+            Candle.objects.all().delete()
+            Stock.objects.update(current_price=Decimal('10.00'))
+            call_command('generate_prices', backfill=2, interval=600, seed=11, stdout=StringIO())
+            ticks = (
+                PriceTick.objects.order_by('timestamp', 'stock_id').values_list('stock__ticker', 'timestamp', 'price')
+            )
+            runs.append((list(ticks), self._prices(), Candle.objects.count()))
+
+        ticks, prices, _ = runs[0]
+        self.assertEqual(runs[0], runs[1])
+        self.assertEqual(len(ticks), 2 * 2 * 7)
+        self.assertEqual({price for ticker, _, price in ticks if ticker == 'PIN'}, {Decimal('42.00')})
+        free = [price for ticker, _, price in ticks if ticker == 'FREE']
+        self.assertGreater(len(set(free)), 1)
+        # Live prices carry on from the last backfilled tick
+        self.assertEqual(prices['FREE'], free[-1])
+
+
+class CandleTests(TestCase):
+    """Candles merge out-of-order batches, lock one stock's rows and survive tick pruning"""
+
+    DAY = 86400
+    T0 = 1_700_006_400  # Midnight UTC
+
+    def setUp(self):
+        self.stock, self.other = create_stock('OHLC'), create_stock('WICK')
+
+    def _candle(self, resolution, epoch, stock=None):
+        return Candle.objects.get(
+            stock=stock or self.stock, resolution=resolution,
+            start=datetime.fromtimestamp(epoch // resolution * resolution, tz=dt_timezone.utc)
+        )
+
+    def test_late_batch_does_not_replace_a_newer_close(self):
+        candles.fold([self.stock.pk], [1000], [self.T0 + 30])
+        candles.fold([self.stock.pk], [1200], [self.T0 + 50])
+        # Folded last but taken first, e.g. a TickWriter batch behind its queue
+        candles.fold([self.stock.pk], [900], [self.T0 + 10])
+
+        candle = self._candle(60, self.T0)
+        self.assertEqual(
+            (candle.open, candle.high, candle.low, candle.close, candle.tick_count),
+            (Decimal('9.00'), Decimal('12.00'), Decimal('9.00'), Decimal('12.00'), 3)
+        )
+
+    def test_fold_locks_only_its_own_stocks(self):
+        candles.fold([self.other.pk], [1000], [self.T0])
+        with CaptureQueriesContext(connection) as queries:
+            candles.fold([self.stock.pk], [1000], [self.T0])
+        reads = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertTrue(reads)
+        for sql in reads:
+            self.assertIn(f'"StockID" IN ({self.stock.pk})', sql)
+
+    def test_rebuild_keeps_candles_whose_ticks_were_pruned(self):
+        for day, price in ((0, Decimal('10.00')), (1, Decimal('20.00'))):
+            for minute in range(3):
+                PriceTick.objects.create(
+                    stock=self.stock, price=price + minute,
+                    timestamp=datetime.fromtimestamp(self.T0 + day * self.DAY + minute * 60, tz=dt_timezone.utc)
+                )
+        candles.rebuild()
+        self.assertEqual(self._candle(self.DAY, self.T0).tick_count, 3)
+
+        # prune_ticks moved day 0 to the archive
+        PriceTick.objects.filter(timestamp__lt=datetime.fromtimestamp(self.T0 + self.DAY, tz=dt_timezone.utc)).delete()
+        self.assertEqual(candles.rebuild(), 3)
+
+        old = self._candle(self.DAY, self.T0)
+        self.assertEqual((old.open, old.close, old.tick_count), (Decimal('10.00'), Decimal('12.00'), 3))
+        new = self._candle(self.DAY, self.T0 + self.DAY)
+        self.assertEqual((new.open, new.close, new.tick_count), (Decimal('20.00'), Decimal('22.00'), 3))
+        self.assertEqual(Candle.objects.filter(stock=self.stock, resolution=60).count(), 6)
+
+    def test_rebuild_covers_a_first_day_that_starts_mid_day(self):
+        # History that never had candles, starting at noon
+        noon = self.T0 + self.DAY // 2
+        for epoch, price in ((noon, 10), (noon + 60, 12), (noon + self.DAY, 20)):
+            PriceTick.objects.create(
+                stock=self.stock, price=Decimal(price), timestamp=datetime.fromtimestamp(epoch, tz=dt_timezone.utc)
+            )
+        self.assertEqual(candles.rebuild(), 3)
+        first = self._candle(self.DAY, self.T0)
+        self.assertEqual((first.open, first.close, first.tick_count), (Decimal('10.00'), Decimal('12.00'), 2))
+        self.assertEqual(self._candle(self.DAY, self.T0 + self.DAY).tick_count, 1)
+
+        # Once that day has a candle, a later partial first day means pruned ticks
+        PriceTick.objects.filter(price=Decimal('10')).delete()
+        self.assertEqual(candles.rebuild(), 1)
+        self.assertEqual(self._candle(self.DAY, self.T0).tick_count, 2)
+
+
+class PriceHistoryTests(TestCase):
+    """History keeps a series' shape in few points, from ticks or, for long windows, candles"""
+
+    def setUp(self):
+        store = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, store)
+        tick_store = override_settings(TICK_STORE_DIR=store)
+        tick_store.enable()
+        self.addCleanup(tick_store.disable)
+
+        self.stock = create_stock('HIST')
+        self.client.force_login(create_customer('charter'))
+        self.now = timezone.now().replace(microsecond=0)
+
+    def _ticks(self, prices):
+        # One a minute, ending a minute ago
+        start = self.now - timedelta(minutes=len(prices))
+        ticks = PriceTick.objects.bulk_create(
+            PriceTick(stock=self.stock, price=Decimal(price), timestamp=start + timedelta(minutes=i))
+            for i, price in enumerate(prices)
+        )
+        candles.fold_price_ticks(ticks)
+        return ticks
+
+    def _get(self, ticker='HIST', **params):
+        return self.client.get(reverse('stock-history', kwargs={'ticker': ticker}), params)
+
+    def test_lttb_keeps_the_ends_and_the_spikes(self):
+        x = np.arange(100, dtype=np.float64)
+        y = np.zeros(100)
+        y[37], y[71] = 10, -10
+        keep = history.lttb(x, y, 10)
+        self.assertEqual(len(keep), 10)
+        self.assertEqual((keep[0], keep[-1]), (0, 99))
+        self.assertTrue({37, 71} <= set(keep.tolist()))
+        self.assertTrue(np.all(np.diff(keep) > 0))
+        # Nothing to drop
+        np.testing.assert_array_equal(history.lttb(x[:5], y[:5], 10), np.arange(5))
+
+    def test_short_window_is_read_from_ticks(self):
+        prices = ['10'] * 20
+        prices[12] = '15'
+        ticks = self._ticks(prices)
+
+        response = self._get(points=5)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(data['source'], 'ticks')
+        self.assertEqual(len(data['points']), 5)
+        self.assertEqual(data['points'][0], [int(ticks[0].timestamp.timestamp()), 10.0])
+        self.assertEqual(data['points'][-1], [int(ticks[-1].timestamp.timestamp()), 10.0])
+        self.assertIn(15.0, [price for _, price in data['points']])
+
+    def test_window_with_too_many_ticks_uses_candles(self):
+        # More than RAW_TICKS_PER_POINT per point: hourly closes over the default day
+        self._ticks([str(10 + i % 7) for i in range(3 * history.RAW_TICKS_PER_POINT + 1)])
+        data = json.loads(b''.join(self._get(points=3).streaming_content))
+        self.assertEqual(data['source'], '1h')
+        closes = dict(
+            (int(start.timestamp()), float(close))
+            for start, close in Candle.objects.filter(stock=self.stock, resolution=3600).values_list('start', 'close')
+        )
+        self.assertEqual(dict(map(tuple, data['points'])), closes)
+
+    def test_bad_requests(self):
+        self.assertEqual(self._get('NOPE').status_code, 404)
+        for params in ({'points': 2}, {'points': history.MAX_POINTS + 1}, {'points': 'many'},
+                       {'from': self.now.timestamp(), 'to': self.now.timestamp() - 60}, {'from': 'yesterday'}):
+            self.assertEqual(self._get(**params).status_code, 400, params)
+
+
+class TickStoreTests(TestCase):
+    """Exports append only new ticks, survive a crashed append and read back by range"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.stock = create_stock('COLS')
+        self.start = timezone.now().replace(microsecond=0) - timedelta(days=1)
+
+    def _ticks(self, seconds):
+        # Priced from their second, so every tick is recognizable
+        PriceTick.objects.bulk_create(
+            PriceTick(
+                stock=self.stock, price=Decimal(second % 500 + 100) / 100,
+                timestamp=self.start + timedelta(seconds=second)
+            )
+            for second in seconds
+        )
+
+    def _expected(self, seconds):
+        return (
+            [tick_store.to_us(self.start + timedelta(seconds=second)) for second in seconds],
+            [second % 500 + 100 for second in seconds]
+        )
+
+    def _assert_series(self, seconds):
+        series = tick_store.open_series('cols', root=self.root)
+        timestamps, prices = series.range()
+        self.assertEqual((timestamps.tolist(), prices.tolist()), self._expected(seconds))
+
+    def test_exports_append_only_new_ticks(self):
+        # Spans several index blocks
+        self._ticks(range(3000))
+        self.assertEqual(tick_store.export_ticks(self.stock, root=self.root), 3000)
+        self.assertEqual(tick_store.export_ticks(self.stock, root=self.root), 0)
+        self._ticks(range(3000, 3005))
+        self.assertEqual(tick_store.export_ticks(self.stock, root=self.root), 5)
+        self._assert_series(range(3005))
+
+        # Both ends inclusive, wherever they fall in a block
+        series = tick_store.open_series('COLS', root=self.root)
+        for first, last in ((0, 0), (1023, 1025), (2047, 3004), (1500, 1500)):
+            timestamps, prices = series.range(
+                self.start + timedelta(seconds=first), self.start + timedelta(seconds=last)
+            )
+            self.assertEqual((timestamps.tolist(), prices.tolist()), self._expected(range(first, last + 1)))
+        self.assertEqual(len(series.range(self.start - timedelta(days=1), self.start - timedelta(seconds=1))[0]), 0)
+
+    def test_crashed_append_is_truncated_and_rebuild_reorders(self):
+        self._ticks(range(10))
+        tick_store.export_ticks(self.stock, root=self.root)
+        # An export that died after writing data but before meta.json
+        for name in ('timestamps.i8', 'prices.i8'):
+            with open(os.path.join(self.root, 'COLS', name), 'ab') as f:
+                f.write(b'\xff' * 24)
+        self._assert_series(range(10))
+
+        self._ticks([10])
+        self.assertEqual(tick_store.export_ticks(self.stock, root=self.root), 1)
+        self._assert_series(range(11))
+
+        # A backfill older than the last export is only picked up by a rebuild
+        self._ticks([-5])
+        self.assertEqual(tick_store.export_ticks(self.stock, root=self.root), 0)
+        self.assertEqual(tick_store.export_ticks(self.stock, root=self.root, rebuild=True), 12)
+        self._assert_series([-5] + list(range(11)))
+
+    def test_history_joins_the_store_and_newer_ticks(self):
+        self._ticks(range(0, 600, 60))
+        tick_store.export_ticks(self.stock, root=self.root)
+        self._ticks(range(600, 900, 60))
+        with override_settings(TICK_STORE_DIR=self.root):
+            source, points = history.price_history(
+                self.stock, self.start, self.start + timedelta(hours=1), points=100
+            )
+        self.assertEqual(source, 'ticks')
+        expected = [
+            [int((self.start + timedelta(seconds=second)).timestamp()), (second % 500 + 100) / 100]
+            for second in range(0, 900, 60)
+        ]
+        self.assertEqual(points, expected)
+
+
+class TickRetentionTests(TestCase):
+    """prune_ticks archives one tick per bucket however the chunks fall"""
+
+    def setUp(self):
+        self.stock = create_stock('PRUNE')
+
+    def test_bucket_larger_than_a_chunk_is_archived_once(self):
+        day = (timezone.now() - timedelta(days=10)).replace(hour=12, minute=0, second=0, microsecond=0)
+        # Seven ticks in one minute, then two in the next
+        for second, price in [(s, 10 + s) for s in range(0, 56, 8)] + [(60, 30), (70, 31)]:
+            PriceTick.objects.create(stock=self.stock, price=Decimal(price), timestamp=day + timedelta(seconds=second))
+
+        result = prune_ticks(keep_days=7, archive_months=12, batch_size=3, bucket_seconds=60)
+
+        self.assertEqual((result['read'], result['archived']), (9, 2))
+        self.assertFalse(PriceTick.objects.filter(stock=self.stock).exists())
+        archive = TickArchive.objects.get()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT "Price" FROM "{archive.table_name}" ORDER BY "Timestamp"')
+            self.assertEqual([Decimal(str(price)) for price, in cursor.fetchall()], [Decimal('58'), Decimal('31')])
+        self.assertEqual(archive.row_count, 2)
+
+    def test_buckets_that_would_straddle_midnight_are_refused(self):
+        PriceTick.objects.create(stock=self.stock, price=Decimal('10'), timestamp=timezone.now() - timedelta(days=10))
+        for bucket_seconds in (7, 7000, 86401):
+            with self.assertRaises(ValueError):
+                prune_ticks(keep_days=7, archive_months=12, bucket_seconds=bucket_seconds)
+        self.assertEqual(PriceTick.objects.filter(stock=self.stock).count(), 1)
+        with override_settings(TICK_DOWNSAMPLE_SECONDS=7000), self.assertRaises(CommandError):
+            call_command('prune_ticks', stdout=StringIO())
+
+
+class TickWriterCloseTests(TestCase):
+    """close() gives up on a database that keeps failing instead of hanging"""
+
+    def _failing_writer(self):
+        writer = TickWriter(flush_rows=10, flush_interval=60, retry_delay=0.05)
+        flush = mock.patch.object(writer, '_flush', side_effect=RuntimeError('database is down'))
+        flush.start()
+        self.addCleanup(flush.stop)
+        writer.start()
+        writer.put([1, 2, 3], [100, 200, 300], timezone.now())
+        return writer
+
+    def test_close_drops_unwritten_ticks_after_its_timeout(self):
+        writer = self._failing_writer()
+        start = time.monotonic()
+        with self.assertLogs('customer.tick_writer', 'ERROR') as logs:
+            writer.close(timeout=0.3)
+            writer._thread.join(1)
+        self.assertFalse(writer._thread.is_alive())
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(writer.stats()['queue_rows'], 0)
+        self.assertIn('3 rows', logs.output[0])
+
+    def test_close_without_timeout_stops_after_its_retries(self):
+        writer = self._failing_writer()
+        with self.assertLogs('customer.tick_writer', 'ERROR'):
+            writer.close()
+        self.assertFalse(writer._thread.is_alive())
+        self.assertEqual(writer._flush.call_count, CLOSE_RETRIES)
+
+
+class TickWriterPoisonTests(TestCase):
+    """Rows that can never be written are dropped without holding up the rest"""
+
+    def test_rows_that_fail_alone_are_dropped_and_the_rest_written(self):
+        writer = TickWriter(flush_rows=1, flush_interval=60, retry_delay=0.01)
+        written = []
+
+        def flush(batches):
+            stock_ids = np.concatenate([batch[0] for batch in batches]).tolist()
+            if 2 in stock_ids:
+                raise IntegrityError('FOREIGN KEY constraint failed')
+            written.extend(stock_ids)
+
+        with mock.patch.object(writer, '_flush', side_effect=flush) as mocked:
+            with self.assertLogs('customer.tick_writer', 'ERROR') as logs:
+                writer.put([1, 2, 3], [100, 200, 300], timezone.now())
+                writer.put([4, 5], [400, 500], timezone.now())
+                writer.start()
+                writer.close(timeout=5)
+        self.assertFalse(writer._thread.is_alive())
+        self.assertEqual(sorted(written), [1, 3, 4, 5])
+        self.assertEqual(writer.stats()['queue_rows'], 0)
+        self.assertGreater(mocked.call_count, FLUSH_RETRIES)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('Dropped 1 rows', logs.output[0])
+        self.assertIn('[2]', logs.output[0])
+
+    def test_lost_connections_are_retried_without_dropping(self):
+        writer = TickWriter(flush_rows=1, flush_interval=60, retry_delay=0.01)
+        failures = iter(range(FLUSH_RETRIES + 2))
+        written = []
+
+        def flush(batches):
+            if next(failures, None) is not None:
+                raise OperationalError('server has gone away')
+            written.extend(np.concatenate([batch[0] for batch in batches]).tolist())
+
+        with mock.patch.object(writer, '_flush', side_effect=flush):
+            writer.put([1, 2, 3], [100, 200, 300], timezone.now())
+            writer.start()
+            writer.close(timeout=5)
+        self.assertEqual(written, [1, 2, 3])
+
+
+class ValuationTests(TestCase):
+    """Trades leave valuations to the price writers without ever losing a share"""
+
+    def setUp(self):
+        self.stock = create_stock('VALU')
+        self.account = create_customer('valued').account
+
+    def _market_value(self):
+        self.account.valuation.refresh_from_db()
+        positions = Position.objects.filter(account=self.account).select_related('stock')
+        return market_value(self.account.valuation, positions)
+
+    def test_trades_touch_neither_the_stock_nor_the_valuation(self):
+        with CaptureQueriesContext(connection) as queries:
+            add_shares(self.account, self.stock.pk, 10)
+            remove_shares(self.account, self.stock.pk, 3)
+        for query in queries.captured_queries:
+            self.assertNotIn('"Stock"', query['sql'])
+            self.assertNotIn('"AccountValuation"', query['sql'])
+        # Pending shares are valued at the current price until a price write
+        self.assertEqual(self._market_value(), Decimal('70.00'))
+
+    def test_price_write_values_pending_shares(self):
+        add_shares(self.account, self.stock.pk, 10)
+        prices = PriceArrays.load()
+        prices.apply_returns(np.full(len(prices), 0.5))
+        prices.save()
+
+        position = Position.objects.get(account=self.account)
+        self.assertEqual(position.valued_qty, 10)
+        self.account.valuation.refresh_from_db()
+        self.assertEqual(self.account.valuation.market_value, Decimal('150.00'))
+        self.assertEqual(audit(), [])
+
+        # Sold after the write: the next write moves only what's still held
+        remove_shares(self.account, self.stock.pk, 4)
+        self.assertEqual(self._market_value(), Decimal('90.00'))
+        prices = PriceArrays.load()
+        prices.apply_returns(np.full(len(prices), -0.2))
+        prices.save()
+        self.assertEqual(self._market_value(), Decimal('72.00'))
+        self.assertEqual(audit(), [])
+
+
+class PortfolioReservationTests(TestCase):
+    """Shares and cash held by resting limit orders stay in the portfolio's numbers"""
+
+    def setUp(self):
+        self.stock = create_stock('REST')
+        self.user = create_customer('rester', cash='100.00')
+        self.account = self.user.account
+        add_shares(self.account, self.stock.pk, 10)
+        TaxLot.objects.create(
+            account=self.account, stock=self.stock, opened_at=timezone.now(), quantity=10, remaining=10,
+            cost_per_share=Decimal('8.00')
+        )
+        Position.objects.filter(account=self.account).update(cost_basis=Decimal('80.00'))
+        self.client.force_login(self.user)
+
+    def _portfolio(self):
+        return self.client.get(reverse('portfolio')).context
+
+    def test_resting_sell_keeps_its_shares_in_unrealized_pnl(self):
+        engine = MatchingEngine()
+        engine.place(self.account, self.stock, 'SELL', 4, Decimal('12.00'))
+        engine.place(self.account, self.stock, 'BUY', 2, Decimal('9.00'))
+
+        context = self._portfolio()
+        position, = context['positions']
+        self.assertEqual((position.quantity, position.reserved, position.held), (6, 4, 10))
+        self.assertEqual(position.market_value, Decimal('100.00'))
+        self.assertEqual(position.unrealized_pnl, Decimal('20.00'))
+        self.assertEqual(context['total_market_value'], Decimal('100.00'))
+        # $18 of the $100 cash is held by the resting buy
+        self.assertEqual(context['total_equity'], Decimal('200.00'))
+
+    def test_position_with_every_share_reserved_is_shown(self):
+        MatchingEngine().place(self.account, self.stock, 'SELL', 10, Decimal('12.00'))
+
+        context = self._portfolio()
+        position, = context['positions']
+        self.assertEqual((position.quantity, position.held), (0, 10))
+        self.assertEqual(position.cost_basis, Decimal('80.00'))
+        self.assertEqual(context['total_unrealized_pnl'], Decimal('20.00'))
+        self.assertEqual(context['total_equity'], Decimal('200.00'))
+
+
+class PerformanceTests(TestCase):
+    """Replays and returns against hand-computed histories"""
+
+    def setUp(self):
+        self.stock = create_stock('PERF')
+        self.account = create_customer('performer').account
+        self.day = date(2026, 3, 2)
+
+    def _at(self, day):
+        return datetime.combine(self.day + timedelta(days=day), dt_time(15), tzinfo=dt_timezone.utc)
+
+    def _flow(self, day, kind, amount):
+        flow = Transaction.objects.create(account=self.account, transaction_type=kind, amount=Decimal(amount))
+        Transaction.objects.filter(pk=flow.pk).update(created_at=self._at(day))
+
+    def _fill(self, day, action, qty, price):
+        order = Order.objects.create(
+            account=self.account, stock=self.stock, action=action, quantity=qty, filled_qty=qty, status='Filled'
+        )
+        trade = Trade.objects.create(order=order, executed_price=Decimal(price), executed_qty=qty)
+        Trade.objects.filter(pk=trade.pk).update(executed_time=self._at(day))
+
+    def _close(self, day, price):
+        price = Decimal(price)
+        Candle.objects.create(
+            stock=self.stock, resolution=86400,
+            start=datetime.combine(self.day + timedelta(days=day), dt_time(0), tzinfo=dt_timezone.utc),
+            open=price, high=price, low=price, close=price
+        )
+
+    def _history(self):
+        # Deposit $1,000; buy 10 @ $50 (no candle that day, so the fill price
+        # values them); close $60; no candle, forward-filled, and a $100
+        # withdrawal; sell 4 @ $55 and close $58
+        self._flow(0, 'DEPOSIT', '1000.00')
+        self._fill(1, 'BUY', 10, '50.00')
+        self._close(2, '60.00')
+        self._flow(3, 'WITHDRAW', '100.00')
+        self._fill(4, 'SELL', 4, '55.00')
+        self._close(4, '58.00')
+        # Trade proceeds aren't flows, and nothing after `end` counts
+        Transaction.objects.create(account=self.account, transaction_type='STOCK_TRADE', amount=Decimal('500.00'))
+        self._flow(5, 'DEPOSIT', '50.00')
+
+    def test_replay(self):
+        self._history()
+        dates, cash, market_value, net_flow = performance.replay(self.account.pk, end=self.day + timedelta(days=4))
+
+        self.assertEqual(dates, [self.day + timedelta(days=i) for i in range(5)])
+        self.assertEqual(cash.tolist(), [100000, 50000, 50000, 40000, 62000])
+        self.assertEqual(market_value.tolist(), [0, 50000, 60000, 60000, 34800])
+        self.assertEqual(net_flow.tolist(), [100000, 0, 0, -10000, 0])
+
+    def test_replay_without_activity(self):
+        self.assertIsNone(performance.replay(self.account.pk))
+        self._flow(1, 'DEPOSIT', '10.00')
+        self.assertIsNone(performance.replay(self.account.pk, end=self.day))
+
+    def test_snapshots_and_returns(self):
+        self._history()
+        self.assertEqual(performance.snapshot_account(self.account.pk, end=self.day + timedelta(days=4)), 5)
+
+        result = performance.performance(self.account)
+        self.assertEqual(
+            [point[1] for point in result['points']], ['1000.00', '1000.00', '1100.00', '1000.00', '968.00']
+        )
+        self.assertEqual(result['as_of'], '2026-03-06')
+        # 1.1 on day 2, nothing on day 3 once the withdrawal is taken out, then 968/1000
+        self.assertEqual(result['time_weighted_return'], 0.0648)
+
+        window = performance.performance(self.account, start=self.day + timedelta(days=2))
+        self.assertEqual(len(window['points']), 3)
+        # The window starts at $1,100, so day 2's gain isn't in it
+        self.assertEqual(window['time_weighted_return'], -0.032)
+
+    def test_time_weighted_return_ignores_flows(self):
+        # +10%, then a $50 deposit that earns nothing
+        equity, net_flow = np.array([100.0, 110.0, 160.0]), np.array([0.0, 0.0, 50.0])
+        self.assertAlmostEqual(performance.time_weighted_return(equity, net_flow), 0.10)
+        self.assertIsNone(performance.time_weighted_return(equity[:1], net_flow[:1]))
+
+    def test_money_weighted_return(self):
+        # $100 for two years plus $100 after one, all at 10%: 100 * 1.1^2 + 100 * 1.1 = 231
+        days = np.array([0.0, 365.0, 730.0])
+        rate = performance.money_weighted_return(days, np.array([100.0, 210.0, 231.0]), np.array([0.0, 100.0, 0.0]))
+        self.assertAlmostEqual(rate, 0.10)
+
+        # Under a year the rate is over the window, not annualized
+        rate = performance.money_weighted_return(np.array([0.0, 73.0]), np.array([100.0, 102.0]), np.zeros(2))
+        self.assertAlmostEqual(rate, 0.02)
+
+        # Everything lost: no rate brings the flows to zero
+        self.assertIsNone(performance.money_weighted_return(days[:2], np.array([100.0, 0.0]), np.zeros(2)))
+
+
+class TaxLotTests(TestCase):
+    """Lot consumption order, running P&L totals and rebuilds from trade history"""
+
+    def setUp(self):
+        self.stock = create_stock('LOTS')
+        self.start = timezone.now() - timedelta(days=3)
+
+    def _account(self, name):
+        # 10 @ $10, then 10 @ $30, then 10 @ $20
+        account = create_customer(name).account
+        add_shares(account, self.stock.pk, 30)
+        for i, price in enumerate(['10.00', '30.00', '20.00']):
+            lots.open_lot(account.pk, self.stock.pk, 10, Decimal(price), opened_at=self.start + timedelta(days=i))
+        return account
+
+    def _remaining(self, account):
+        return list(TaxLot.objects.filter(account=account).order_by('opened_at').values_list('remaining', flat=True))
+
+    def test_close_lots_by_method(self):
+        # Selling 15 @ $25 out of $600 of lots
+        expected = {
+            'FIFO': (Decimal('125.00'), [0, 5, 10], Decimal('350.00')),
+            'LIFO': (Decimal('25.00'), [10, 5, 0], Decimal('250.00')),
+            'HIFO': (Decimal('-25.00'), [10, 0, 5], Decimal('200.00')),
+        }
+        for method, (realized, remaining, cost_basis) in expected.items():
+            with self.subTest(method=method):
+                account = self._account(method.lower())
+                self.assertEqual(lots.close_lots(account.pk, self.stock.pk, 15, Decimal('25.00'), method), realized)
+                self.assertEqual(self._remaining(account), remaining)
+                position = Position.objects.get(account=account, stock=self.stock)
+                self.assertEqual((position.cost_basis, position.realized_pnl), (cost_basis, realized))
+
+    def test_shares_without_lots_sell_at_cost(self):
+        account = self._account('overseller')
+        # 30 shares in lots cost $600; the other 5 add proceeds and cost alike
+        self.assertEqual(lots.close_lots(account.pk, self.stock.pk, 35, Decimal('25.00')), Decimal('150.00'))
+        self.assertEqual(self._remaining(account), [0, 0, 0])
+        self.assertEqual(Position.objects.get(account=account, stock=self.stock).cost_basis, Decimal('0.00'))
+
+    def _fill(self, account, day, action, qty, price, lot_method='FIFO'):
+        order = Order.objects.create(
+            account=account, stock=self.stock, action=action, quantity=qty, filled_qty=qty,
+            status='Filled', lot_method=lot_method
+        )
+        trade = Trade.objects.create(order=order, executed_price=Decimal(price), executed_qty=qty)
+        Trade.objects.filter(pk=trade.pk).update(executed_time=self.start + timedelta(days=day))
+
+    def test_rebuild_replays_trade_history(self):
+        account = create_customer('rebuilt').account
+        for day, price in enumerate(['10.00', '30.00', '20.00']):
+            self._fill(account, day, 'BUY', 10, price)
+        self._fill(account, 3, 'SELL', 15, '25.00', lot_method='HIFO')
+        add_shares(account, self.stock.pk, 15)
+        # A ledger that has drifted from the history
+        TaxLot.objects.create(
+            account=account, stock=self.stock, opened_at=self.start, quantity=99, remaining=99,
+            cost_per_share=Decimal('1.00')
+        )
+
+        self.assertEqual(lots.rebuild([account.pk]), (1, 3, []))
+        self.assertEqual(self._remaining(account), [10, 0, 5])
+        position = Position.objects.get(account=account, stock=self.stock)
+        self.assertEqual((position.cost_basis, position.realized_pnl), (Decimal('200.00'), Decimal('-25.00')))
+
+        # The same history through close_lots gives the same totals
+        live = self._account('live')
+        self.assertEqual(lots.close_lots(live.pk, self.stock.pk, 15, Decimal('25.00'), 'HIFO'), position.realized_pnl)
+
+    def test_rebuild_reports_shares_the_history_misses(self):
+        account = create_customer('gifted').account
+        self._fill(account, 0, 'BUY', 10, '10.00')
+        add_shares(account, self.stock.pk, 12)
+
+        out = StringIO()
+        call_command('rebuild_lots', '--account', str(account.pk), stdout=out)
+        self.assertIn(f"Account {account.pk}, stock {self.stock.pk}: 10 shares in lots, 12 held", out.getvalue())
+        self.assertIn("Rebuilt 1 lots for 1 accounts", out.getvalue())
+
+
+class LeaderboardTests(TestCase):
+    """Equity counts resting limit orders, and the board is shared through the database"""
+
+    def setUp(self):
+        self.stock = create_stock('RANK')
+        self.accounts = []
+        for name, cash, shares in (('alpha', '50.00', 10), ('beta', '120.00', 0), ('gamma', '100.00', 0)):
+            account = create_customer(name, cash).account
+            if shares:
+                add_shares(account, self.stock.pk, shares)
+            self.accounts.append(account)
+
+    def test_equity_and_aum_include_reservations(self):
+        alpha, beta, gamma = self.accounts
+        engine = MatchingEngine()
+        # alpha's 10 shares and beta's $90 move into resting orders
+        engine.place(alpha, self.stock, 'SELL', 10, Decimal('20.00'))
+        engine.place(beta, self.stock, 'BUY', 10, Decimal('9.00'))
+
+        board = leaderboard.compute(size=2)
+        self.assertEqual(
+            [(row['user'], row['equity']) for row in board['top']], [('alpha', '150.00'), ('beta', '120.00')]
+        )
+        self.assertEqual(board['top'][0]['market_value'], '100.00')
+        self.assertEqual(board['top'][1]['cash'], '120.00')
+        self.assertEqual((board['cash'], board['market_value'], board['aum']), ('270.00', '100.00', '370.00'))
+
+    def test_board_is_served_from_the_database(self):
+        leaderboard.refresh()
+        cache.clear()
+        # Another process: one read of the stored row, no aggregate
+        with self.assertNumQueries(1):
+            board = leaderboard.get_leaderboard()
+        self.assertEqual(board['top'][0]['user'], 'alpha')
+
+
+class QuoteETagTests(TestCase):
+    """The stock list answers 304 until a price write, in any process, bumps the quote version"""
+
+    def setUp(self):
+        create_stock('ETAG')
+        user = create_customer('poller')
+        self.client.force_login(user)
+        cache.clear()
+
+    def _get(self, if_none_match=None):
+        headers = {'HTTP_IF_NONE_MATCH': if_none_match} if if_none_match else {}
+        return self.client.get(reverse('stock-list'), HTTP_ACCEPT='application/json', **headers)
+
+    def test_conditional_polls(self):
+        first = self._get()
+        self.assertEqual(first.status_code, 200)
+        tag = first['ETag']
+        self.assertEqual(first.json()[0]['current_price'], '10.00')
+
+        for header in (tag, f'W/{tag}', f'"other", {tag}', '*'):
+            self.assertEqual(self._get(header).status_code, 304, header)
+        # Entity tags are compared whole, not searched for as substrings
+        for header in (f'"x{tag[1:]}', tag[:-1] + '0"', '"q"'):
+            self.assertEqual(self._get(header).status_code, 200, header)
+
+        # A price write from another process: its cache isn't ours
+        prices = PriceArrays.load()
+        prices.apply_returns(np.full(len(prices), 0.1))
+        prices.save()
+        cache.clear()
+        response = self._get(tag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], tag)
+        self.assertEqual(response.json()[0]['current_price'], '11.00')
+        self.assertEqual(self._get(response['ETag']).status_code, 304)
+
+
+@mock.patch('customer.views.ensure_feed')
+class QuoteStreamTests(TestCase):
+    """The SSE route streams under ASGI and refuses WSGI, which would buffer it forever"""
+
+    def setUp(self):
+        self.stock = create_stock('SSE')
+        self.user = create_customer('streamer')
+
+    def test_wsgi_is_refused(self, ensure_feed):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('api_quote_stream'), {'tickers': 'SSE'})
+        self.assertEqual(response.status_code, 501)
+        ensure_feed.assert_not_called()
+
+    async def test_asgi_streams_snapshot_then_updates(self, ensure_feed):
+        await self.async_client.aforce_login(self.user)
+        hub = quote_stream.QuoteHub()
+        with mock.patch.object(quote_stream, 'hub', hub):
+            response = await self.async_client.get(reverse('api_quote_stream'), {'tickers': 'sse'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            events = aiter(response.streaming_content)
+            try:
+                snapshot = (await anext(events)).decode()
+                self.assertTrue(snapshot.startswith('event: snapshot\n'))
+                self.assertIn('"ticker":"SSE","price":"10.00"', snapshot)
+
+                hub.publish({self.stock.pk: quote_stream.quote('SSE', '10.50', '10.50', '10.00')})
+                update = (await anext(events)).decode()
+                self.assertTrue(update.startswith('event: quotes\n'))
+                self.assertIn('"price":"10.50"', update)
+            finally:
+                await events.aclose()
+
+
+class SimulatorControlTests(TestCase):
+    """The dashboard starts, stops and tunes the simulator through its control row, and the daemon ticks by it"""
+
+    def setUp(self):
+        admin = create_customer('operator')
+        admin.Role = 'ADMIN'
+        admin.save()
+        self.client.force_login(admin)
+
+    def _post(self, **data):
+        return self.client.post(reverse('api_admin_simulator'), json.dumps(data), content_type='application/json')
+
+    def test_rejects_non_finite_and_out_of_range_settings(self):
+        for field, value in (('interval', 'nan'), ('interval', 'inf'), ('interval', 0), ('interval', 86400),
+                             ('volatility', 'nan'), ('volatility', '-inf'), ('volatility', 51)):
+            response = self._post(action='start', **{field: value})
+            self.assertEqual(response.status_code, 400, (field, value))
+        control = SimulatorControl.get()
+        self.assertEqual((control.desired_state, control.interval_seconds, control.volatility), ('STOPPED', 5.0, 0.5))
+
+    def test_start_with_settings(self):
+        response = self._post(action='start', interval=2, volatility='1.5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['desired_state'], 'RUNNING')
+        control = SimulatorControl.get()
+        self.assertEqual((control.interval_seconds, control.volatility), (2.0, 1.5))
+
+    def test_stop_and_daemon_status(self):
+        SimulatorControl.objects.update_or_create(
+            SimulatorID=1, defaults={'desired_state': 'RUNNING', 'status': 'RUNNING', 'heartbeat_at': timezone.now()}
+        )
+        data = self._post(action='stop').json()
+        self.assertEqual((data['desired_state'], data['status'], data['alive']), ('STOPPED', 'RUNNING', True))
+
+        # A daemon that missed its heartbeats is reported offline whatever it last wrote
+        SimulatorControl.objects.update(heartbeat_at=timezone.now() - timedelta(minutes=5))
+        data = self.client.get(reverse('api_admin_simulator')).json()
+        self.assertEqual((data['status'], data['alive']), ('OFFLINE', False))
+
+    def test_tick_moves_every_price_and_reloads_new_stocks(self):
+        for ticker in ('SIMA', 'SIMB'):
+            create_stock(ticker)
+        simulator = MarketSimulator(seed=3, reload_every=2)
+
+        simulator.tick(2.0, 1.0)
+        prices = Stock.objects.values_list('current_price', flat=True)
+        self.assertTrue(all(Decimal('9.80') <= price <= Decimal('10.20') for price in prices))
+        self.assertEqual(simulator.writer.stats()['queue_rows'], 2)
+
+        create_stock('SIMC')
+        simulator.tick(2.0, 1.0)
+        self.assertEqual(simulator.writer.stats()['queue_rows'], 4)
+        # Picked up at the next reload
+        simulator.tick(2.0, 1.0)
+        self.assertEqual(simulator.writer.stats()['queue_rows'], 7)
+
+    @mock.patch('customer.simulator.is_market_open', return_value=(True, 'Market is open'))
+    @mock.patch.object(TickWriter, '_flush')
+    def test_run_ticks_while_running_and_reports_back(self, flush, market_open):
+        create_stock('SIMA')
+        SimulatorControl.objects.update_or_create(
+            SimulatorID=1, defaults={'desired_state': 'RUNNING', 'interval_seconds': 0.01}
+        )
+
+        MarketSimulator(seed=3).run(stop_after=3)
+
+        control = SimulatorControl.get()
+        self.assertEqual((control.ticks_total, control.status), (3, 'OFFLINE'))
+        self.assertIsNotNone(control.last_tick_at)
+        self.assertEqual(control.queue_rows, 0)
+        # close() flushed the three queued market ticks
+        self.assertEqual(sum(len(batch[0]) for call in flush.call_args_list for batch in call.args[0]), 3)
+
+
+@override_settings(MARKET_SCHEDULE_LOCAL_TTL=0)
+class MarketScheduleCacheTests(TestCase):
+    """Schedule and holiday changes reach every process, however the cache is configured"""
+
+    def setUp(self):
+        self.schedule = MarketSchedule.objects.create(
+            Status='OPEN', OpenHour=0, OpenMinute=0, CloseHour=23, CloseMinute=59
+        )
+
+    def _changed_elsewhere(self):
+        # Another process's signal handler: it moves the version, but its cache isn't ours
+        sequences.advance(market_calendar.CALENDAR_SEQUENCE)
+
+    def test_schedule_change_from_another_process(self):
+        self.assertEqual(get_schedule().Status, 'OPEN')
+        MarketSchedule.objects.filter(pk=self.schedule.pk).update(Status='CLOSED')
+        self._changed_elsewhere()
+        self.assertEqual(get_schedule().Status, 'CLOSED')
+        self.assertEqual(is_market_open(), (False, "Market is currently closed"))
+
+    def test_saves_and_deletes_invalidate_the_schedule(self):
+        self.assertEqual(get_schedule().Status, 'OPEN')
+        self.schedule.Status = 'CLOSED'
+        self.schedule.save()
+        self.assertEqual(get_schedule().Status, 'CLOSED')
+
+        self.schedule.delete()
+        self.assertIsNone(get_schedule())
+        self.assertEqual(is_market_open(), (False, "Market schedule not configured"))
+        MarketSchedule.objects.create(Status='OPEN', OpenHour=0, OpenMinute=0, CloseHour=23, CloseMinute=59)
+        self.assertEqual(get_schedule().Status, 'OPEN')
+
+    @override_settings(MARKET_SCHEDULE_LOCAL_TTL=60)
+    def test_cached_schedule_costs_no_queries(self):
+        get_schedule()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_schedule().Status, 'OPEN')
+
+    def test_rolled_back_change_is_never_seen(self):
+        get_schedule()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.schedule.Status = 'CLOSED'
+            self.schedule.save()
+            self.assertEqual(get_schedule().Status, 'CLOSED')
+            raise RuntimeError('rolled back')
+        # The copy cached under the rolled-back version isn't used again
+        self.assertEqual(get_schedule().Status, 'OPEN')
+        self._changed_elsewhere()
+        self.assertEqual(get_schedule().Status, 'OPEN')
+
+    def test_holiday_changes(self):
+        calendar = get_calendar(self.schedule)
+        today = calendar.today()
+        self.assertIsNotNone(calendar.session_on(today))
+
+        MarketHoliday.objects.bulk_create([MarketHoliday(date=today, name='Snow Day')])
+        self._changed_elsewhere()
+        calendar = get_calendar(self.schedule)
+        self.assertIsNone(calendar.session_on(today))
+        self.assertEqual(calendar.holiday_on(today), ('Snow Day', None))
+
+        # Saved here: the cached calendar is carried over with the day recomputed
+        tomorrow = today + timedelta(days=1)
+        MarketHoliday.objects.create(date=tomorrow, name='Half Day', close_hour=12, close_minute=0)
+        with self.assertNumQueries(1):
+            calendar = get_calendar(self.schedule)
+        self.assertEqual(calendar.local(calendar.session_on(tomorrow)[1]).hour, 12)
+        self.assertIsNone(calendar.session_on(today))
+
+
+class MarketCalendarTests(TestCase):
+    """Sessions follow the schedule's local hours through weekends, holidays, early closes and DST"""
+
+    def setUp(self):
+        self.schedule = MarketSchedule.objects.create(
+            Status='OPEN', OpenHour=9, OpenMinute=30, CloseHour=16, CloseMinute=0,
+            TimeZone='America/New_York', TradingDays='01234'
+        )
+
+    def _calendar(self, first, last):
+        calendar = market_calendar.MarketCalendar(self.schedule)
+        calendar.extend(first, last)
+        return calendar
+
+    def _utc(self, *args):
+        return int(datetime(*args, tzinfo=dt_timezone.utc).timestamp())
+
+    def test_sessions_keep_local_hours_across_dst(self):
+        # US clocks went forward on Sunday 2024-03-10
+        calendar = self._calendar(date(2024, 3, 8), date(2024, 3, 12))
+        self.assertEqual(
+            calendar.sessions(self._utc(2024, 3, 8), 3),
+            [(self._utc(2024, 3, 8, 14, 30), self._utc(2024, 3, 8, 21)),
+             (self._utc(2024, 3, 11, 13, 30), self._utc(2024, 3, 11, 20)),
+             (self._utc(2024, 3, 12, 13, 30), self._utc(2024, 3, 12, 20))]
+        )
+        saturday = self._utc(2024, 3, 9, 15)
+        self.assertFalse(calendar.is_open(saturday))
+        self.assertEqual(calendar.closed_message(saturday), "Market is closed on weekends")
+        self.assertEqual(calendar.next_open(saturday), self._utc(2024, 3, 11, 13, 30))
+        # Open through the close itself, and not a second later
+        self.assertTrue(calendar.is_open(self._utc(2024, 3, 11, 20)))
+        self.assertFalse(calendar.is_open(self._utc(2024, 3, 11, 20, 0, 1)))
+        self.assertEqual(calendar.next_close(self._utc(2024, 3, 11, 15)), self._utc(2024, 3, 11, 20))
+
+    def test_holidays_and_early_closes(self):
+        MarketHoliday.objects.create(date=date(2024, 7, 3), name='Independence Eve', close_hour=13, close_minute=0)
+        MarketHoliday.objects.create(date=date(2024, 7, 4), name='Independence Day')
+        calendar = self._calendar(date(2024, 7, 2), date(2024, 7, 5))
+
+        self.assertEqual(
+            calendar.session_on(date(2024, 7, 3)), (self._utc(2024, 7, 3, 13, 30), self._utc(2024, 7, 3, 17))
+        )
+        self.assertEqual(calendar.holiday_on(date(2024, 7, 3)), ('Independence Eve', dt_time(13, 0)))
+        self.assertEqual(calendar.closed_message(self._utc(2024, 7, 3, 18)), "Market closed at 01:00 PM")
+        self.assertIsNone(calendar.session_on(date(2024, 7, 4)))
+        self.assertEqual(calendar.closed_message(self._utc(2024, 7, 4, 15)), "Market is closed for Independence Day")
+        self.assertEqual(calendar.next_open(self._utc(2024, 7, 3, 18)), self._utc(2024, 7, 5, 13, 30))
+
+        # Removing a holiday restores that day's full session
+        calendar.set_day(date(2024, 7, 4), None)
+        self.assertEqual(
+            calendar.session_on(date(2024, 7, 4)), (self._utc(2024, 7, 4, 13, 30), self._utc(2024, 7, 4, 20))
+        )
+        self.assertIsNone(calendar.holiday_on(date(2024, 7, 4)))
+        self.assertEqual(len(calendar.sessions(self._utc(2024, 7, 2), 10)), 4)
+
+    def test_extend_drops_past_days_and_appends_new_ones(self):
+        calendar = self._calendar(date(2024, 3, 4), date(2024, 3, 6))
+        calendar.extend(date(2024, 3, 5), date(2024, 3, 8))
+        self.assertEqual(calendar.days, [date(2024, 3, day).toordinal() for day in (5, 6, 7, 8)])
+        self.assertEqual(calendar.opens, sorted(calendar.opens))
+
+
+class MarketHolidayApiTests(TestCase):
+    """The admin holiday endpoints answer bad dates with 4xx, not a 500"""
+
+    def setUp(self):
+        admin = create_customer('admin')
+        admin.is_staff = True
+        admin.save()
+        self.client.force_login(admin)
+
+    def test_impossible_dates(self):
+        for day in ('2024-02-30', '2024-13-01', 'tomorrow'):
+            response = self.client.post(reverse('api_admin_market_holidays'), {'date': day, 'name': 'Bad'})
+            self.assertEqual(response.status_code, 400, day)
+            response = self.client.delete(reverse('api_admin_market_holiday', args=[day]))
+            self.assertEqual(response.status_code, 404, day)
+        self.assertFalse(MarketHoliday.objects.exists())
+
+    def test_add_and_delete(self):
+        response = self.client.post(reverse('api_admin_market_holidays'), {'date': '2024-02-29', 'name': 'Leap'})
+        self.assertEqual(response.status_code, 201)
+        response = self.client.delete(reverse('api_admin_market_holiday', args=['2024-02-29']))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(MarketHoliday.objects.exists())
+
+
+class PortfolioActivityTests(TestCase):
+    """The portfolio page's query count must not grow with account history"""
+
+    def setUp(self):
+        self.stock = create_stock('HIST')
+        self.user = create_customer('historian')
+        self.account = self.user.account
+        Position.objects.create(account=self.account, stock=self.stock, quantity=5)
+        self.client.force_login(self.user)
+
+    def _add_history(self, count):
+        for i in range(count):
+            order = Order.objects.create(
+                account=self.account, stock=self.stock, action='BUY', quantity=1,
+                filled_qty=1, status='Executed'
+            )
+            Trade.objects.create(order=order, executed_price=Decimal('10.00') + i, executed_qty=1)
+            Transaction.objects.create(account=self.account, transaction_type='DEPOSIT', amount=Decimal('100.00'))
+
+    def test_portfolio_query_count_is_constant(self):
+        # Session, user, account, positions, limit order reservations and one
+        # UNION for the activity feed
+        self._add_history(2)
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('portfolio'))
+        self.assertEqual(len(response.context['recent_orders']), 4)
+
+        self._add_history(40)
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('portfolio'))
+        activity = response.context['recent_orders']
+        self.assertEqual(len(activity), 15)
+        dates = [row['date'] for row in activity]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+        # The newest order carries its fill price, the newest deposit its amount
+        self.assertIn({'type': 'BUY', 'stock': 'HIST', 'quantity': 1, 'price': Decimal('49.00')},
+                      [{k: v for k, v in row.items() if k != 'date'} for row in activity])
+        self.assertIn({'type': 'DEPOSIT', 'stock': '-', 'quantity': '-', 'price': Decimal('100.00')},
+                      [{k: v for k, v in row.items() if k != 'date'} for row in activity])
+
+
+class KeysetPaginationTests(TestCase):
+    """Order and trade history pages by (time, ID) keyset: constant cost, no row skipped or repeated"""
+
+    def setUp(self):
+        self.stock = create_stock('PAGE')
+        self.user = create_customer('pager')
+        self.account = self.user.account
+        for i in range(30):
+            order = Order.objects.create(
+                account=self.account, stock=self.stock, action='BUY', quantity=1, filled_qty=1, status='Executed'
+            )
+            Trade.objects.create(order=order, executed_price=Decimal('10.00') + i, executed_qty=1)
+        # Someone else's history never shows up
+        other = create_customer('stranger').account
+        Order.objects.create(account=other, stock=self.stock, action='BUY', quantity=1, status='Executed')
+        self.client.force_login(self.user)
+
+    def _pages(self, url, key):
+        seen = []
+        while url:
+            # Session, user and one query for the page, however deep it is
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+            body = response.json()
+            self.assertEqual(set(body), {'next', 'results'})
+            self.assertLessEqual(len(body['results']), 7)
+            self.assertEqual(body['results'][0]['stock_ticker'], 'PAGE')
+            seen += [row[key] for row in body['results']]
+            url = body['next']
+        return seen
+
+    def _tie(self, rows, field):
+        # The oldest 16 rows share a timestamp; ties are broken by ID
+        rows = rows.order_by('pk')
+        rows.filter(pk__lte=rows[15].pk).update(**{field: getattr(rows.first(), field)})
+
+    def test_trade_history_keyset_pages(self):
+        self._tie(Trade.objects.filter(account=self.account), 'executed_time')
+        expected = list(
+            Trade.objects.filter(account=self.account)
+            .order_by('-executed_time', '-TradeID').values_list('TradeID', flat=True)
+        )
+        self.assertEqual(self._pages(reverse('trade-list') + '?page_size=7', 'TradeID'), expected)
+
+    def test_order_history_keyset_pages(self):
+        self._tie(Order.objects.filter(account=self.account), 'created_at')
+        expected = list(
+            Order.objects.filter(account=self.account)
+            .order_by('-created_at', '-OrderID').values_list('OrderID', flat=True)
+        )
+        self.assertEqual(len(expected), 30)
+        self.assertEqual(self._pages(reverse('order-list') + '?page_size=7', 'OrderID'), expected)
@@ -0,0 +1,162 @@
+"""
+Columnar on-disk tick store.
+
+Each ticker gets a directory under TICK_STORE_DIR:
+
+    timestamps.i8   int64 epoch microseconds, ascending
+    prices.i8       int64 price in cents, one per timestamp
+    index.i8        every BLOCK_ROWS-th timestamp, for range lookups
+    meta.json       row count, time span and export high-water mark
+
+Readers memory-map the two columns, so a scan over millions of ticks
+touches only the pages it reads and builds no Decimals or model instances.
+export_ticks appends new ticks in time order. It writes the data first
+and meta.json last, with an atomic rename, and readers only trust meta's
+row count. A reader therefore never sees a half-written append, and a
+crashed export is truncated back on the next run.
+
+The store is append-only: ticks pruned from PriceTick later
+(prune_ticks) stay here at full resolution, so export before you prune.
+"""
+import json
+import os
+import shutil
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+import numpy as np
+from django.conf import settings
+from .models import PriceTick
+
+BLOCK_ROWS = 1024
+EXPORT_CHUNK_ROWS = 100_000
+_DTYPE = np.dtype('<i8')
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _root(root=None):
+    return Path(root or settings.TICK_STORE_DIR)
+
+
+def to_us(timestamp):
+    """Exact epoch microseconds of an aware datetime"""
+    return (timestamp - _EPOCH) // _MICROSECOND
+
+
+def from_us(us):
+    return _EPOCH + us * _MICROSECOND
+
+
+def _read_meta(path):
+    try:
+        with open(path / 'meta.json') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_meta(path, meta):
+    tmp = path / 'meta.json.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, path / 'meta.json')
+
+
+class TickSeries:
+    """Read-only, memory-mapped view of one ticker's ticks"""
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.rows = meta['rows']
+        self.first_us = meta['first_us']
+        self.last_us = meta['last_us']
+        self.timestamps = self._map('timestamps.i8')
+        self.prices = self._map('prices.i8')
+        self.index = np.fromfile(path / 'index.i8', dtype=_DTYPE)
+
+    def _map(self, name):
+        if not self.rows:
+            return np.empty(0, dtype=_DTYPE)
+        return np.memmap(self.path / name, dtype=_DTYPE, mode='r', shape=(self.rows,))
+
+    def __len__(self):
+        return self.rows
+
+    def _locate(self, us, side):
+        # The sparse index narrows the search to one block of the memmap
+        block = int(np.searchsorted(self.index, us, side))
+        # min(): the index can be replaced a moment before meta.json during an export
+        lo = min(max(block - 1, 0) * BLOCK_ROWS, self.rows)
+        hi = min(block * BLOCK_ROWS + 1, self.rows)
+        return lo + int(np.searchsorted(self.timestamps[lo:hi], us, side))
+
+    def range(self, start=None, end=None):
+        """
+        (timestamps, prices) for start <= t <= end, as zero-copy slices of the
+        memmaps. start/end are aware datetimes or None for open-ended.
+        """
+        lo = 0 if start is None else self._locate(to_us(start), 'left')
+        hi = self.rows if end is None else self._locate(to_us(end), 'right')
+        return self.timestamps[lo:hi], self.prices[lo:hi]
+
+
+def open_series(ticker, root=None):
+    """The ticker's TickSeries, or None if it was never exported"""
+    path = _root(root) / ticker.upper()
+    meta = _read_meta(path)
+    return TickSeries(path, meta) if meta else None
+
+
+def export_ticks(stock, root=None, rebuild=False, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Append the stock's ticks newer than its last export. `rebuild` starts the
+    ticker over, which also picks up ticks inserted out of time order (e.g. a
+    backfill after the last export). Returns the number of ticks appended.
+    """
+    path = _root(root) / stock.ticker.upper()
+    if rebuild and path.exists():
+        shutil.rmtree(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    meta = _read_meta(path) or {'rows': 0, 'first_us': None, 'last_us': None}
+    rows = meta['rows']
+    # Drop anything a crashed export wrote past the last committed row count
+    for name in ('timestamps.i8', 'prices.i8'):
+        with open(path / name, 'ab') as f:
+            f.truncate(rows * _DTYPE.itemsize)
+
+    ticks = PriceTick.objects.filter(stock=stock).order_by('timestamp', 'TickID')
+    if meta['last_us'] is not None:
+        ticks = ticks.filter(timestamp__gt=from_us(meta['last_us']))
+
+    appended = 0
+    chunk = []
+    with open(path / 'timestamps.i8', 'ab') as ts_file, open(path / 'prices.i8', 'ab') as price_file:
+        def write(chunk):
+            ts_file.write(np.fromiter((to_us(t) for t, _ in chunk), dtype=_DTYPE).tobytes())
+            price_file.write(np.fromiter((int(p * 100) for _, p in chunk), dtype=_DTYPE).tobytes())
+
+        for row in ticks.values_list('timestamp', 'price').iterator(chunk_size=chunk_rows):
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                write(chunk)
+                appended += len(chunk)
+                chunk = []
+        if chunk:
+            write(chunk)
+            appended += len(chunk)
+
+    if appended or not (path / 'index.i8').exists():
+        rows += appended
+        timestamps = np.memmap(path / 'timestamps.i8', dtype=_DTYPE, mode='r', shape=(rows,)) if rows else None
+        index = timestamps[::BLOCK_ROWS] if rows else np.empty(0, dtype=_DTYPE)
+        tmp = path / 'index.i8.tmp'
+        np.ascontiguousarray(index).tofile(tmp)
+        os.replace(tmp, path / 'index.i8')
+        _write_meta(path, {
+            'rows': rows,
+            'first_us': int(timestamps[0]) if rows else None,
+            'last_us': int(timestamps[-1]) if rows else None,
+        })
+        del timestamps
+    return appended
@@ -0,0 +1,282 @@
+"""
+Buffered PriceTick writer.
+
+Producers put() whole market ticks (every stock's price at one instant)
+into a bounded in-memory buffer. A background thread flushes the buffer
+once it holds flush_rows ticks, or once the oldest buffered tick is
+flush_interval seconds old. A flush inserts every buffered tick with one
+executemany and folds it into the candles, in one transaction.
+
+If the DB falls behind and the buffer reaches max_rows, put() blocks until
+a flush makes room. That slows the producer down instead of growing memory
+or dropping ticks. A failed flush keeps its ticks and is retried; while
+the database can't be reached that goes on for as long as it's down.
+
+Other errors come from the ticks themselves, e.g. a stock deleted after
+the simulator loaded it. After FLUSH_RETRIES of those in a row, each
+buffered market tick is written on its own, and one that still fails is
+split in halves until the rows that fail alone are found. Those rows are
+dropped, logged and counted in tick_writer.dropped_rows; the rest are
+written and the writer keeps going.
+
+close() is the one place ticks can be lost. If flushes are still failing
+when its timeout runs out, or after CLOSE_RETRIES attempts without a
+timeout, the ticks left in the buffer are dropped. This is logged as an
+error and counted in tick_writer.dropped_rows, so shutdown can't hang on
+a database that's down.
+
+Queue depth, flush latency and throughput are published to the metrics
+registry under tick_writer.* and returned by stats().
+"""
+import logging
+import threading
+import time
+from collections import deque
+import numpy as np
+from django.db import InterfaceError, OperationalError, connection, transaction
+from .candles import fold as fold_candles
+from .metrics import metrics
+from .pricing import TICK_ID_BLOCK_SIZE, allocate_tick_ids, insert_ticks
+from .sequences import IdBlock
+
+logger = logging.getLogger(__name__)
+
+# Failed flushes close() allows when it isn't given a timeout
+CLOSE_RETRIES = 3
+# Failed flushes, other than lost connections, before the buffer is written a tick at a time
+FLUSH_RETRIES = 3
+
+
+class TickWriterFull(Exception):
+    pass
+
+
+class TickWriter:
+    def __init__(self, flush_rows=50_000, flush_interval=1.0, max_rows=500_000, retry_delay=1.0, log=None):
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_rows = max(max_rows, flush_rows)
+        self.retry_delay = retry_delay
+        self.log = log or (lambda message: None)
+        self.tick_ids = IdBlock(allocate_tick_ids, TICK_ID_BLOCK_SIZE)
+
+        # (stock_ids, cents, timestamp, enqueued_at) per market tick
+        self._batches = deque()
+        self._rows = 0
+        self._condition = threading.Condition()
+        self._closing = False
+        self._close_deadline = None
+        self._close_failures = 0
+        self._thread = None
+        self._last_flush_ms = 0.0
+        self._write_rows_per_sec = 0.0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='tick-writer', daemon=True)
+        self._thread.start()
+        return self
+
+    def put(self, stock_ids, cents, timestamp, timeout=None):
+        """
+        Queue one price per stock taken at `timestamp`. Copies the arrays.
+        Blocks while the buffer is full; raises TickWriterFull after `timeout` seconds.
+        """
+        count = len(stock_ids)
+        batch = (np.array(stock_ids, dtype=np.int64), np.array(cents, dtype=np.int64), timestamp, time.monotonic())
+        with self._condition:
+            if self._rows + count > self.max_rows and self._rows:
+                metrics.incr('tick_writer.backpressure_waits')
+                start = time.perf_counter()
+                # Always admit a batch into an empty buffer, however large
+                if not self._condition.wait_for(
+                    lambda: self._rows + count <= self.max_rows or not self._rows or self._closing, timeout
+                ):
+                    raise TickWriterFull(f"Tick buffer full ({self._rows} rows)")
+                metrics.observe('tick_writer.backpressure_ms', (time.perf_counter() - start) * 1000)
+            if self._closing:
+                raise TickWriterFull("Tick writer is closed")
+            self._batches.append(batch)
+            self._rows += count
+            metrics.gauge('tick_writer.queue_rows', self._rows)
+            if self._rows >= self.flush_rows:
+                self._condition.notify_all()
+
+    def close(self, timeout=None):
+        """
+        Flush everything still buffered and stop the background thread. Ticks
+        that still can't be written after `timeout` seconds (or CLOSE_RETRIES
+        failed flushes without one) are dropped with a logged error.
+        """
+        with self._condition:
+            self._closing = True
+            if timeout is not None:
+                self._close_deadline = time.monotonic() + timeout
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'queue_rows': self._rows,
+                'last_flush_ms': self._last_flush_ms,
+                'write_rows_per_sec': self._write_rows_per_sec,
+            }
+
+    def _due(self):
+        if not self._batches:
+            return False
+        return (
+            self._closing
+            or self._rows >= self.flush_rows
+            or time.monotonic() - self._batches[0][3] >= self.flush_interval
+        )
+
+    def _run(self):
+        failures = 0
+        try:
+            while True:
+                with self._condition:
+                    while not self._due():
+                        if self._closing:
+                            return
+                        # Wake up in time for the oldest batch's deadline
+                        wait = self.flush_interval
+                        if self._batches:
+                            wait = max(self._batches[0][3] + self.flush_interval - time.monotonic(), 0)
+                        self._condition.wait(wait)
+                    batches = list(self._batches)
+
+                try:
+                    if failures >= FLUSH_RETRIES:
+                        self._flush_apart(batches)
+                    else:
+                        self._flush(batches)
+                        self._written(len(batches))
+                    failures = 0
+                except Exception as e:
+                    metrics.incr('tick_writer.flush_errors')
+                    connection.close()
+                    delay = self._retry_delay_or_none()
+                    if delay is None:
+                        self._drop(e)
+                        return
+                    if not isinstance(e, (OperationalError, InterfaceError)):
+                        failures += 1
+                    self.log(f"Tick flush failed, retrying: {e}")
+                    time.sleep(delay)
+        finally:
+            connection.close()
+
+    def _written(self, count):
+        """Remove the first `count` market ticks from the buffer once they're written"""
+        with self._condition:
+            for _ in range(count):
+                self._rows -= len(self._batches.popleft()[0])
+            metrics.gauge('tick_writer.queue_rows', self._rows)
+            self._condition.notify_all()
+
+    def _flush_apart(self, batches):
+        """Write one market tick at a time, dropping the rows of any that fail. Raises on a lost connection."""
+        for batch in batches:
+            try:
+                self._flush([batch])
+            except (OperationalError, InterfaceError):
+                raise
+            except Exception as e:
+                self._isolate(batch, e)
+            self._written(1)
+
+    def _isolate(self, batch, error):
+        """
+        Write a failing market tick in ever smaller pieces and drop the rows
+        that fail alone. On a lost connection the rows not yet written
+        replace it at the head of the buffer and the error is raised.
+        """
+        stock_ids, cents, timestamp, enqueued_at = batch
+        half = len(stock_ids) // 2
+        pieces = [np.arange(half, len(stock_ids)), np.arange(half)]
+        failed = []
+        while pieces:
+            rows = pieces.pop()
+            if not len(rows):
+                continue
+            try:
+                self._flush([(stock_ids[rows], cents[rows], timestamp, enqueued_at)])
+            except (OperationalError, InterfaceError):
+                unwritten = np.sort(np.concatenate(pieces + [rows] + [np.array(failed, dtype=np.int64)]))
+                with self._condition:
+                    self._batches[0] = (stock_ids[unwritten], cents[unwritten], timestamp, enqueued_at)
+                    self._rows -= len(stock_ids) - len(unwritten)
+                    self._condition.notify_all()
+                raise
+            except Exception as e:
+                if len(rows) == 1:
+                    failed.append(rows[0])
+                    error = e
+                else:
+                    half = len(rows) // 2
+                    pieces += [rows[half:], rows[:half]]
+
+        if not failed:
+            return
+        dropped = stock_ids[failed].tolist()
+        metrics.incr('tick_writer.dropped_rows', len(dropped))
+        logger.error("Dropped %s rows of the market tick at %s that can't be written (stocks %s): %s",
+                     len(dropped), timestamp.isoformat(), dropped, error)
+        self.log(f"Dropped {len(dropped):,} tick rows that can't be written: {error}")
+
+    def _retry_delay_or_none(self):
+        """Seconds to wait before retrying a failed flush, or None if close() has given up"""
+        with self._condition:
+            if not self._closing:
+                return self.retry_delay
+            self._close_failures += 1
+            if self._close_deadline is None:
+                return self.retry_delay if self._close_failures < CLOSE_RETRIES else None
+            remaining = self._close_deadline - time.monotonic()
+            return min(self.retry_delay, remaining) if remaining > 0 else None
+
+    def _drop(self, error):
+        with self._condition:
+            dropped, ticks = self._rows, len(self._batches)
+            self._batches.clear()
+            self._rows = 0
+            metrics.gauge('tick_writer.queue_rows', 0)
+            self._condition.notify_all()
+        metrics.incr('tick_writer.dropped_rows', dropped)
+        logger.error("Tick writer closed with %s rows (%s market ticks) unwritten: %s", dropped, ticks, error)
+        self.log(f"Tick flush failed while closing; dropped {dropped:,} rows: {error}")
+
+    def _flush(self, batches):
+        start = time.perf_counter()
+        count = sum(len(batch[0]) for batch in batches)
+        first_id = self.tick_ids.take(count)
+        adapt = connection.ops.adapt_datetimefield_value
+
+        rows = []
+        tick_id = first_id
+        for stock_ids, cents, timestamp, _ in batches:
+            rows.extend(zip(
+                range(tick_id, tick_id + len(stock_ids)),
+                stock_ids.tolist(),
+                (cents / 100).tolist(),
+                [adapt(timestamp)] * len(stock_ids)
+            ))
+            tick_id += len(stock_ids)
+
+        with transaction.atomic():
+            insert_ticks(rows)
+            fold_candles(
+                np.concatenate([batch[0] for batch in batches]),
+                np.concatenate([batch[1] for batch in batches]),
+                np.concatenate([np.full(len(batch[0]), int(batch[2].timestamp())) for batch in batches])
+            )
+
+        elapsed = time.perf_counter() - start
+        with self._condition:
+            self._last_flush_ms = elapsed * 1000
+            self._write_rows_per_sec = count / elapsed if elapsed else 0.0
+        metrics.observe('tick_writer.flush_ms', elapsed * 1000)
+        metrics.incr('tick_writer.rows_written', count)
+        metrics.gauge('tick_writer.write_rows_per_sec', round(self._write_rows_per_sec))
@@ -0,0 +1,237 @@
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import BrokerageAccount, Stock, Position, Order, Trade, Transaction
+from .lots import LOT_METHODS, close_lots, open_lot
+
+# Largest batch accepted by accounts/trade_batch/
+MAX_BATCH_ORDERS = 100
+
+
+class TradeError(Exception):
+    """Raised when an order can't be executed. `index` points at the bad order in a batch."""
+
+    def __init__(self, message, index=None):
+        super().__init__(message)
+        self.message = message
+        self.index = index
+
+
+# Balance and share counts are only ever changed with single conditional
+# UPDATE statements (e.g. Balance = Balance - x WHERE Balance >= x), so
+# concurrent requests for one account can't lose updates and no account row
+# locks are needed. Share changes don't touch the Stock row or the account's
+# materialized valuation; the next price write values them
+# (customer/valuations.py).
+
+def debit_cash(account, amount):
+    """Take `amount` from the account's balance. Returns False if the balance is too low."""
+    return BrokerageAccount.objects.filter(
+        pk=account.pk, cash_balance__gte=amount
+    ).update(cash_balance=F('cash_balance') - amount) == 1
+
+
+def credit_cash(account, amount):
+    """Add `amount` to the account's balance"""
+    BrokerageAccount.objects.filter(pk=account.pk).update(cash_balance=F('cash_balance') + amount)
+
+
+def refresh_cash(account):
+    """Reload just the balance column after a conditional update"""
+    account.cash_balance = BrokerageAccount.objects.values_list(
+        'cash_balance', flat=True
+    ).get(pk=account.pk)
+    return account.cash_balance
+
+
+def add_shares(account, stock_id, qty):
+    """Add shares to a position, creating it on first buy"""
+    positions = Position.objects.filter(account=account, stock_id=stock_id)
+    if not positions.update(quantity=F('quantity') + qty):
+        try:
+            with transaction.atomic():
+                Position.objects.create(account=account, stock_id=stock_id, quantity=qty)
+        except IntegrityError:
+            # A concurrent buy created the position first
+            positions.update(quantity=F('quantity') + qty)
+
+
+def remove_shares(account, stock_id, qty):
+    """
+    Take shares out of a position. Returns False if the account doesn't hold
+    enough. A position sold down to zero is kept for its realized P&L.
+    """
+    return Position.objects.filter(
+        account=account, stock_id=stock_id, quantity__gte=qty
+    ).update(quantity=F('quantity') - qty) == 1
+
+
+def parse_batch_orders(raw_orders):
+    """Validate the request body of a batch trade and normalize each order"""
+    if not isinstance(raw_orders, list) or not raw_orders:
+        raise TradeError("orders must be a non-empty list")
+    if len(raw_orders) > MAX_BATCH_ORDERS:
+        raise TradeError(f"A batch can contain at most {MAX_BATCH_ORDERS} orders")
+
+    orders = []
+    for index, raw in enumerate(raw_orders):
+        if not isinstance(raw, dict):
+            raise TradeError("Invalid order", index)
+
+        trade_type = str(raw.get('type', '')).upper()
+        if trade_type not in ('BUY', 'SELL'):
+            raise TradeError("Invalid trade type", index)
+
+        try:
+            quantity = int(raw.get('quantity'))
+        except (TypeError, ValueError):
+            raise TradeError("Invalid stock or quantity", index)
+        if quantity <= 0:
+            raise TradeError("Quantity must be positive", index)
+
+        lot_method = str(raw.get('lot_method') or 'FIFO').upper()
+        if lot_method not in LOT_METHODS:
+            raise TradeError("Invalid lot method", index)
+
+        orders.append({
+            'ticker': str(raw.get('ticker', '')).upper(),
+            'type': trade_type,
+            'quantity': quantity,
+            'lot_method': lot_method,
+        })
+    return orders
+
+
+def _assign_order_ids(orders, account, executed_at):
+    # MySQL can't return primary keys from a multi-row INSERT, so read them
+    # back in insertion order (the batch shares one executed_at timestamp).
+    if connection.features.can_return_rows_from_bulk_insert:
+        return
+    ids = list(
+        Order.objects.filter(account=account, executed_at=executed_at)
+        .order_by('OrderID')
+        .values_list('OrderID', flat=True)
+    )
+    for order, order_id in zip(orders, ids):
+        order.pk = order_id
+
+
+def execute_order_batch(account, orders):
+    """
+    Execute a list of parsed orders for one account as a single unit.
+
+    Every order fills at the stock's current price. Cash and share counts are
+    checked for the whole batch up front, so either every order fills or none
+    do. Stocks are loaded in one query, balances and positions move by the
+    batch's net amounts, and orders, trades and transactions are written with
+    bulk INSERTs, all inside one transaction.
+    """
+    tickers = {o['ticker'] for o in orders}
+    stocks = Stock.objects.in_bulk(tickers, field_name='ticker')
+
+    for index, o in enumerate(orders):
+        if o['ticker'] not in stocks:
+            raise TradeError("Invalid stock or quantity", index)
+
+    positions = {
+        p.stock_id: p
+        for p in Position.objects.filter(account=account, stock__in=stocks.values())
+    }
+    holdings = {stock_id: p.quantity for stock_id, p in positions.items()}
+    cash = account.cash_balance
+
+    # Walk the batch in order so a sell can use shares bought earlier in it
+    fills = []
+    for index, o in enumerate(orders):
+        stock = stocks[o['ticker']]
+        qty = o['quantity']
+        price = stock.current_price
+        total = price * qty
+
+        if o['type'] == 'BUY':
+            if cash < total:
+                raise TradeError("Insufficient funds", index)
+            cash -= total
+            holdings[stock.pk] = holdings.get(stock.pk, 0) + qty
+        else:
+            owned = holdings.get(stock.pk, 0)
+            if owned == 0:
+                raise TradeError(f"You don't own {stock.ticker}", index)
+            if owned < qty:
+                raise TradeError("Not enough shares", index)
+            cash += total
+            holdings[stock.pk] = owned - qty
+
+        fills.append((o['type'], stock, qty, price, total, o.get('lot_method', 'FIFO')))
+
+    now = timezone.now()
+
+    with transaction.atomic():
+        # Apply the batch's net effect with conditional updates; if another
+        # request spent the cash or sold the shares in the meantime, the
+        # whole batch rolls back.
+        cash_delta = cash - account.cash_balance
+        if cash_delta < 0:
+            if not debit_cash(account, -cash_delta):
+                raise TradeError("Insufficient funds")
+        elif cash_delta > 0:
+            credit_cash(account, cash_delta)
+
+        # In StockID order, so two batches lock their positions in the same order
+        for stock_id, qty in sorted(holdings.items()):
+            position = positions.get(stock_id)
+            qty_delta = qty - (position.quantity if position else 0)
+            if qty_delta > 0:
+                add_shares(account, stock_id, qty_delta)
+            elif qty_delta < 0 and not remove_shares(account, stock_id, -qty_delta):
+                raise TradeError("Not enough shares")
+
+        new_orders = [
+            Order(
+                account=account,
+                stock=stock,
+                action=trade_type,
+                quantity=qty,
+                status='Filled',
+                lot_method=lot_method,
+                executed_at=now
+            )
+            for trade_type, stock, qty, price, total, lot_method in fills
+        ]
+        Order.objects.bulk_create(new_orders)
+        _assign_order_ids(new_orders, account, now)
+
+        Trade.objects.bulk_create([
+            Trade(order=order, account=account, executed_price=price, executed_qty=qty)
+            for order, (trade_type, stock, qty, price, total, lot_method) in zip(new_orders, fills)
+        ])
+
+        # Lots move per fill in batch order, so a sell can close a lot
+        # opened earlier in the same batch
+        for order, (trade_type, stock, qty, price, total, lot_method) in zip(new_orders, fills):
+            if trade_type == 'BUY':
+                open_lot(account.pk, stock.pk, qty, price, order_id=order.pk, opened_at=now)
+            else:
+                close_lots(account.pk, stock.pk, qty, price, lot_method)
+
+        # Same transaction types the single-order handlers record
+        Transaction.objects.bulk_create([
+            Transaction(
+                account=account,
+                transaction_type='STOCK_TRADE' if trade_type == 'BUY' else 'SELL',
+                amount=total
+            )
+            for trade_type, stock, qty, price, total, lot_method in fills
+        ])
+
+    refresh_cash(account)
+    return [
+        {
+            'order_id': order.pk,
+            'ticker': stock.ticker,
+            'type': trade_type,
+            'quantity': qty,
+            'price': str(price),
+        }
+        for order, (trade_type, stock, qty, price, total, lot_method) in zip(new_orders, fills)
+    ]
@@ -1,41 +1,58 @@
-from django.utils import timezone
-from datetime import time
+import time as clock
+from django.conf import settings
+from django.core.cache import cache
+from .market_calendar import calendar_version, get_calendar
 from .models import MarketSchedule
 
+# The schedule is read on every trade and market-status hit. It's cached
+# under the calendar version (customer/market_calendar.py), which saves and
+# deletes advance (customer/signals.py): each process keeps its copy while
+# the version it re-reads every MARKET_SCHEDULE_LOCAL_TTL seconds is
+# unchanged, and otherwise takes the copy stored under the new version.
+# Neither copy is kept longer than MARKET_SCHEDULE_CACHE_TTL, a safety net
+# for changes made without model signals.
+SCHEDULE_CACHE_KEY = 'market_schedule'
+_local_schedule = None  # (schedule or None, version, expires at)
+
+
+def get_schedule():
+    """The MarketSchedule (or None), without a DB query while cached"""
+    global _local_schedule
+    version = calendar_version()
+    local = _local_schedule
+    if local is not None and local[1] == version and clock.monotonic() < local[2]:
+        return local[0]
+
+    # Wrapped in a tuple so "no schedule" can be cached too
+    key = f'{SCHEDULE_CACHE_KEY}:{version}'
+    cached = cache.get(key)
+    if cached is None:
+        cached = (MarketSchedule.objects.first(),)
+        cache.set(key, cached, settings.MARKET_SCHEDULE_CACHE_TTL)
+    _local_schedule = (cached[0], version, clock.monotonic() + settings.MARKET_SCHEDULE_CACHE_TTL)
+    return cached[0]
+
+
 def is_market_open():
     """Check if market is open right now"""
-    now = timezone.now()
-    current_time = now.time()
-    current_weekday = now.weekday()  # 0=Monday, 6=Sunday
-    
     try:
-        # Get the market schedule from database
-        schedule = MarketSchedule.objects.first()
+        schedule = get_schedule()
         
         if not schedule:
             return False, "Market schedule not configured"
         
-        # REMOVED HARDCODED WEEKEND CHECK
-        # Weekend trading is now allowed for 24/7 demo operation , add back in the future. 
-        #if current_weekday >= 5:
-        #      return False, "Market is closed on weekends"
-        
-        # for holiday, can be added later
-        #if schedule.Holiday:
-        #    return False, "Market is closed for holiday"
-        
         # Check if admin manually closed the market
         if schedule.Status.upper() == 'CLOSED': 
             return False, "Market is currently closed"
         
-        market_open = time(schedule.OpenHour, schedule.OpenMinute)
-        market_close = time(schedule.CloseHour, schedule.CloseMinute)
-        
-        if current_time < market_open:
-            return False, f"Market opens at {market_open.strftime('%I:%M %p')}"
+        if schedule.Holiday:
+            return False, "Market is closed for holiday"
         
-        if current_time > market_close:
-            return False, f"Market closed at {market_close.strftime('%I:%M %p')}"
+        # Weekends, holidays and early closes come from the precomputed calendar
+        calendar = get_calendar(schedule)
+        now = clock.time()
+        if not calendar.is_open(now):
+            return False, calendar.closed_message(now)
         
         return True, "Market is open"
         
@@ -48,15 +65,24 @@ def get_market_status():
     is_open, message = is_market_open()
     
     try:
-        schedule = MarketSchedule.objects.first()
+        schedule = get_schedule()
         if schedule:
+            calendar = get_calendar(schedule)
+            now = clock.time()
+            holiday = calendar.holiday_on(calendar.today(now))
+            next_open, next_close = calendar.next_open(now), calendar.next_close(now)
             return {
                 'is_open': is_open,
                 'message': message,
                 'open_time': f"{schedule.OpenHour:02d}:{schedule.OpenMinute:02d}",
                 'close_time': f"{schedule.CloseHour:02d}:{schedule.CloseMinute:02d}",
                 'status': schedule.Status,
-                'is_holiday': schedule.Holiday
+                'is_holiday': schedule.Holiday or (holiday is not None and holiday[1] is None),
+                'holiday_name': holiday[0] if holiday else None,
+                'early_close': holiday[1].strftime('%H:%M') if holiday and holiday[1] else None,
+                'timezone': schedule.TimeZone,
+                'next_open': calendar.local(next_open).isoformat() if next_open else None,
+                'next_close': calendar.local(next_close).isoformat() if next_close else None,
             }
         else:
             return {
@@ -75,4 +101,4 @@ def get_market_status():
             'close_time': None,
             'status': 'ERROR',
             'is_holiday': False
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,169 @@
+"""
+Materialized account valuations.
+
+AccountValuation holds the market value of each account's positions at
+current prices, so reading an account's market value or equity is one row
+instead of a sum over its positions. Only the price writers maintain it.
+Trades never lock the Stock row or touch the valuation row, so trades on
+a hot ticker don't wait on each other or on a tick in progress.
+
+Each Position carries valued_qty, the shares the valuation counts. The
+invariant is market_value = sum(valued_qty * current_price). A trade only
+changes quantity, which leaves the position pending. Each price write,
+under its Stock locks, does the following in apply_price_moves():
+
+- moves every holder by valued_qty * the price change, found through
+  Position's StockID index (the reverse index from stock to accounts);
+- catches up the pending positions of the moved stocks it can lock at once:
+  adds (quantity - valued_qty) * the new price and sets valued_qty. A
+  position an in-flight trade holds is skipped, not waited for, and is
+  caught up on a later write.
+
+Readers add the pending shares at the current price (market_value()). No
+valuation is lost however a trade interleaves with a tick. valued_qty
+only changes under the Stock locks every price writer takes, and quantity
+only changes through the trades' conditional UPDATEs.
+
+audit() recomputes every account from Position and Stock and reports, or
+fixes, any account whose cached value drifted, e.g. after prices were
+edited outside the price writers.
+"""
+from decimal import Decimal
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from .models import AccountValuation, BrokerageAccount, Position
+
+CENT = Decimal('0.01')
+# Above this many moved stocks it's cheaper to read every position than to send an IN list
+IN_LIST_LIMIT = 1000
+
+
+def _cents(value):
+    return Decimal(int(value)).scaleb(-2)
+
+
+def market_values(account_ids=None, shares='quantity'):
+    """
+    {AccountID: market value} recomputed from positions, for accounts that
+    hold anything. shares='valued_qty' gives what AccountValuation should hold.
+    """
+    positions = Position.objects.all()
+    if account_ids is not None:
+        positions = positions.filter(account_id__in=account_ids)
+    # Quantized: SQLite sums DECIMAL columns as floats
+    return {
+        account_id: Decimal(value).quantize(CENT)
+        for account_id, value in positions.values('account_id')
+        .annotate(value=Sum(F(shares) * F('stock__current_price')))
+        .values_list('account_id', 'value')
+    }
+
+
+def market_value(valuation, positions):
+    """
+    An account's market value: its cached valuation plus the shares traded
+    since the last price write, at current prices. `positions` are all of
+    its Position rows with their stocks.
+    """
+    pending = sum(
+        ((p.quantity - p.valued_qty) * p.stock.current_price for p in positions if p.quantity != p.valued_qty),
+        Decimal('0.00')
+    )
+    return valuation.market_value + pending
+
+
+def apply_price_moves(stock_ids, old_cents, new_cents):
+    """
+    Apply price changes to every holder's valuation and value the shares
+    traded since the last write. Takes parallel arrays of StockID and
+    old/new price in cents. Must run in the transaction that writes the new
+    prices, after the Stock rows are locked. Returns the number of
+    valuations updated.
+    """
+    stock_ids = np.asarray(stock_ids, dtype=np.int64)
+    new_cents = np.asarray(new_cents, dtype=np.int64)
+    delta = new_cents - np.asarray(old_cents, dtype=np.int64)
+    moved = delta != 0
+    stock_ids, delta, new_cents = stock_ids[moved], delta[moved], new_cents[moved]
+    if not len(stock_ids):
+        return 0
+
+    positions = Position.objects.values_list('PositionID', 'account_id', 'stock_id', 'valued_qty', 'quantity')
+    if len(stock_ids) <= IN_LIST_LIMIT:
+        positions = positions.filter(stock_id__in=stock_ids.tolist())
+    holdings = np.array(list(positions), dtype=np.int64).reshape(-1, 5)
+    if not len(holdings):
+        return 0
+
+    # Match each holding to its stock's price change
+    order = np.argsort(stock_ids)
+    sorted_ids, sorted_delta, sorted_new = stock_ids[order], delta[order], new_cents[order]
+    index = np.minimum(np.searchsorted(sorted_ids, holdings[:, 2]), len(sorted_ids) - 1)
+    held = sorted_ids[index] == holdings[:, 2]
+    holdings, index = holdings[held], index[held]
+    # valued_qty is only written under the Stock locks we hold, so this read is exact
+    amounts = holdings[:, 3] * sorted_delta[index]
+
+    # Catch up positions traded since the last write. Lock them to read
+    # their latest quantity; one an in-flight trade holds is left for later.
+    pending = holdings[:, 4] != holdings[:, 3]
+    if pending.any():
+        new_price = dict(zip(holdings[pending, 0].tolist(), sorted_new[index[pending]].tolist()))
+        caught_up = list(
+            Position.objects.select_for_update(skip_locked=True)
+            .filter(pk__in=list(new_price))
+            .order_by('PositionID')
+            .values_list('PositionID', 'quantity', 'valued_qty')
+        )
+        if caught_up:
+            row = {position_id: i for i, position_id in enumerate(holdings[:, 0].tolist())}
+            for position_id, quantity, valued_qty in caught_up:
+                amounts[row[position_id]] += (quantity - valued_qty) * new_price[position_id]
+            table = connection.ops.quote_name(Position._meta.db_table)
+            valued = connection.ops.quote_name(Position._meta.get_field('valued_qty').column)
+            pk = connection.ops.quote_name(Position._meta.pk.column)
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"UPDATE {table} SET {valued} = %s WHERE {pk} = %s",
+                    [(quantity, position_id) for position_id, quantity, _ in caught_up]
+                )
+
+    accounts, inverse = np.unique(holdings[:, 1], return_inverse=True)
+    totals = np.zeros(len(accounts), dtype=np.int64)
+    np.add.at(totals, inverse, amounts)
+
+    changed = totals != 0
+    rows = [(_cents(total), account_id) for total, account_id in zip(totals[changed].tolist(), accounts[changed].tolist())]
+    if rows:
+        table = connection.ops.quote_name(AccountValuation._meta.db_table)
+        value = connection.ops.quote_name(AccountValuation._meta.get_field('market_value').column)
+        account = connection.ops.quote_name(AccountValuation._meta.get_field('account').column)
+        with connection.cursor() as cursor:
+            cursor.executemany(f"UPDATE {table} SET {value} = {value} + %s WHERE {account} = %s", rows)
+    return len(rows)
+
+
+def audit(fix=False):
+    """
+    Compare every cached valuation with a full recompute of its valued
+    shares. Returns [(AccountID, cached or None, actual)] for the accounts
+    that differ; `fix` rewrites them.
+    """
+    actual = market_values(shares='valued_qty')
+    cached = dict(AccountValuation.objects.values_list('account_id', 'market_value'))
+    mismatches = []
+    for account_id in BrokerageAccount.objects.order_by('pk').values_list('pk', flat=True):
+        value = actual.get(account_id) or Decimal('0.00')
+        if cached.get(account_id) != value:
+            mismatches.append((account_id, cached.get(account_id), value))
+
+    if fix:
+        for account_id, _, _ in mismatches:
+            # Recompute under the row lock, so a concurrent trade or price
+            # write lands on top of the fixed value instead of being lost
+            with transaction.atomic():
+                valuation, _ = AccountValuation.objects.select_for_update().get_or_create(account_id=account_id)
+                valuation.market_value = market_values([account_id], shares='valued_qty').get(account_id) or 0
+                valuation.save(update_fields=['market_value'])
+    return mismatches
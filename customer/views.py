@@ -1,24 +1,55 @@
 import json
-from django.http import JsonResponse
+import math
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import logout
 from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
 from django.contrib import messages
 from django.db import transaction
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.views.decorators.http import require_http_methods
-from rest_framework import viewsets, permissions, status
+from rest_framework import viewsets, permissions
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from decimal import Decimal, InvalidOperation
 from .utils import is_market_open, get_market_status
+from .market_calendar import get_calendar
+from .activity import recent_activity
+from .performance import performance
+from .leaderboard import get_leaderboard, page as leaderboard_page
+from .trading import (
+    TradeError, parse_batch_orders, execute_order_batch,
+    debit_cash, credit_cash, refresh_cash, add_shares, remove_shares
+)
+from .lots import LOT_METHODS, close_lots, open_lot
+from .valuations import market_value
+from .matching import engine as matching_engine, reservations
+from .order_queue import enqueue_order
+from .idempotency import idempotent
+from .pagination import KeysetPagination
+from .quotes import cached_rendering, etag, etag_matches, quote_version, quotes_changed
+from .quote_stream import ensure_feed, load_quotes, quote_events
+from .simulator import MAX_INTERVAL_SECONDS, MAX_VOLATILITY
+from asgiref.sync import sync_to_async
+from .metrics import metrics
+from .history import DEFAULT_POINTS, MAX_POINTS, price_history, stream_history
 from django.core.management import call_command
 import io
 import sys
 
-from .models import BrokerageAccount, CustomUser, Transaction, Stock, Order, Trade, Position
+from .models import (
+    BrokerageAccount, CustomUser, Transaction, Stock, Order, Trade, Position, SimulatorControl,
+    MarketSchedule, MarketHoliday,
+)
 from .serializers import (
-    BrokerageAccountSerializer, TransactionSerializer, StockSerializer, 
+    BrokerageAccountSerializer, StockSerializer,
     OrderSerializer, TradeSerializer
 )
 from .forms import UserRegistrationForm
@@ -33,6 +64,7 @@ class BrokerageAccountViewSet(viewsets.ReadOnlyModelViewSet):
         return BrokerageAccount.objects.filter(user=self.request.user)
     
     @action(detail=False, methods=['post'])
+    @idempotent
     def trade(self, request):
         # Check if market is open FIRST
         market_open, message = is_market_open()
@@ -58,6 +90,20 @@ class BrokerageAccountViewSet(viewsets.ReadOnlyModelViewSet):
         if quantity <= 0:
             return Response({"error": "Quantity must be positive"}, status=400)
         
+        order_type = str(request.data.get('order_type', 'MARKET')).upper()
+        # Which tax lots a sell closes first
+        lot_method = str(request.data.get('lot_method') or 'FIFO').upper()
+        if lot_method not in LOT_METHODS:
+            return Response({"error": "Invalid lot method"}, status=400)
+        
+        if settings.ORDER_INTAKE_MODE == 'queue':
+            return self._enqueue(
+                account, stock, trade_type, quantity, order_type, request.data.get('limit_price'), lot_method
+            )
+        
+        if order_type == 'LIMIT':
+            return self._handle_limit(account, stock, trade_type, quantity, request.data.get('limit_price'), lot_method)
+        
         price = stock.current_price
         total = price * quantity
         
@@ -66,26 +112,19 @@ class BrokerageAccountViewSet(viewsets.ReadOnlyModelViewSet):
                 if trade_type == 'BUY':
                     return self._handle_buy(account, stock, quantity, price, total)
                 elif trade_type == 'SELL':
-                    return self._handle_sell(account, stock, quantity, price, total)
+                    return self._handle_sell(account, stock, quantity, price, total, lot_method)
                 else:
                     return Response({"error": "Invalid trade type"}, status=400)
-        except Exception as e:
+        except Exception:
             return Response({"error": "Trade failed"}, status=500)
     
     def _handle_buy(self, account, stock, qty, price, total):
-        if account.cash_balance < total:
+        # Conditional UPDATE: fails instead of overdrawing if a concurrent
+        # request spent the cash first
+        if not debit_cash(account, total):
             return Response({"error": "Insufficient funds"}, status=400)
         
-        account.cash_balance -= total
-        account.save()
-        
-        position, _ = Position.objects.get_or_create(
-            account=account,
-            stock=stock,
-            defaults={'quantity': 0}
-        )
-        position.quantity += qty
-        position.save()
+        add_shares(account, stock.pk, qty)
         
         order = Order.objects.create(
             account=account,
@@ -98,9 +137,11 @@ class BrokerageAccountViewSet(viewsets.ReadOnlyModelViewSet):
         
         Trade.objects.create(
             order=order,
+            account=account,
             executed_price=price,
             executed_qty=qty
         )
+        open_lot(account.pk, stock.pk, qty, price, order_id=order.pk, opened_at=order.executed_at)
         
         Transaction.objects.create(
             account=account,
@@ -110,26 +151,16 @@ class BrokerageAccountViewSet(viewsets.ReadOnlyModelViewSet):
         
         return Response({
             "message": f"Bought {qty} shares of {stock.ticker} at ${price}",
-            "new_cash": str(account.cash_balance)
+            "new_cash": str(refresh_cash(account))
         })
     
-    def _handle_sell(self, account, stock, qty, price, total):
-        try:
-            position = Position.objects.get(account=account, stock=stock)
-        except Position.DoesNotExist:
-            return Response({"error": f"You don't own {stock.ticker}"}, status=400)
-        
-        if position.quantity < qty:
+    def _handle_sell(self, account, stock, qty, price, total, lot_method='FIFO'):
+        if not remove_shares(account, stock.pk, qty):
+            if not Position.objects.filter(account=account, stock=stock, quantity__gt=0).exists():
+                return Response({"error": f"You don't own {stock.ticker}"}, status=400)
             return Response({"error": "Not enough shares"}, status=400)
         
-        account.cash_balance += total
-        account.save()
-        
-        position.quantity -= qty
-        if position.quantity == 0:
-            position.delete()
-        else:
-            position.save()
+        credit_cash(account, total)
         
         order = Order.objects.create(
             account=account,
@@ -137,14 +168,17 @@ class BrokerageAccountViewSet(viewsets.ReadOnlyModelViewSet):
             action='SELL',
             quantity=qty,
             status='Filled',
+            lot_method=lot_method,
             executed_at=timezone.now()
         )
         
         Trade.objects.create(
             order=order,
+            account=account,
             executed_price=price,
             executed_qty=qty
         )
+        close_lots(account.pk, stock.pk, qty, price, lot_method)
         
         Transaction.objects.create(
             account=account,
@@ -154,10 +188,120 @@ class BrokerageAccountViewSet(viewsets.ReadOnlyModelViewSet):
         
         return Response({
             "message": f"Sold {qty} shares of {stock.ticker} at ${price}",
-            "new_cash": str(account.cash_balance)
+            "new_cash": str(refresh_cash(account))
+        })
+
+    def _parse_limit_price(self, limit_price):
+        try:
+            limit_price = Decimal(str(limit_price)).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise TradeError("Invalid limit price")
+        if limit_price <= 0:
+            raise TradeError("Limit price must be positive")
+        return limit_price
+    
+    def _enqueue(self, account, stock, side, qty, order_type, limit_price, lot_method='FIFO'):
+        # Queue mode: validate only; run_order_worker executes the order.
+        # Clients poll /api/v1/orders/ for the final status.
+        if side not in ('BUY', 'SELL'):
+            return Response({"error": "Invalid trade type"}, status=400)
+        if order_type not in ('MARKET', 'LIMIT'):
+            return Response({"error": "Invalid order type"}, status=400)
+        
+        if order_type == 'LIMIT':
+            try:
+                limit_price = self._parse_limit_price(limit_price)
+            except TradeError as e:
+                return Response({"error": e.message}, status=400)
+        else:
+            limit_price = None
+        
+        order = enqueue_order(account, stock, side, qty, order_type, limit_price, lot_method=lot_method)
+        return Response({
+            "message": f"{side.title()} order for {qty} shares of {stock.ticker} queued",
+            "order_id": order.pk,
+            "status": order.status
+        }, status=202)
+    
+    def _handle_limit(self, account, stock, side, qty, limit_price, lot_method='FIFO'):
+        if side not in ('BUY', 'SELL'):
+            return Response({"error": "Invalid trade type"}, status=400)
+        try:
+            limit_price = self._parse_limit_price(limit_price)
+        except TradeError as e:
+            return Response({"error": e.message}, status=400)
+        
+        try:
+            order, fills = matching_engine.place(account, stock, side, qty, limit_price, lot_method=lot_method)
+        except TradeError as e:
+            return Response({"error": e.message}, status=400)
+        except Exception:
+            return Response({"error": "Trade failed"}, status=500)
+        
+        return Response({
+            "message": f"Limit {side.lower()} for {qty} shares of {stock.ticker} at ${limit_price}: {order.filled_qty} filled",
+            "order_id": order.pk,
+            "status": order.status,
+            "filled_qty": order.filled_qty,
+            "new_cash": str(refresh_cash(account))
         })
     
     @action(detail=False, methods=['post'])
+    def cancel_order(self, request):
+        account = self.get_queryset().first()
+        if not account:
+            return Response({"error": "Account not found"}, status=400)
+        
+        try:
+            order = matching_engine.cancel(account, int(request.data.get('order_id')))
+        except (TypeError, ValueError):
+            return Response({"error": "Invalid order id"}, status=400)
+        except TradeError as e:
+            return Response({"error": e.message}, status=400)
+        
+        return Response({
+            "message": f"Order {order.pk} cancelled",
+            "new_cash": str(refresh_cash(account))
+        })
+
+    @action(detail=False, methods=['post'])
+    @idempotent
+    def trade_batch(self, request):
+        # Executes up to MAX_BATCH_ORDERS market orders all-or-nothing:
+        #   {"orders": [{"ticker": "AAPL", "type": "BUY", "quantity": 10}, ...]}
+        # One market check, one stock lookup and a handful of bulk writes per
+        # batch instead of per order. Throughput target: a 50-order batch should
+        # execute at least 10x the orders/sec of 50 separate `trade` calls
+        # (measure with `python manage.py benchmark_trades`).
+        market_open, message = is_market_open()
+        if not market_open:
+            return Response({
+                "error": f"Trading not allowed: {message}"
+            }, status=400)
+
+        account = self.get_queryset().first()
+        if not account:
+            return Response({"error": "Account not found"}, status=400)
+
+        try:
+            orders = parse_batch_orders(request.data.get('orders'))
+            fills = execute_order_batch(account, orders)
+        except TradeError as e:
+            error = {"error": e.message}
+            if e.index is not None:
+                error["index"] = e.index
+            return Response(error, status=400)
+        except Exception:
+            return Response({"error": "Trade failed"}, status=500)
+
+        return Response({
+            "message": f"Executed {len(fills)} orders",
+            "orders": fills,
+            "new_cash": str(account.cash_balance)
+        })
+
+    @action(detail=False, methods=['post'])
+    @idempotent
     def deposit(self, request):
         account = self.get_queryset().first()
         if not account:
@@ -174,8 +318,7 @@ class BrokerageAccountViewSet(viewsets.ReadOnlyModelViewSet):
         
         try:
             with transaction.atomic():
-                account.cash_balance += amount
-                account.save()
+                credit_cash(account, amount)
                 
                 Transaction.objects.create(
                     account=account,
@@ -183,7 +326,7 @@ class BrokerageAccountViewSet(viewsets.ReadOnlyModelViewSet):
                     amount=amount
                 )
                 
-                new_balance = account.cash_balance.quantize(Decimal('0.01'))
+                new_balance = refresh_cash(account).quantize(Decimal('0.01'))
                 
                 return Response({
                     "message": f"Deposited ${amount:.2f}",
@@ -193,6 +336,7 @@ class BrokerageAccountViewSet(viewsets.ReadOnlyModelViewSet):
             return Response({"error": f"Deposit failed: {str(e)}"}, status=500)
     
     @action(detail=False, methods=['post'])
+    @idempotent
     def withdraw(self, request):
         account = self.get_queryset().first()
         if not account:
@@ -207,13 +351,10 @@ class BrokerageAccountViewSet(viewsets.ReadOnlyModelViewSet):
         except (InvalidOperation, TypeError, ValueError):
             return Response({'error': 'Invalid amount'}, status=400)
         
-        if account.cash_balance < amount:
-            return Response({"error": "Insufficient funds"}, status=400)
-        
         try:
             with transaction.atomic():
-                account.cash_balance -= amount
-                account.save()
+                if not debit_cash(account, amount):
+                    return Response({"error": "Insufficient funds"}, status=400)
                 
                 Transaction.objects.create(
                     account=account,
@@ -221,7 +362,7 @@ class BrokerageAccountViewSet(viewsets.ReadOnlyModelViewSet):
                     amount=amount
                 )
                 
-                new_balance = account.cash_balance.quantize(Decimal('0.01'))
+                new_balance = refresh_cash(account).quantize(Decimal('0.01'))
                 
                 return Response({
                     "message": f"Withdrew ${amount:.2f}",
@@ -230,26 +371,120 @@ class BrokerageAccountViewSet(viewsets.ReadOnlyModelViewSet):
         except Exception as e:
             return Response({"error": f"Withdrawal failed: {str(e)}"}, status=500)
 
+    @action(detail=False, methods=['get'])
+    def performance(self, request):
+        """Daily equity curve and returns for ?from=&to= (YYYY-MM-DD), from the last snapshot_equity run"""
+        account = self.get_queryset().first()
+        if not account:
+            return Response({"error": "Account not found"}, status=404)
+
+        try:
+            start = _parse_day(request.query_params.get('from'))
+            end = _parse_day(request.query_params.get('to'))
+        except ValueError:
+            return Response({"error": "from/to must be YYYY-MM-DD"}, status=400)
+
+        return Response({'account_id': account.pk, **performance(account, start, end)})
+
+
 class StockViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Stock.objects.all()
     serializer_class = StockSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def list(self, request, *args, **kwargs):
+        # JSON polls are answered from the quote version: 304 while it's
+        # unchanged, otherwise the list rendered once for this version
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        version = quote_version()
+        tag = etag(version)
+        if etag_matches(request.headers.get('If-None-Match'), tag):
+            response = HttpResponseNotModified()
+        else:
+            content = cached_rendering(
+                'stock_list_json', version,
+                lambda: request.accepted_renderer.render(self.get_serializer(self.get_queryset(), many=True).data)
+            )
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = tag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    @action(detail=False, methods=['get'], url_path=r'(?P<ticker>[A-Za-z0-9.\-]+)/history')
+    def history(self, request, ticker=None):
+        """Downsampled prices for ?from=&to= (ISO 8601 or epoch seconds; default the last day), at most ?points="""
+        stock = Stock.objects.filter(ticker=ticker.upper()).first()
+        if not stock:
+            return Response({"error": "Stock not found"}, status=404)
+
+        try:
+            end = _parse_history_time(request.query_params.get('to')) or timezone.now()
+            start = _parse_history_time(request.query_params.get('from')) or end - timedelta(days=1)
+            points = int(request.query_params.get('points', DEFAULT_POINTS))
+        except ValueError:
+            return Response({"error": "from/to must be ISO 8601 or epoch seconds and points an integer"}, status=400)
+        if start >= end:
+            return Response({"error": "from must be before to"}, status=400)
+        if not 3 <= points <= MAX_POINTS:
+            return Response({"error": f"points must be between 3 and {MAX_POINTS}"}, status=400)
+
+        source, series = price_history(stock, start, end, points)
+        return StreamingHttpResponse(
+            stream_history(stock.ticker, start, end, source, series), content_type='application/json'
+        )
+
+
+def _parse_history_time(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        pass
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed, dt_timezone.utc)
+
+
+def _parse_day(value):
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
 
 class OrderViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # Newest first, ?cursor= for the next page (order_account_created_idx)
+    pagination_class = KeysetPagination
+    keyset_fields = ('created_at', 'OrderID')
     
     def get_queryset(self):
-        return Order.objects.filter(account__user=self.request.user).order_by('-created_at')
+        return (
+            Order.objects.filter(account__user=self.request.user)
+            .select_related('stock')
+            .order_by('-created_at', '-OrderID')
+        )
 
 
 class TradeViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = TradeSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # Newest first, ?cursor= for the next page (trade_account_time_idx)
+    pagination_class = KeysetPagination
+    keyset_fields = ('executed_time', 'TradeID')
     
     def get_queryset(self):
-        return Trade.objects.filter(order__account__user=self.request.user).order_by('-executed_time')
+        return (
+            Trade.objects.filter(account__user=self.request.user)
+            .select_related('order__stock')
+            .order_by('-executed_time', '-TradeID')
+        )
 
 
 # Admin helper
@@ -282,6 +517,7 @@ def admin_create_stock_api(request):
             day_high=price,
             day_low=price
         )
+        quotes_changed()
         
         return Response({
             "success": True,
@@ -365,7 +601,7 @@ def register_user(request):
 # Customer views
 @login_required
 def portfolio_view(request):
-    user_account = BrokerageAccount.objects.filter(user=request.user).first()
+    user_account = BrokerageAccount.objects.filter(user=request.user).select_related('valuation').first()
     
     if not user_account:
         return render(request, 'customer/portfolio.html', {
@@ -373,74 +609,65 @@ def portfolio_view(request):
             'positions': [],
             'total_market_value': Decimal('0.00'),
             'total_equity': Decimal('0.00'),
+            'total_unrealized_pnl': Decimal('0.00'),
+            'total_realized_pnl': Decimal('0.00'),
             'recent_orders': [],
         })
     
-    # Calculate portfolio value
-    positions = Position.objects.filter(account=user_account).select_related('stock')
-    total_market_value = Decimal('0.00')
+    # Per-position values for the table; the totals come from the materialized valuation.
+    # P&L comes from the running totals on each position, not from the tax lots.
+    # Shares reserved by resting limit sells are out of Position.quantity but
+    # still owned, and their lots are still in cost_basis, so they're valued
+    # with the position.
+    positions = list(Position.objects.filter(account=user_account).select_related('stock'))
+    reserved_cash, reserved_shares = reservations(user_account.pk)
     positions_with_value = []
+    total_realized_pnl = Decimal('0.00')
     
     for p in positions:
-        p.market_value = Decimal(p.quantity) * p.stock.current_price
-        total_market_value += p.market_value
+        total_realized_pnl += p.realized_pnl
+        p.reserved = reserved_shares.get(p.stock_id, 0)
+        p.held = p.quantity + p.reserved
+        # Sold-out positions only carry realized P&L
+        if not p.held and not p.cost_basis:
+            continue
+        p.market_value = Decimal(p.held) * p.stock.current_price
+        p.unrealized_pnl = p.market_value - p.cost_basis
         positions_with_value.append(p)
     
-    total_equity = user_account.cash_balance + total_market_value
-    
-    # Get recent activity - NOW WITH REAL TIMESTAMPS!
-    activity = []
-    
-    # Get trades
-    orders = Order.objects.filter(
-        account=user_account
-    ).select_related('stock').order_by('-created_at')[:20]
-    
-    for order in orders:
-        trade = Trade.objects.filter(order=order).first()
-        activity.append({
-            'date': order.created_at,
-            'type': order.action,
-            'stock': order.stock.ticker,
-            'quantity': order.quantity,
-            'price': trade.executed_price if trade else Decimal('0.00'),
-        })
-    
-    # Get cash transactions - NOW HAVE REAL TIMESTAMPS!
-    transactions = Transaction.objects.filter(
-        account=user_account,
-        transaction_type__in=['DEPOSIT', 'WITHDRAW']
-    ).order_by('-created_at')[:20]
-    
-    for txn in transactions:
-        activity.append({
-            'date': txn.created_at,  # Real timestamp!
-            'type': txn.transaction_type,
-            'stock': '-',
-            'quantity': '-',
-            'price': txn.amount,
-        })
-    
-    # Sort by actual date (most recent first)
-    activity.sort(key=lambda x: x['date'], reverse=True)
+    reserved_value = sum(
+        (p.reserved * p.stock.current_price for p in positions_with_value), Decimal('0.00')
+    )
+    valuation = getattr(user_account, 'valuation', None)
+    if valuation is not None:
+        total_market_value = market_value(valuation, positions) + reserved_value
+    else:
+        total_market_value = sum((p.market_value for p in positions_with_value), Decimal('0.00'))
+    total_equity = user_account.cash_balance + reserved_cash + total_market_value
     
     return render(request, 'customer/portfolio.html', {
         'account': user_account,
         'positions': positions_with_value,
         'total_market_value': total_market_value,
         'total_equity': total_equity,
-        'recent_orders': activity[:15],
+        'total_unrealized_pnl': sum((p.unrealized_pnl for p in positions_with_value), Decimal('0.00')),
+        'total_realized_pnl': total_realized_pnl,
+        'recent_orders': recent_activity(user_account),
     })
 
 
 @login_required
 def buy_stock_view(request):
     user_account = BrokerageAccount.objects.filter(user=request.user).first()
-    stocks = Stock.objects.all().order_by('ticker')
+    # The dropdown is rendered once per quote version
+    stock_options = cached_rendering(
+        'stock_options_html', quote_version(),
+        lambda: render_to_string('customer/_stock_options.html', {'stocks': Stock.objects.order_by('ticker')})
+    )
     market_status = get_market_status()
     
     return render(request, 'customer/buy_stock.html', {
-        'stocks': stocks,
+        'stock_options': stock_options,
         'account': user_account,
         'market_status': market_status
     })
@@ -449,7 +676,9 @@ def buy_stock_view(request):
 @login_required
 def sell_stock_view(request):
     user_account = BrokerageAccount.objects.filter(user=request.user).first()
-    positions = Position.objects.filter(account=user_account).select_related('stock') if user_account else []
+    positions = (
+        Position.objects.filter(account=user_account, quantity__gt=0).select_related('stock') if user_account else []
+    )
     market_status = get_market_status()
     
     return render(request, 'customer/sell_stock.html', {
@@ -550,6 +779,159 @@ def admin_update_market_hours(request):
         return Response({"error": f"Failed to update: {str(e)}"}, status=500)
 
 
+def _calendar_json(schedule, sessions=10):
+    calendar = get_calendar(schedule)
+    now = time.time()
+    today = calendar.today(now)
+    return {
+        'timezone': schedule.TimeZone,
+        'trading_days': [int(day) for day in schedule.TradingDays],
+        'open_time': f"{schedule.OpenHour:02d}:{schedule.OpenMinute:02d}",
+        'close_time': f"{schedule.CloseHour:02d}:{schedule.CloseMinute:02d}",
+        'holidays': [_holiday_json(holiday) for holiday in MarketHoliday.objects.filter(date__gte=today)],
+        'sessions': [
+            {'open': calendar.local(opens).isoformat(), 'close': calendar.local(closes).isoformat()}
+            for opens, closes in calendar.sessions(now, sessions)
+        ],
+    }
+
+
+def _holiday_json(holiday):
+    return {
+        'date': holiday.date.isoformat(),
+        'name': holiday.name,
+        'early_close': f"{holiday.close_hour:02d}:{holiday.close_minute or 0:02d}" if holiday.early_close else None,
+    }
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([permissions.IsAdminUser])
+def admin_market_calendar(request):
+    """Upcoming sessions and holidays; POST {timezone, trading_days} to change the weekly rules"""
+    schedule = MarketSchedule.objects.first()
+    if schedule is None:
+        return Response({"error": "Market schedule not configured; set market hours first"}, status=400)
+
+    if request.method == 'POST':
+        tz_name = request.data.get('timezone', schedule.TimeZone)
+        try:
+            ZoneInfo(tz_name)
+        except (ZoneInfoNotFoundError, ValueError, TypeError):
+            return Response({"error": f"Unknown time zone: {tz_name}"}, status=400)
+        try:
+            trading_days = sorted({int(day) for day in request.data.get('trading_days', schedule.TradingDays)})
+        except (ValueError, TypeError):
+            return Response({"error": "trading_days must be a list of weekdays, 0=Monday"}, status=400)
+        if not all(0 <= day <= 6 for day in trading_days):
+            return Response({"error": "trading_days must be between 0 (Monday) and 6 (Sunday)"}, status=400)
+        schedule.TimeZone = tz_name
+        schedule.TradingDays = ''.join(str(day) for day in trading_days)
+        # Saving invalidates the schedule, and the calendar rebuilds for the new rules
+        schedule.save(update_fields=['TimeZone', 'TradingDays'])
+
+    try:
+        sessions = min(max(int(request.query_params.get('sessions', 10)), 1), settings.MARKET_CALENDAR_DAYS)
+    except ValueError:
+        return Response({"error": "sessions must be an integer"}, status=400)
+    return Response(_calendar_json(schedule, sessions))
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAdminUser])
+def admin_market_holidays(request):
+    """Add or replace a holiday: {date, name, close_hour, close_minute}; omit close_hour for a full closure"""
+    try:
+        # parse_date raises ValueError for well-formed impossible dates like 2024-02-30
+        day = parse_date(str(request.data.get('date', '')))
+    except ValueError:
+        day = None
+    if day is None:
+        return Response({"error": "date must be YYYY-MM-DD"}, status=400)
+    name = str(request.data.get('name') or 'Holiday')[:100]
+    close_hour, close_minute = request.data.get('close_hour'), request.data.get('close_minute')
+    try:
+        close_hour = None if close_hour in (None, '') else int(close_hour)
+        close_minute = None if close_hour is None else int(close_minute or 0)
+    except (ValueError, TypeError):
+        return Response({"error": "Invalid input format"}, status=400)
+    if close_hour is not None and not (0 <= close_hour <= 23 and 0 <= close_minute <= 59):
+        return Response({"error": "Early close must be a valid time"}, status=400)
+
+    # Saving recomputes just this day of the calendar (customer/signals.py)
+    holiday, created = MarketHoliday.objects.update_or_create(
+        date=day, defaults={'name': name, 'close_hour': close_hour, 'close_minute': close_minute}
+    )
+    return Response(_holiday_json(holiday), status=201 if created else 200)
+
+
+@api_view(['DELETE'])
+@permission_classes([permissions.IsAdminUser])
+def admin_market_holiday(request, day):
+    try:
+        day = parse_date(day)
+    except ValueError:
+        day = None
+    holiday = MarketHoliday.objects.filter(date=day).first() if day else None
+    if holiday is None:
+        return Response({"error": "Holiday not found"}, status=404)
+    holiday.delete()
+    return Response(status=204)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def admin_metrics_api(request):
+    snapshot = metrics.snapshot()
+    hits = snapshot['counters'].get('idempotency.hits', 0)
+    misses = snapshot['counters'].get('idempotency.misses', 0)
+    snapshot['idempotency_hit_rate'] = round(hits / (hits + misses), 4) if hits + misses else None
+    return Response(snapshot)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def admin_leaderboard(request):
+    """Accounts ranked by equity, ?page=&page_size=, with the platform's assets under management"""
+    try:
+        number = max(int(request.query_params.get('page', 1)), 1)
+        page_size = min(max(int(request.query_params.get('page_size', 50)), 1), 500)
+    except ValueError:
+        return Response({"error": "page and page_size must be integers"}, status=400)
+    return Response(leaderboard_page(get_leaderboard(), number, page_size))
+
+
+@require_http_methods(["GET"])
+async def quote_stream(request):
+    """
+    Server-Sent Events for ?tickers=AAPL,MSFT: a snapshot, then the quotes
+    that changed as prices are written. Only served through investr.asgi:
+    WSGI drains an async stream into a list before sending anything, so an
+    endless one would never reach the client and would hold its worker
+    forever. Under WSGI the route answers 501.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"error": "The quote stream is only served over ASGI"}, status=501)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({"error": "Authentication required"}, status=401)
+
+    tickers = sorted({t.strip().upper() for t in request.GET.get('tickers', '').split(',') if t.strip()})
+    if not tickers:
+        return JsonResponse({"error": "tickers is required"}, status=400)
+    if len(tickers) > settings.QUOTE_STREAM_MAX_TICKERS:
+        return JsonResponse({"error": f"At most {settings.QUOTE_STREAM_MAX_TICKERS} tickers per stream"}, status=400)
+    initial = await sync_to_async(load_quotes)(tickers=tickers)
+    if not initial:
+        return JsonResponse({"error": "Stock not found"}, status=404)
+
+    ensure_feed()
+    response = StreamingHttpResponse(quote_events(initial), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_market_status_api(request):
@@ -586,4 +968,60 @@ def admin_generate_prices(request):
         sys.stdout = old_stdout
         return JsonResponse({
             'error': f'Failed to generate prices: {str(e)}'
-        }, status=500)
\ No newline at end of file
+        }, status=500)
+
+@login_required
+@require_http_methods(["GET", "POST"])
+def admin_simulator(request):
+    """Status of the run_market_simulator daemon; POST {action: start|stop} to control it"""
+    if request.user.Role != 'ADMIN':
+        return JsonResponse({
+            'error': 'Unauthorized. Admin access required.'
+        }, status=403)
+
+    control = SimulatorControl.get()
+
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body or '{}')
+            action_name = data.get('action')
+            if action_name not in ('start', 'stop'):
+                return JsonResponse({'error': "action must be 'start' or 'stop'"}, status=400)
+            control.desired_state = 'RUNNING' if action_name == 'start' else 'STOPPED'
+            if data.get('interval') is not None:
+                interval = float(data['interval'])
+                # NaN and inf compare False both ways, so check for them first
+                if not (math.isfinite(interval) and 0 < interval <= MAX_INTERVAL_SECONDS):
+                    return JsonResponse(
+                        {'error': f'interval must be between 0 and {MAX_INTERVAL_SECONDS} seconds'}, status=400
+                    )
+                control.interval_seconds = interval
+            if data.get('volatility') is not None:
+                volatility = float(data['volatility'])
+                if not (math.isfinite(volatility) and 0 < volatility <= MAX_VOLATILITY):
+                    return JsonResponse({'error': f'volatility must be between 0 and {MAX_VOLATILITY}'}, status=400)
+                control.volatility = volatility
+        except (ValueError, TypeError):
+            return JsonResponse({'error': 'Invalid input format'}, status=400)
+        control.save(update_fields=['desired_state', 'interval_seconds', 'volatility'])
+
+    # The daemon heartbeats every interval; allow a few missed beats before calling it dead
+    alive = (
+        control.heartbeat_at is not None
+        and (timezone.now() - control.heartbeat_at).total_seconds() < max(3 * control.interval_seconds, 15)
+    )
+    return JsonResponse({
+        'desired_state': control.desired_state,
+        'status': control.status if alive else 'OFFLINE',
+        'alive': alive,
+        'interval_seconds': control.interval_seconds,
+        'volatility': control.volatility,
+        'heartbeat_at': control.heartbeat_at,
+        'last_tick_at': control.last_tick_at,
+        'ticks_total': control.ticks_total,
+        'last_tick_lag_ms': round(control.last_tick_lag_ms, 1),
+        'last_write_ms': round(control.last_write_ms, 1),
+        'queue_rows': control.queue_rows,
+        'last_flush_ms': round(control.last_flush_ms, 1),
+        'write_rows_per_sec': round(control.write_rows_per_sec),
+    })
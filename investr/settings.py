@@ -106,6 +106,17 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Take the write lock when a transaction starts and wait for it,
+            # so concurrent requests queue up instead of failing with "locked"
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+            # File-backed test DB: the in-memory one uses shared-cache table
+            # locks that make the multi-threaded trade tests error out
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
         }
     }
 
@@ -190,3 +201,70 @@ AUTH_USER_MODEL = 'customer.CustomUser'
 LOGIN_URL = '/sign_in/'
 
 LOGIN_REDIRECT_URL = '/role_router/'
+
+
+# Order intake: 'sync' executes trades inside the API request, 'queue' stores
+# them as Pending for `python manage.py run_order_worker` to execute
+ORDER_INTAKE_MODE = os.environ.get('ORDER_INTAKE_MODE', 'sync')
+
+# Worker threads run_order_worker starts; pending orders are partitioned
+# across them by ORDER_SHARD_KEY ('stock' or 'account')
+ORDER_EXECUTION_SHARDS = int(os.environ.get('ORDER_EXECUTION_SHARDS', 4))
+ORDER_SHARD_KEY = os.environ.get('ORDER_SHARD_KEY', 'stock')
+
+# How long (seconds) a stored Idempotency-Key response can be replayed
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+# PriceTick retention (prune_ticks): full-resolution ticks for this many days,
+# then one tick per stock per TICK_DOWNSAMPLE_SECONDS (which must divide a
+# day, 86400) in monthly archive tables, dropped after TICK_ARCHIVE_MONTHS
+TICK_RETENTION_DAYS = int(os.environ.get('TICK_RETENTION_DAYS', 7))
+TICK_DOWNSAMPLE_SECONDS = int(os.environ.get('TICK_DOWNSAMPLE_SECONDS', 60))
+TICK_ARCHIVE_MONTHS = int(os.environ.get('TICK_ARCHIVE_MONTHS', 12))
+
+# Columnar tick store written by export_ticks (customer/tick_store.py)
+TICK_STORE_DIR = os.environ.get('TICK_STORE_DIR', str(BASE_DIR / 'tick_store'))
+
+# Shared cache for the market schedule and idempotency keys. Set REDIS_URL
+# so every process shares entries; without it each process has its own.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a process trusts its copy of the calendar version before reading
+# it again from the database (customer/market_calendar.py), and seconds a
+# cached market schedule is kept (safety net for changes made without model
+# signals, e.g. QuerySet.update or raw SQL)
+MARKET_SCHEDULE_LOCAL_TTL = float(os.environ.get('MARKET_SCHEDULE_LOCAL_TTL', 2))
+MARKET_SCHEDULE_CACHE_TTL = int(os.environ.get('MARKET_SCHEDULE_CACHE_TTL', 60))
+
+# Days of trading sessions precomputed ahead (customer/market_calendar.py),
+# and seconds a cached calendar is kept between recomputes
+MARKET_CALENDAR_DAYS = int(os.environ.get('MARKET_CALENDAR_DAYS', 366))
+MARKET_CALENDAR_CACHE_TTL = int(os.environ.get('MARKET_CALENDAR_CACHE_TTL', 3600))
+
+# Accounts kept in the equity leaderboard (customer/leaderboard.py), and
+# seconds the stored board is served before the aggregate is rerun
+LEADERBOARD_SIZE = int(os.environ.get('LEADERBOARD_SIZE', 1000))
+LEADERBOARD_CACHE_TTL = int(os.environ.get('LEADERBOARD_CACHE_TTL', 30))
+
+# Seconds the shared cache keeps a stock list rendered for one quote
+# version (customer/quotes.py); a new version makes it unreachable anyway
+QUOTE_CACHE_TTL = int(os.environ.get('QUOTE_CACHE_TTL', 300))
+
+# Quote streaming (customer/quote_stream.py): seconds between checks of the
+# quote version for price writes made by other processes, seconds between
+# keepalive comments on idle streams, and tickers one stream may follow
+QUOTE_STREAM_POLL_INTERVAL = float(os.environ.get('QUOTE_STREAM_POLL_INTERVAL', 0.5))
+QUOTE_STREAM_HEARTBEAT = float(os.environ.get('QUOTE_STREAM_HEARTBEAT', 15))
+QUOTE_STREAM_MAX_TICKERS = int(os.environ.get('QUOTE_STREAM_MAX_TICKERS', 100))
@@ -10,7 +10,9 @@ from customer.views import (
     deposit_cash_view, withdraw_cash_view, 
     admin_change_market_hours_view, admin_create_stock_view,
     role_based_redirect, sign_out_user, admin_create_stock_api, admin_update_market_hours, 
-    get_market_status_api,admin_generate_prices,       
+    get_market_status_api,admin_generate_prices, admin_metrics_api, admin_simulator,
+    admin_market_calendar, admin_market_holidays, admin_market_holiday, admin_leaderboard,
+    quote_stream,
 )
 
 router = DefaultRouter()
@@ -49,8 +51,16 @@ urlpatterns = [
     path('api/v1/admin/create_stock/', admin_create_stock_api, name='api_admin_create_stock'),
     path('api/v1/admin/market_hours/', admin_update_market_hours, name='api_admin_market_hours'),
     path('api/v1/admin/generate_prices/',admin_generate_prices, name='api_admin_generate_prices'),
+    path('api/v1/admin/metrics/', admin_metrics_api, name='api_admin_metrics'),
+    path('api/v1/admin/simulator/', admin_simulator, name='api_admin_simulator'),
+    path('api/v1/admin/market_calendar/', admin_market_calendar, name='api_admin_market_calendar'),
+    path('api/v1/admin/market_calendar/holidays/', admin_market_holidays, name='api_admin_market_holidays'),
+    path('api/v1/admin/market_calendar/holidays/<str:day>/', admin_market_holiday, name='api_admin_market_holiday'),
+    path('api/v1/admin/leaderboard/', admin_leaderboard, name='api_admin_leaderboard'),
  
     
     # Market status API (available to all authenticated users)
     path('api/v1/market-status/', get_market_status_api, name='api_market_status'),
+    # Server-Sent Events quote stream (ASGI only: 501 under WSGI)
+    path('api/v1/stream/quotes/', quote_stream, name='api_quote_stream'),
 ]
\ No newline at end of file